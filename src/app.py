@@ -9,4 +9,6 @@ if __name__ == "__main__":
     user_input = input("Enter a message ('exit' to quit): ")
     if user_input.lower() == "exit":
       break
-    print(llabot.generate_response(0, user_input))
\ No newline at end of file
+    for chunk in llabot.stream_response(0, user_input):
+      print(chunk, end="", flush=True)
+    print()
\ No newline at end of file
@@ -0,0 +1 @@
+"""Offline benchmarks for llabot. Run them from src/, e.g. python -m benchmarks.summarizers."""
@@ -0,0 +1,145 @@
+"""
+Compares ChessLLM move generation against the old sample-and-retry loop: generate calls
+and wall time per AI move, over games against a seeded random opponent. With --concurrent,
+it also plays that many games at once on the shared ChessEngine and reports throughput.
+--book plays the positions in an opening book (see llabot.chess.opening_book) from it.
+
+    python -m benchmarks.chess_moves --games 3 --moves 40 --difficulty very_easy --concurrent 200
+"""
+import argparse
+import json
+import random
+import time
+import chess
+import torch
+from llabot.chess.chess import ChessLLM
+from llabot.chess.engine import ChessEngine
+
+def retry_move(engine: ChessLLM, max_retries: int) -> tuple[str, int]:
+    """The unconstrained loop play_llama used to run: sample 5 tokens, keep the move if it is legal."""
+    tokenizer, model = engine.engine.tokenizer, engine.engine.model
+    inputs = tokenizer("1-0 " + " ".join(engine.moves_uci), return_tensors="pt")
+    params = engine.get_difficulty_params()
+    for attempt in range(max_retries):
+        generated = model.generate(
+            input_ids=inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            max_new_tokens=5,
+            do_sample=True,
+            top_k=params["top_k"],
+            temperature=params["temperature"],
+            pad_token_id=engine.engine.stop_token_id,
+        )
+        words = tokenizer.decode(generated[0], skip_special_tokens=True).split()
+        move_index = len(engine.moves_uci) + 1
+        candidate = words[move_index] if len(words) > move_index else ""
+        try:
+            move = chess.Move.from_uci(candidate)
+        except ValueError:
+            continue
+        if engine.board.is_legal(move):
+            engine.game.push(candidate)
+            return candidate, attempt + 1
+    return "0000", max_retries
+
+def run(mode: str, engine: ChessLLM, games: int, moves: int, max_retries: int, seed: int) -> dict:
+    opponent = random.Random(seed)
+    ai_moves = calls = failures = 0
+    elapsed = 0.0
+    for _ in range(games):
+        engine.reset()
+        for _ in range(moves):
+            if engine.board.is_game_over():
+                break
+            start = time.perf_counter()
+            if mode == "constrained":
+                before = engine.generate_calls
+                move = engine.play_llama()
+                used = engine.generate_calls - before
+            else:
+                move, used = retry_move(engine, max_retries)
+            elapsed += time.perf_counter() - start
+            ai_moves += 1
+            calls += used
+            if move == "0000":
+                failures += 1
+                break
+            if engine.board.is_game_over():
+                break
+            engine.submit_player_move(opponent.choice(list(engine.get_valid_moves())))
+    return {
+        "mode": mode,
+        "difficulty": engine.difficulty_level,
+        "ai_moves": ai_moves,
+        "failed_moves": failures,
+        "calls_per_move": round(calls / ai_moves, 3) if ai_moves else 0.0,
+        "ms_per_move": round(1000 * elapsed / ai_moves, 3) if ai_moves else 0.0,
+    }
+
+def run_concurrent(games: int, moves: int, difficulty: str, seed: int) -> dict:
+    """Plays `games` games at once, requesting every AI move of a round together."""
+    engine = ChessEngine()
+    opponent = random.Random(seed)
+    active = [engine.new_game(difficulty) for _ in range(games)]
+    stats_before = engine.stats()
+    ai_moves = 0
+    start = time.perf_counter()
+    for _ in range(moves):
+        active = [game for game in active if not game.board.is_game_over()]
+        if not active:
+            break
+        futures = [engine.request_move(game.game_id) for game in active]
+        for future in futures:
+            future.result()
+        ai_moves += len(futures)
+        for game in active:
+            if not game.board.is_game_over():
+                game.submit_player_move(opponent.choice([move.uci() for move in game.board.legal_moves]))
+    elapsed = time.perf_counter() - start
+    stats = engine.stats()
+    batches = stats["batches"] - stats_before["batches"]
+    for game in active:
+        engine.end_game(game.game_id)
+    return {
+        "mode": f"concurrent x{games}",
+        "difficulty": difficulty,
+        "ai_moves": ai_moves,
+        "moves_per_s": round(ai_moves / elapsed, 1) if elapsed else 0.0,
+        "ms_per_move": round(1000 * elapsed / ai_moves, 3) if ai_moves else 0.0,
+        "mean_batch_size": round((stats["moves"] - stats_before["moves"]) / batches, 1) if batches else 0.0,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark constrained chess move generation against sample-and-retry.")
+    parser.add_argument("--model", default=ChessEngine.model_name, help="Chess model id or local path.")
+    parser.add_argument("--difficulty", default="normal")
+    parser.add_argument("--games", type=int, default=2)
+    parser.add_argument("--moves", type=int, default=30, help="AI moves per game at most.")
+    parser.add_argument("--retries", type=int, default=50, help="Retry limit of the baseline loop.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrent", type=int, default=0, help="Also play this many games at once.")
+    parser.add_argument("--book", help="Opening book (.json) to play book positions from.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    ChessEngine.model_name = args.model
+    if args.book:
+        ChessEngine.book_enabled, ChessEngine.book_path = True, args.book
+    ChessEngine().load()
+    engine = ChessLLM(args.difficulty)
+    results = []
+    for mode in ("retry", "constrained"):
+        torch.manual_seed(args.seed)
+        results.append(run(mode, engine, args.games, args.moves, args.retries, args.seed))
+    if args.concurrent:
+        results.append(run_concurrent(args.concurrent, args.moves, args.difficulty, args.seed))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            if "calls_per_move" in result:
+                print(f"{result['mode']:>16}: {result['calls_per_move']:7.3f} calls/move, {result['ms_per_move']:9.3f} ms/move, "
+                      f"{result['failed_moves']} failed ({result['ai_moves']} moves, {result['difficulty']})")
+            else:
+                print(f"{result['mode']:>16}: {result['moves_per_s']:9.1f} moves/s, {result['ms_per_move']:9.3f} ms/move, "
+                      f"mean batch {result['mean_batch_size']} ({result['ai_moves']} moves, {result['difficulty']})")
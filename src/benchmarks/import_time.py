@@ -0,0 +1,60 @@
+"""
+Guards the start-up time of lightweight entry points: each statement is run in a fresh
+interpreter, which must finish within the budget and without importing torch,
+transformers, datasets or requests. Exits with status 1 when any of them fails.
+
+    python -m benchmarks.import_time --budget 0.5
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = ("torch", "transformers", "datasets", "requests")
+BUDGET = 0.5    # Seconds each statement may take
+
+STATEMENTS = [
+    "import llabot",
+    "from llabot import UserData, SceneData",
+    "from llabot.chat_log import compact_chat_log",
+    "from llabot.llm_chat import LLMChat",
+    "from llabot.message_data import MessageData",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, sorted(name for name in {heavy!r} if name in sys.modules)]))
+"""
+
+def measure(statement: str, repeat: int) -> dict:
+    """Fastest of `repeat` cold imports, and the heavy modules the statement pulled in."""
+    times, heavy = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, check=True).stdout
+        elapsed, heavy = json.loads(output.strip().splitlines()[-1])
+        times.append(elapsed)
+    return {"statement": statement, "seconds": round(min(times), 4), "heavy_modules": heavy}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of llabot's lightweight entry points.")
+    parser.add_argument("--budget", type=float, default=BUDGET, help="Seconds each statement may take.")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per statement, the fastest counts.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    results = [measure(statement, args.repeat) for statement in STATEMENTS]
+    failures = [r for r in results if r["seconds"] > args.budget or r["heavy_modules"]]
+    if args.json:
+        print(json.dumps({"budget": args.budget, "results": results}, indent=2))
+    else:
+        for result in results:
+            status = "FAIL" if result in failures else "ok"
+            heavy = f" imported {', '.join(result['heavy_modules'])}" if result["heavy_modules"] else ""
+            print(f"{status:>4} {result['seconds'] * 1000:8.1f} ms  {result['statement']}{heavy}")
+    if failures:
+        print(f"{len(failures)} of {len(results)} entry points are over the {args.budget}s budget or import heavy dependencies.", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,107 @@
+"""
+Bytes per message held by a chat history: the slotted MessageData against the previous
+dict-based layout, measured with tracemalloc. Message texts are allocated up front, so the
+figures are the per-message overhead on top of the text itself. Each layout is measured
+as created, and after the chat has logged, token-counted and prompted with every message.
+
+    python -m benchmarks.message_memory --messages 10000
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from llabot.message_data import MessageData
+
+class LegacyMessageData:
+    """MessageData as it was before it was made compact: a __dict__, a datetime, a uuid4 string and a metadata dict."""
+    def __init__(self, sender_name=None, sender_role=None, message=None):
+        self.timestamp = datetime.now()
+        self.sender_name = sender_name
+        self.sender_role = sender_role
+        self._message = message
+        self.message_id = str(uuid.uuid4())
+        self.metadata = {}
+        self._token_counts = {}
+
+    @property
+    def message(self):
+        return self._message
+
+    def set_token_count(self, tokenizer_name, count):
+        self._token_counts[tokenizer_name] = count
+
+    def to_dict(self):
+        return {
+            "timestamp": self.timestamp.isoformat(),
+            "sender_name": self.sender_name,
+            "sender_role": self.sender_role,
+            "message": self.message,
+            "message_id": self.message_id,
+            "metadata": self.metadata,
+        }
+
+def legacy_history(messages):
+    return [{"role": m.sender_role, "content": m.message} for m in messages]
+
+def compact_history(messages):
+    return [m.llm_view for m in messages]
+
+LAYOUTS = {
+    "legacy": (LegacyMessageData, legacy_history),
+    "compact": (MessageData, compact_history),
+}
+
+def measure(layout: str, texts: list[str], names: list[str]) -> dict:
+    cls, history = LAYOUTS[layout]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    messages = [cls(names[i % 2], "user" if i % 2 else "assistant", text) for i, text in enumerate(texts)]
+    after_create = tracemalloc.take_snapshot()
+    for message in messages:
+        message.to_dict()
+        message.set_token_count("tokenizer", len(texts))
+    history(messages)
+    after_use = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # Timings are taken with tracemalloc off, it slows allocation down several times over
+    start = time.perf_counter()
+    [cls(names[i % 2], "user" if i % 2 else "assistant", text) for i, text in enumerate(texts)]
+    created = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(10):
+        history(messages)
+    history_seconds = (time.perf_counter() - start) / 10
+    count = len(messages)
+    created_bytes = sum(stat.size_diff for stat in after_create.compare_to(before, "filename"))
+    used_bytes = sum(stat.size_diff for stat in after_use.compare_to(before, "filename"))
+    return {
+        "layout": layout,
+        "messages": count,
+        "bytes_per_message": round(created_bytes / count, 1),
+        "bytes_per_message_in_use": round(used_bytes / count, 1),
+        "us_per_message_created": round(1e6 * created / count, 3),
+        "us_per_history_message": round(1e6 * history_seconds / count, 3),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the memory held per chat message by the legacy and compact layouts.")
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    texts = [f"Message number {i}, long enough to stand in for a chat turn." for i in range(args.messages)]
+    # Names arrive as fresh strings each turn, like the ones read back from a request
+    names = ["".join(["Al", "ice"]), "".join(["Bo", "b"])]
+    results = [measure(layout, texts, names) for layout in LAYOUTS]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(f"{result['layout']:>8}: {result['bytes_per_message']:7.1f} B/message created, "
+                  f"{result['bytes_per_message_in_use']:7.1f} B/message in use, "
+                  f"{result['us_per_message_created']:6.3f} us to create, "
+                  f"{result['us_per_history_message']:6.3f} us per history message ({result['messages']} messages)")
@@ -0,0 +1,251 @@
+"""
+Latency and throughput of the chat pipeline and of chess play, measured offline on tiny
+random models built on the fly (see tiny_models.py): chat_start latency, per-turn
+generate_response latency and tokens/s across history lengths, check_and_summarize cost,
+append_to_chat_log cost as the log grows and play_llama generate calls per move.
+
+Results are JSON. --save writes them; --baseline compares against saved results and exits
+with status 1 when any timing or throughput metric is worse by more than --tolerance.
+
+    python -m benchmarks.pipeline --save baseline.json
+    python -m benchmarks.pipeline --baseline baseline.json --tolerance 0.25
+"""
+import os
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import torch
+import transformers
+from llabot.chess.chess import ChessLLM
+from llabot.llm_bot import LLMBot
+from llabot.llm_chat import LLMChat
+from llabot.llm_model import LLMModel
+from llabot.message_data import MessageData
+from llabot.user_data import UserData
+from .tiny_models import install_tiny_models
+
+FILLER = "hello there. how are you today? I am fine! the weather is nice and the sun is out. "
+
+def bench_user() -> UserData:
+    return UserData("Bench", "2000-01-01", "unspecified", "unspecified", 0, 0, weather_enabled=False)
+
+def ms(seconds: float) -> float:
+    return round(1000 * seconds, 3)
+
+def start_bot(preset: str, summarizer: str, max_new_tokens: int) -> tuple[LLMBot, float]:
+    """Starts a chat on a new bot and returns it with the chat_start latency."""
+    bot = LLMBot("generic", LLMModel.SMALL)
+    start = time.perf_counter()
+    bot.chat_start(preset, bench_user())
+    elapsed = time.perf_counter() - start
+    bot.llm_chat.summarizer_name = summarizer
+    bot.llm_preset.max_length = max_new_tokens
+    return bot, elapsed
+
+def bench_chat_start(args) -> dict:
+    """The first start loads the model; later ones find it in the registry."""
+    cold_bot, cold = start_bot(args.preset, args.summarizer, args.max_new_tokens)
+    warm = []
+    for _ in range(args.repeat):
+        bot, elapsed = start_bot(args.preset, args.summarizer, args.max_new_tokens)
+        warm.append(elapsed)
+        bot.chat_end()
+    cold_bot.chat_end()
+    return {"cold_ms": ms(cold), "warm_ms": ms(statistics.median(warm))}
+
+def bench_generate(args) -> dict:
+    """Per-turn latency and tokens/s after `history` earlier turns."""
+    results = {}
+    for history in args.history:
+        torch.manual_seed(args.seed)
+        bot, _ = start_bot(args.preset, args.summarizer, args.max_new_tokens)
+        for turn in range(history):
+            bot.llm_chat.add_message(MessageData(bot.user_data.name, "user", f"{FILLER}({turn})"))
+            bot.llm_chat.add_message(MessageData(bot.persona_data.name, "assistant", FILLER))
+        latencies, tokens_per_s = [], []
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            bot.generate_response(f"{FILLER}({history + turn})")
+            latencies.append(time.perf_counter() - start)
+            tokens_per_s.append(bot.last_tokens_per_second or 0.0)
+        bot.chat_end()
+        results[f"history_{history}"] = {
+            "ms_per_turn": ms(statistics.median(latencies)),
+            "tokens_per_s": round(statistics.median(tokens_per_s), 2),
+        }
+    return results
+
+def bench_summarize(args) -> dict:
+    """Cost of check_and_summarize over `count` long messages: queueing it, and until the summaries are applied."""
+    results = {}
+    for count in args.summarize:
+        chat = LLMChat()
+        chat.summarizer_name = args.summarizer
+        chat.chat_start()
+        chat.add_message(MessageData("System", "system", "You are a helpful assistant."))
+        for number in range(count + LLMChat.recent_skip):
+            chat.add_message(MessageData("Bench", "user" if number % 2 else "assistant", FILLER * 12))
+        start = time.perf_counter()
+        chat.check_and_summarize()
+        queued = time.perf_counter() - start
+        chat.wait_for_summarization()
+        total = time.perf_counter() - start
+        chat.chat_end()
+        results[f"messages_{count}"] = {"queue_ms": ms(queued), "total_ms": ms(total)}
+    return results
+
+def bench_chat_log(args) -> dict:
+    """Mean append_to_chat_log cost over the appends that grew the log to each size."""
+    results = {}
+    chat = LLMChat()
+    chat.chat_start()
+    message = MessageData("Bench", "user", FILLER).to_dict()
+    appended = 0
+    for size in sorted(args.log_sizes):
+        start = time.perf_counter()
+        for number in range(appended, size):
+            chat.append_to_chat_log(message, number)
+        elapsed = time.perf_counter() - start
+        results[f"messages_{size}"] = {"us_per_append": round(1e6 * elapsed / max(size - appended, 1), 3)}
+        appended = size
+    chat.chat_end()
+    return results
+
+def bench_chess(args) -> dict:
+    """
+    play_llama against a seeded random opponent. The opening book is off, since book moves
+    never call generate and would make calls_per_move look better than the model does.
+    """
+    torch.manual_seed(args.seed)
+    opponent = random.Random(args.seed)
+    game = ChessLLM(args.difficulty)
+    game.engine.load()
+    book_enabled, game.engine.book_enabled = game.engine.book_enabled, False
+    moves = calls = 0
+    elapsed = 0.0
+    try:
+        for _ in range(args.chess_moves):
+            if game.board.is_game_over():
+                break
+            before = game.generate_calls
+            start = time.perf_counter()
+            game.play_llama()
+            elapsed += time.perf_counter() - start
+            calls += game.generate_calls - before
+            moves += 1
+            if game.board.is_game_over():
+                break
+            game.submit_player_move(opponent.choice(list(game.get_valid_moves())))
+    finally:
+        game.engine.book_enabled = book_enabled
+        game.close()
+    return {
+        "moves": moves,
+        "calls_per_move": round(calls / moves, 3) if moves else 0.0,
+        "ms_per_move": ms(elapsed / moves) if moves else 0.0,
+    }
+
+BENCHMARKS = {
+    "chat_start": bench_chat_start,
+    "generate_response": bench_generate,
+    "check_and_summarize": bench_summarize,
+    "append_to_chat_log": bench_chat_log,
+    "chess": bench_chess,
+}
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def direction(metric: str) -> int:
+    """1 if higher is better, -1 if lower is better, 0 for metrics that are not compared."""
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith(("_ms", "_us", "_per_move", "_per_append", "_per_turn")):
+        return -1
+    return 0
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """Every metric present in both runs, with its relative change and whether it regressed."""
+    current, previous = flatten(results), flatten(baseline)
+    rows = []
+    for metric, value in current.items():
+        sign = direction(metric)
+        old = previous.get(metric)
+        if not sign or not isinstance(old, (int, float)) or not old:
+            continue
+        change = (value - old) / abs(old)
+        rows.append({
+            "metric": metric,
+            "baseline": old,
+            "current": value,
+            "change": round(change, 4),
+            "regressed": -sign * change > tolerance,
+        })
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the chat pipeline and chess play on tiny offline models.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS), help="Benchmarks to run.")
+    parser.add_argument("--models-dir", help="Where to build the tiny models (reused if present). Defaults to a temporary directory.")
+    parser.add_argument("--preset", default="realism")
+    parser.add_argument("--summarizer", default="extractive", help="Summarization strategy; abstractive needs the BART weights.")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 8, 32], help="Earlier turns before the timed ones.")
+    parser.add_argument("--turns", type=int, default=3, help="Timed turns per history length.")
+    parser.add_argument("--summarize", type=int, nargs="+", default=[8, 32], help="Long messages to summarize.")
+    parser.add_argument("--log-sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Chat log sizes to time appends at.")
+    parser.add_argument("--chess-moves", type=int, default=20)
+    parser.add_argument("--difficulty", default="normal")
+    parser.add_argument("--repeat", type=int, default=3, help="Warm chat starts to take the median of.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against results saved with --save.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative slowdown allowed before a metric counts as a regression.")
+    args = parser.parse_args()
+
+    install_tiny_models(args.models_dir or tempfile.mkdtemp(prefix="llabot-bench-"))
+    results = {}
+    for name in args.only:
+        start = time.perf_counter()
+        results[name] = BENCHMARKS[name](args)
+        print(f"{name} finished in {time.perf_counter() - start:.1f}s.", file=sys.stderr)
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "platform": platform.platform(),
+            "threads": torch.get_num_threads(),
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if not args.baseline:
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    rows = compare(results, baseline.get("results", {}), args.tolerance)
+    print(json.dumps({**report, "comparison": rows}, indent=2))
+    regressions = [row for row in rows if row["regressed"]]
+    for row in regressions:
+        print(f"REGRESSION {row['metric']}: {row['baseline']} -> {row['current']} ({row['change']:+.1%})", file=sys.stderr)
+    if regressions:
+        print(f"{len(regressions)} of {len(rows)} metrics regressed by more than {args.tolerance:.0%}.", file=sys.stderr)
+        sys.exit(1)
+    print(f"No regressions in {len(rows)} metrics.", file=sys.stderr)
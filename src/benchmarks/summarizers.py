@@ -0,0 +1,67 @@
+"""
+Compares the summarization strategies on recorded chat logs: wall time per text and how
+much each one compresses (summary words / original words).
+
+    python -m benchmarks.summarizers llabot/chat_logs/*.jsonl --strategies extractive abstractive
+"""
+import argparse
+import json
+import time
+from llabot.chat_log import compact_chat_log
+from llabot.summarizer import SUMMARIZERS, make_summarizer
+
+def load_texts(paths: list[str], min_words: int) -> list[str]:
+    """Collects the final text of every non-system message long enough to be summarized."""
+    texts = []
+    for path in paths:
+        if path.endswith(".jsonl"):
+            chat_log = compact_chat_log(path)
+        else:
+            with open(path, "r", encoding="utf-8") as file:
+                chat_log = json.load(file)
+        latest = {}
+        for number, record in enumerate(chat_log.get("messages", [])):
+            latest[record.get("message_number", number)] = record
+        texts.extend(record["message"] for record in latest.values()
+                     if record.get("sender_role") != "system" and len(record.get("message", "").split()) >= min_words)
+    return texts
+
+def run(strategy: str, texts: list[str], batch_size: int) -> dict:
+    load_start = time.perf_counter()
+    summarizer = make_summarizer(strategy)
+    load_time = time.perf_counter() - load_start
+    start = time.perf_counter()
+    summaries = []
+    for offset in range(0, len(texts), batch_size):
+        summaries.extend(summarizer.summarize_texts(texts[offset:offset + batch_size], batch_size))
+    elapsed = time.perf_counter() - start
+    original_words = sum(len(text.split()) for text in texts)
+    summary_words = sum(len(summary.split()) for summary in summaries)
+    return {
+        "strategy": strategy,
+        "texts": len(texts),
+        "load_s": round(load_time, 3),
+        "total_s": round(elapsed, 3),
+        "ms_per_text": round(1000 * elapsed / len(texts), 3),
+        "compression": round(summary_words / original_words, 3) if original_words else 0.0,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark summarization strategies on recorded chat logs.")
+    parser.add_argument("logs", nargs="+", help="Chat logs (.jsonl, or legacy .json).")
+    parser.add_argument("--strategies", nargs="+", default=list(SUMMARIZERS), choices=list(SUMMARIZERS))
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--min-words", type=int, default=30, help="Skip messages shorter than this.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    texts = load_texts(args.logs, args.min_words)
+    if not texts:
+        parser.error("No messages long enough to summarize in the given logs.")
+    results = [run(strategy, texts, args.batch_size) for strategy in args.strategies]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(f"{result['strategy']:>12}: {result['ms_per_text']:9.3f} ms/text, "
+                  f"compression {result['compression']:.3f}, load {result['load_s']:.3f} s ({result['texts']} texts)")
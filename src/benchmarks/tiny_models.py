@@ -0,0 +1,101 @@
+"""
+Tiny, randomly initialized stand-ins for the chat and chess models, built on the fly so
+benchmarks run offline. Their output is noise, but every code path around the model runs
+exactly as it does with the real weights.
+"""
+import os
+import random
+import chess
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors, trainers
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+from llabot.chess.engine import ChessEngine
+from llabot.llm_model import LLMModel
+from llabot.model_registry import ModelRegistry
+from llabot.summarizer import SUMMARIZER_MODEL
+from llabot.tokenizer_cache import get_tokenizer, register_tokenizer
+
+CHAT_TEMPLATE = (
+    "{{ bos_token }}{% for m in messages %}<|start_header_id|>{{ m['role'] }}<|end_header_id|>\n\n"
+    "{{ m['content'] }}<|eot_id|>{% endfor %}"
+    "{% if add_generation_prompt %}<|start_header_id|>assistant<|end_header_id|>\n\n{% endif %}"
+)
+CHAT_CORPUS = [
+    "hello there. how are you today? I am fine! the weather is nice and the sun is out.",
+    "system user assistant role content. tell me about your day, what did you do?",
+]
+
+def _llama(tokenizer, seed: int, layers: int, hidden: int, max_positions: int) -> LlamaForCausalLM:
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden,
+        intermediate_size=hidden * 2,
+        num_hidden_layers=layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=max_positions,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    return LlamaForCausalLM(config)
+
+def build_chat_model(path: str, seed: int = 0, layers: int = 2, hidden: int = 64) -> str:
+    """A byte-level BPE llama with a Llama 3 style chat template."""
+    specials = ["<|begin_of_text|>", "<|end_of_text|>", "<|start_header_id|>", "<|end_header_id|>", "<|eot_id|>", "<pad>"]
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.train_from_iterator(CHAT_CORPUS * 50, trainers.BpeTrainer(
+        vocab_size=300, special_tokens=specials, initial_alphabet=pre_tokenizers.ByteLevel.alphabet()))
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<|begin_of_text|>", eos_token="<|eot_id|>",
+                                   pad_token="<pad>", chat_template=CHAT_TEMPLATE)
+    fast.save_pretrained(path)
+    _llama(fast, seed, layers, hidden, 8192).save_pretrained(path)
+    return path
+
+def build_chess_model(path: str, seed: int = 0, games: int = 200) -> str:
+    """A SentencePiece-style (Metaspace) llama trained on random games, like the real chess model's tokenizer."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(games):
+        board, moves = chess.Board(), []
+        for _ in range(60):
+            legal = list(board.legal_moves)
+            if not legal:
+                break
+            move = rng.choice(legal)
+            board.push(move)
+            moves.append(move.uci())
+        corpus.append("1-0 " + " ".join(moves))
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Metaspace()
+    tokenizer.decoder = decoders.Metaspace()
+    tokenizer.train_from_iterator(corpus, trainers.BpeTrainer(vocab_size=600, special_tokens=["<unk>", "<s>", "</s>"]))
+    tokenizer.post_processor = processors.TemplateProcessing(single="<s> $A", special_tokens=[("<s>", tokenizer.token_to_id("<s>"))])
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>", unk_token="<unk>")
+    fast.save_pretrained(path)
+    _llama(fast, seed, 2, 64, 2048).save_pretrained(path)
+    return path
+
+def install_tiny_models(directory: str) -> dict[str, str]:
+    """
+    Builds the tiny models into directory (reusing ones already there) and points llabot at
+    them: every LLMModel loads the chat model, the chess engine loads the chess model, and
+    token counting for the summarizer uses the chat tokenizer.
+    """
+    chat_path = os.path.join(directory, "chat")
+    chess_path = os.path.join(directory, "chess")
+    if not os.path.exists(os.path.join(chat_path, "config.json")):
+        build_chat_model(chat_path)
+    if not os.path.exists(os.path.join(chess_path, "config.json")):
+        build_chess_model(chess_path)
+    registry = ModelRegistry()
+    chat_tokenizer = get_tokenizer(chat_path)
+    for llm_model in LLMModel:
+        registry.sources[llm_model] = chat_path
+        register_tokenizer(llm_model.value, chat_tokenizer)
+    register_tokenizer(SUMMARIZER_MODEL, chat_tokenizer)
+    ChessEngine.model_name = chess_path
+    return {"chat": chat_path, "chess": chess_path}
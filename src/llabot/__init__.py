@@ -2,25 +2,26 @@ from .logging import CustomLogger
 from .user_data import UserData
 from .scene_data import SceneData
 
-logger = CustomLogger("LLaBot", console=True, file=True)
+logger = CustomLogger(__name__, console=True, file=True)
 
 __all__ = ["logger"]
 
-import time
+from .metrics import Metrics, Timer
 
-class Timer:
-    def __init__(self):
-        self.start_time = time.time()  # Start the timer
-    
-    def stop(self):
-        """Stops the timer and returns the elapsed time in the format 'XmYs'."""
-        end_time = time.time()  # Stop the timer
-        elapsed_time = end_time - self.start_time  # Calculate the elapsed time
-        
-        minutes = int(elapsed_time // 60)  # Extract minutes
-        seconds = int(elapsed_time % 60)  # Extract remaining seconds
-        
-        # Return the formatted elapsed time as a string
-        return f"{minutes}m{seconds}s"
+# The bot classes pull in torch and transformers, so they are only imported on first use
+_LAZY = {
+    "ModelRegistry": ".model_registry",
+    "LLaBot": ".llabot",
+    "AsyncLLaBot": ".async_llabot",
+}
 
-from .llabot import LLaBot
\ No newline at end of file
+def __getattr__(name):
+    if name in _LAZY:
+        from importlib import import_module
+        value = getattr(import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Optional
+from .llabot import LLaBot
+from .llm_model import LLMModel
+from . import UserData
+
+class AsyncLLaBot:
+  """
+  asyncio front end for LLaBot. Model loading, generation, summarization and chat log
+  I/O all run on worker threads, never on the event loop. Each model has its own limit
+  on concurrent generations, and cancelling an awaiting task stops its generation.
+  """
+  max_concurrency_per_model = 8   # Matches the default batch size of the scheduler
+
+  def __init__(self, llabot: Optional[LLaBot] = None, max_concurrency_per_model: Optional[int] = None):
+    self.llabot: LLaBot = llabot or LLaBot()
+    if max_concurrency_per_model is not None:
+      self.max_concurrency_per_model = max_concurrency_per_model
+    self._limits: dict[LLMModel, asyncio.Semaphore] = {}
+
+  def _limit(self, bot_num: int) -> asyncio.Semaphore:
+    model = self.llabot.bot_pool[bot_num].llm_model
+    if model not in self._limits:
+      self._limits[model] = asyncio.Semaphore(self.max_concurrency_per_model)
+    return self._limits[model]
+
+  async def add_bot(self, persona_name: str = "generic", model_type: LLMModel = LLMModel.SMALL, prefetch: bool = False, inference_profile: Optional[str] = None, draft_model: Optional[LLMModel] = None) -> int:
+    """Adds a bot and returns its number."""
+    await asyncio.to_thread(self.llabot.add_bot, persona_name, model_type, prefetch, inference_profile, draft_model)
+    return len(self.llabot.bot_pool) - 1
+
+  async def start_chat(self, bot_num: int, user_data: UserData, preset_name: str = "realism"):
+    ready = self.llabot.start_chat(bot_num, user_data, preset_name, blocking=False)
+    await asyncio.wrap_future(ready)
+
+  async def end_chat(self, bot_num: int):
+    await asyncio.to_thread(self.llabot.end_chat, bot_num)
+
+  async def remove_bot(self, bot_num: int):
+    await asyncio.to_thread(self.llabot.remove_bot, bot_num)
+
+  async def generate_response(self, bot_num: int, prompt: str) -> str:
+    """
+    Generates a reply. Cancelling the awaiting task stops the generation; the worker thread
+    then takes the prompt back out of the chat, so neither it nor a reply is kept.
+    """
+    bot = self.llabot.bot_pool[bot_num]
+    cancel_event = threading.Event()
+    async with self._limit(bot_num):
+      try:
+        return await asyncio.to_thread(bot.generate_response, prompt, True, None, self.llabot.scheduler, cancel_event)
+      except asyncio.CancelledError:
+        cancel_event.set()
+        raise
+
+  async def stream_response(self, bot_num: int, prompt: str) -> AsyncIterator[str]:
+    """Yields reply chunks as they are produced. Leaving the loop early stops the generation and takes the prompt back."""
+    bot = self.llabot.bot_pool[bot_num]
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancel_event = threading.Event()
+    done = object()
+
+    def produce():
+      try:
+        for chunk in bot.stream_response(prompt, cancel_event=cancel_event):
+          loop.call_soon_threadsafe(queue.put_nowait, chunk)
+        loop.call_soon_threadsafe(queue.put_nowait, done)
+      except BaseException as e:
+        loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    async with self._limit(bot_num):
+      producer = loop.run_in_executor(None, produce)
+      try:
+        while True:
+          item = await queue.get()
+          if item is done:
+            break
+          if isinstance(item, BaseException):
+            raise item
+          yield item
+      finally:
+        if not producer.done():
+          cancel_event.set()
+        await asyncio.shield(producer)
+
+  def bot_status(self, bot_num: int) -> str:
+    return self.llabot.bot_status(bot_num)
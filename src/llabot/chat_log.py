@@ -0,0 +1,148 @@
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+import weakref
+from typing import Optional
+from .metrics import Metrics
+
+class ChatLogWriter:
+    """
+    Append-only JSON-lines chat log. Each call to write() buffers one event record;
+    a shared background thread flushes every open writer's buffer to disk. A writer
+    that is garbage-collected without close() still writes out its buffer and closes.
+    """
+    flush_interval = 0.5    # Seconds between background flushes
+    fsync = False           # Whether each flush also forces the data onto disk
+
+    _writers = weakref.WeakSet()
+    _writers_lock = threading.Lock()
+    _flusher: Optional[threading.Thread] = None
+
+    def __init__(self, path: str, fsync: Optional[bool] = None):
+        self.path: str = path
+        self.fsync: bool = ChatLogWriter.fsync if fsync is None else fsync
+        self._file = open(path, "x", encoding="utf-8")  # Exclusive create, never clobber another chat's log
+        self._buffer: list[str] = []
+        self._buffer_lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        # The background flusher only holds writers weakly, so this writes out the buffer when one is dropped
+        self._finalizer = weakref.finalize(self, ChatLogWriter._close_file, self._file, self._buffer, self._buffer_lock, self.fsync)
+        with ChatLogWriter._writers_lock:
+            ChatLogWriter._writers.add(self)
+            if ChatLogWriter._flusher is None:
+                ChatLogWriter._flusher = threading.Thread(target=ChatLogWriter._flush_loop, name="llabot-chat-log", daemon=True)
+                ChatLogWriter._flusher.start()
+
+    @classmethod
+    def create(cls, directory: str, stem: str, unique: str, fsync: Optional[bool] = None) -> "ChatLogWriter":
+        """Creates a writer for '<stem>_<unique[:8]>.jsonl', falling back to the full unique id on collision."""
+        os.makedirs(directory, exist_ok=True)
+        try:
+            return cls(os.path.join(directory, f"{stem}_{unique[:8]}.jsonl"), fsync)
+        except FileExistsError:
+            return cls(os.path.join(directory, f"{stem}_{unique}.jsonl"), fsync)
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def write(self, event: str, **fields) -> None:
+        """Queues a single event record. It reaches disk on the next flush."""
+        if self.closed:
+            raise RuntimeError(f"Chat log '{self.path}' is closed.")
+        start = time.perf_counter()
+        line = json.dumps({"event": event, **fields}, ensure_ascii=False)
+        with self._buffer_lock:
+            self._buffer.append(line)
+        Metrics().observe("log_write", time.perf_counter() - start)
+
+    def flush(self) -> None:
+        with self._io_lock:
+            with self._buffer_lock:
+                lines = self._buffer[:]
+                self._buffer.clear()
+            if not lines or self._file.closed:
+                return
+            start = time.perf_counter()
+            ChatLogWriter._write_lines(self._file, lines, self.fsync)
+            Metrics().observe("log_flush", time.perf_counter() - start)
+
+    def close(self) -> None:
+        with self._io_lock:
+            self._finalizer()
+        with ChatLogWriter._writers_lock:
+            ChatLogWriter._writers.discard(self)
+
+    @staticmethod
+    def _write_lines(file, lines: list[str], fsync: bool) -> None:
+        file.write("\n".join(lines) + "\n")
+        file.flush()
+        if fsync:
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def _close_file(file, buffer: list[str], buffer_lock: threading.Lock, fsync: bool) -> None:
+        """Writes out whatever is still buffered and closes the file, on close() or once the writer is collected."""
+        with buffer_lock:
+            lines = buffer[:]
+            buffer.clear()
+        if file.closed:
+            return
+        if lines:
+            ChatLogWriter._write_lines(file, lines, fsync)
+        file.close()
+
+    @classmethod
+    def flush_all(cls) -> None:
+        with cls._writers_lock:
+            writers = list(cls._writers)
+        for writer in writers:
+            writer.flush()
+
+    @classmethod
+    def _flush_loop(cls) -> None:
+        while True:
+            time.sleep(cls.flush_interval)
+            cls.flush_all()
+
+atexit.register(ChatLogWriter.flush_all)
+
+def read_chat_log(path: str) -> list[dict]:
+    """Reads every event record from a JSON-lines chat log."""
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def compact_chat_log(path: str) -> dict:
+    """Replays a JSON-lines chat log into the single-document format of the original JSON logs."""
+    chat_log = {"chat_id": None, "start_time": None, "messages": []}
+    for record in read_chat_log(path):
+        event = record.pop("event", None)
+        if event == "chat_started":
+            chat_log["chat_id"] = record.get("chat_id")
+            chat_log["start_time"] = record.get("start_time")
+        elif event in ("message_added", "message_updated"):
+            chat_log["messages"].append(record)
+        elif event == "message_removed":
+            number = record.get("message_number")
+            chat_log["messages"] = [message for message in chat_log["messages"] if message.get("message_number") != number]
+    return chat_log
+
+def export_chat_log(path: str, output_path: Optional[str] = None) -> str:
+    """Writes the compacted document next to the log (or to output_path) and returns its path."""
+    output_path = output_path or os.path.splitext(path)[0] + ".json"
+    with open(output_path, "w", encoding="utf-8") as file:
+        json.dump(compact_chat_log(path), file, indent=4)
+    return output_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export JSON-lines chat logs to single-document JSON.")
+    parser.add_argument("logs", nargs="+", help="Chat log (.jsonl) files to export.")
+    parser.add_argument("-o", "--output", help="Output path, only valid with a single log.")
+    args = parser.parse_args()
+    if args.output and len(args.logs) > 1:
+        parser.error("--output can only be used with a single log.")
+    for log_path in args.logs:
+        print(export_chat_log(log_path, args.output))
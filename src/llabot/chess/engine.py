@@ -0,0 +1,333 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional
+import chess
+import torch
+from transformers import LlamaTokenizerFast, LlamaForCausalLM, LogitsProcessorList
+from llabot import logger
+from llabot.kv_cache import KVCacheManager
+from .legal_moves import MoveEncoder, MoveTrie, LegalMoveLogitsProcessor
+from .opening_book import OpeningBook
+
+class ChessGame:
+    """The state of one game: board, UCI move list and difficulty. Holds no model state."""
+    def __init__(self, game_id: str, difficulty_level: str = "normal"):
+        self.game_id: str = game_id
+        self.difficulty_level: str = difficulty_level
+        self.board = chess.Board()
+        self.moves_uci: list[str] = []
+        self.generate_calls: int = 0
+        self.pending: Optional[Future] = None   # AI move being generated, if any
+
+    def submit_player_move(self, move_uci: str) -> bool:
+        """
+        Submits a player's move if valid.
+        :param move_uci: The player's move in UCI format.
+        :return: True if the move is valid and successfully submitted, False otherwise.
+        """
+        if self.pending is not None:
+            logger.warning("Player move %s submitted while the AI is still moving.", move_uci)
+            return False
+        try:
+            move = chess.Move.from_uci(move_uci)
+            if self.board.is_legal(move):
+                self.push(move_uci)
+                logger.info("Player move submitted: %s", move_uci)
+                return True
+            else:
+                logger.warning("Player move %s is illegal.", move_uci)
+        except ValueError:
+            logger.warning("Invalid move format: %s", move_uci)
+        return False
+
+    def push(self, move_uci: str) -> None:
+        self.board.push(chess.Move.from_uci(move_uci))
+        self.moves_uci.append(move_uci)
+
+@dataclass
+class _MoveRequest:
+    game: ChessGame
+    settings: tuple
+    future: Future = field(default_factory=Future)
+
+class ChessEngine:
+    """
+    Plays any number of games on one shared chess model. Games are plain board states, so
+    creating one loads nothing; the model loads on the first AI move. Move requests from
+    different games are collected for up to max_wait seconds and generated together, one
+    padded batch per difficulty setting. A request that ends up alone reuses its game's
+    KV cache instead. With the opening book enabled, a position found in the book is
+    played by sampling its cached move distribution at the game's temperature and top-k;
+    positions missing from it are generated with the rest of the batch.
+    """
+    _instance = None
+    model_name = 'lazy-guy12/chess-llama'
+    max_batch_size = 32       # Games generated in one call at most
+    max_wait = 0.005          # Seconds to gather requests before a batch is generated
+    kv_cache_enabled = True   # Keep each game's past key/values for moves generated alone
+    book_enabled = False      # Sample book positions from cached move distributions, see opening_book.py
+    book_path = None          # Opening book file loaded with the model, see opening_book.py
+
+    # Difficulty settings (Temperature, Top_k)
+    difficulty_settings = {
+        "very_easy": {"temperature": 1.0, "top_k": 100},
+        "easy": {"temperature": 0.8, "top_k": 75},
+        "normal": {"temperature": 0.6, "top_k": 50},
+        "intermediate": {"temperature": 0.4, "top_k": 30},
+        "hard": {"temperature": 0.2, "top_k": 20},
+    }
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ChessEngine, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.initialized = True
+            self._lock = threading.Lock()
+            self._condition = threading.Condition()
+            self._games: dict[str, ChessGame] = {}
+            self._ids = itertools.count()
+            self._pending: list[_MoveRequest] = []
+            self._thread: Optional[threading.Thread] = None
+            self.tokenizer = None
+            self.model = None
+            self.stop_token_id: Optional[int] = None
+            self.move_encoder: Optional[MoveEncoder] = None
+            self.opening_book = OpeningBook()
+            self.batches: int = 0
+            self.moves: int = 0
+
+    def load(self) -> None:
+        """Loads the model and tokenizer, if they aren't already."""
+        with self._lock:
+            if self.model is not None:
+                return
+            logger.debug("Loading the chess model.")
+            tokenizer = LlamaTokenizerFast.from_pretrained(self.model_name)
+            model = LlamaForCausalLM.from_pretrained(self.model_name)
+            model.eval()
+            self.stop_token_id = tokenizer.eos_token_id if tokenizer.eos_token_id is not None else tokenizer.pad_token_id
+            self.move_encoder = MoveEncoder(tokenizer)
+            self.tokenizer = tokenizer
+            self.model = model
+            if self.book_path and os.path.exists(self.book_path):
+                count = self.opening_book.load(self.book_path)
+                logger.debug("Loaded %s opening book positions.", count)
+
+    def difficulty_params(self, difficulty_level: str) -> dict:
+        return self.difficulty_settings.get(difficulty_level, self.difficulty_settings["normal"])
+
+    def move_distribution(self, moves_uci: list[str], legal_moves: Optional[list[str]] = None) -> dict[str, float]:
+        """
+        Scores every legal move after moves_uci with the model in one forward pass and
+        returns their log probabilities, normalized over the legal moves.
+        """
+        self.load()
+        if legal_moves is None:
+            board = chess.Board()
+            for move in moves_uci:
+                board.push_uci(move)
+            legal_moves = [move.uci() for move in board.legal_moves]
+        trie = self.move_encoder.trie(moves_uci, legal_moves)
+        prompt_length = len(trie.prompt_ids)
+        continuations = [trie.continuations[move] for move in legal_moves]
+        length = prompt_length + max(len(ids) for ids in continuations)
+        input_ids = torch.full((len(legal_moves), length), self.stop_token_id, dtype=torch.long)
+        scored = torch.zeros((len(legal_moves), length - 1), dtype=torch.bool)
+        for row, ids in enumerate(continuations):
+            input_ids[row, :prompt_length] = torch.tensor(trie.prompt_ids)
+            input_ids[row, prompt_length:prompt_length + len(ids)] = torch.tensor(ids)
+            scored[row, prompt_length - 1:prompt_length - 1 + len(ids)] = True
+        with torch.no_grad():
+            logits = self.model(input_ids=input_ids.to(self.model.device)).logits.float().cpu()
+        token_logprobs = torch.log_softmax(logits[:, :-1], dim=-1).gather(-1, input_ids[:, 1:].unsqueeze(-1)).squeeze(-1)
+        scores = (token_logprobs * scored).sum(dim=1)
+        scores = scores - torch.logsumexp(scores, dim=0)
+        return {move: round(float(score), 5) for move, score in zip(legal_moves, scores)}
+
+    def new_game(self, difficulty_level: str = "normal") -> ChessGame:
+        game = ChessGame(f"chess-{next(self._ids)}", difficulty_level)
+        with self._condition:
+            self._games[game.game_id] = game
+        return game
+
+    def end_game(self, game_id: str) -> None:
+        with self._condition:
+            self._games.pop(game_id, None)
+        KVCacheManager().discard(game_id)
+
+    def game(self, game_id: str) -> ChessGame:
+        with self._condition:
+            if game_id not in self._games:
+                raise ValueError(f"No game with id '{game_id}'.")
+            return self._games[game_id]
+
+    def undo_move(self, game_id: str) -> str:
+        """Takes back the last move of a game and returns it in UCI format."""
+        game = self.game(game_id)
+        if game.pending is not None:
+            raise RuntimeError("Cannot take back a move while the AI is moving.")
+        move = game.board.pop()
+        game.moves_uci.pop()
+        KVCacheManager().invalidate(game_id, len(game.moves_uci))
+        logger.info("Move taken back: %s", move.uci())
+        return move.uci()
+
+    def reset_game(self, game_id: str) -> None:
+        """Starts a game over, dropping its cached key/values."""
+        game = self.game(game_id)
+        if game.pending is not None:
+            raise RuntimeError("Cannot reset a game while the AI is moving.")
+        game.board.reset()
+        game.moves_uci = []
+        KVCacheManager().discard(game_id)
+
+    def request_move(self, game_id: str) -> Future:
+        """
+        Queues an AI move for a game. The future resolves to the move in UCI format once it
+        has been played on the board, or "0000" if the game is over.
+        """
+        game = self.game(game_id)
+        params = self.difficulty_params(game.difficulty_level)
+        request = _MoveRequest(game, (params["temperature"], params["top_k"]))
+        with self._condition:
+            if game.pending is not None:
+                raise RuntimeError(f"Game '{game_id}' already has an AI move in progress.")
+            game.pending = request.future
+            self._pending.append(request)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llabot-chess", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return request.future
+
+    def play_move(self, game_id: str) -> str:
+        """Generates and plays the AI's move for a game, waiting for it."""
+        return self.request_move(game_id).result()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "games": len(self._games),
+                "queued": len(self._pending),
+                "batches": self.batches,
+                "moves": self.moves,
+                "mean_batch_size": self.moves / self.batches if self.batches else 0.0,
+                "book": self.opening_book.stats(),
+            }
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch_size and time.monotonic() < deadline:
+                    self._condition.wait(deadline - time.monotonic())
+                requests, self._pending = self._pending, []
+            groups: dict[tuple, list[_MoveRequest]] = {}
+            for request in requests:
+                groups.setdefault(request.settings, []).append(request)
+            for settings, group in groups.items():
+                for start in range(0, len(group), self.max_batch_size):
+                    self._play(settings, group[start:start + self.max_batch_size])
+
+    def _play(self, settings: tuple, batch: list[_MoveRequest]) -> None:
+        try:
+            self.load()
+            rows: list[tuple[_MoveRequest, MoveTrie]] = []
+            for request in batch:
+                legal_moves = [move.uci() for move in request.game.board.legal_moves]
+                distribution = self._book_lookup(request.game) if len(legal_moves) > 1 else None
+                if not legal_moves:
+                    logger.error("AI has no legal move to play.")
+                    self._finish(request, "0000")
+                elif len(legal_moves) == 1:
+                    self._finish(request, legal_moves[0])
+                elif distribution is not None:
+                    self._finish(request, OpeningBook.sample(distribution, *settings))
+                else:
+                    rows.append((request, self.move_encoder.trie(request.game.moves_uci, legal_moves)))
+            if not rows:
+                return
+            if len(rows) == 1 and self.kv_cache_enabled:
+                moves = [self._generate_cached(rows[0][0].game, rows[0][1], settings)]
+            else:
+                moves = self._generate_batch([trie for _, trie in rows], settings)
+            for (request, _), move in zip(rows, moves):
+                request.game.generate_calls += 1
+                if move is None:
+                    # Only possible if generation stopped before a move was complete
+                    logger.error("AI failed to generate a complete move.")
+                    move = "0000"
+                self._finish(request, move)
+            with self._condition:
+                self.batches += 1
+                self.moves += len(rows)
+        except BaseException as e:
+            logger.error("Chess move generation failed: %s", e)
+            for request in batch:
+                if not request.future.done():
+                    request.game.pending = None
+                    request.future.set_exception(e)
+
+    def _book_lookup(self, game: ChessGame) -> Optional[dict[str, float]]:
+        """The book's move distribution for the game's position. A miss is left to batched generation."""
+        if not self.book_enabled or not self.opening_book.covers(game.moves_uci):
+            return None
+        return self.opening_book.lookup(game.moves_uci)
+
+    def _finish(self, request: _MoveRequest, move: str) -> None:
+        if move != "0000":
+            request.game.push(move)
+            logger.info("AI move submitted: %s", move)
+        request.game.pending = None
+        request.future.set_result(move)
+
+    def _generate_kwargs(self, settings: tuple, tries: list[MoveTrie], prompt_length: int) -> dict:
+        temperature, top_k = settings
+        return {
+            "max_new_tokens": max(trie.depth for trie in tries) + 1,
+            "do_sample": True,
+            "temperature": temperature,
+            "top_k": top_k,
+            "logits_processor": LogitsProcessorList([LegalMoveLogitsProcessor(tries, prompt_length, self.stop_token_id)]),
+            "eos_token_id": self.stop_token_id,
+            "pad_token_id": self.stop_token_id,
+        }
+
+    def _generate_cached(self, game: ChessGame, trie: MoveTrie, settings: tuple) -> Optional[str]:
+        input_ids = torch.tensor([trie.prompt_ids], device=self.model.device)
+        with KVCacheManager().checkout(game.game_id, self.model) as game_cache:
+            # Only the tokens of moves played since the last call are prefilled
+            past_key_values = game_cache.prepare(trie.prompt_ids)
+            generated = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
+                **self._generate_kwargs(settings, [trie], input_ids.shape[1]),
+            )
+            game_cache.update(trie.prompt_ids, generated[0].tolist(), len(game.moves_uci))
+        return trie.move(generated[0, input_ids.shape[1]:].tolist())
+
+    def _generate_batch(self, tries: list[MoveTrie], settings: tuple) -> list[Optional[str]]:
+        logger.debug("Generating a batch of %s chess moves.", len(tries))
+        prompt_length = max(len(trie.prompt_ids) for trie in tries)
+        input_ids = torch.full((len(tries), prompt_length), self.stop_token_id, dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+        for row, trie in enumerate(tries):
+            # Left padding, so every row's next token comes right after its prompt
+            input_ids[row, prompt_length - len(trie.prompt_ids):] = torch.tensor(trie.prompt_ids)
+            attention_mask[row, prompt_length - len(trie.prompt_ids):] = 1
+        generated = self.model.generate(
+            input_ids=input_ids.to(self.model.device),
+            attention_mask=attention_mask.to(self.model.device),
+            **self._generate_kwargs(settings, tries, prompt_length),
+        )
+        return [trie.move(generated[row, prompt_length:].tolist()) for row, trie in enumerate(tries)]
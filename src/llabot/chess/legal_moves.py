@@ -0,0 +1,136 @@
+from typing import Optional
+import torch
+from transformers import LogitsProcessor
+
+_MOVE = -1  # Key of a trie node's finished move
+
+class MoveTrie:
+    """
+    Prefix trie over the token sequences of a position's legal moves. `prompt_ids` is the
+    tokenized game up to (and shared by) every candidate, so a sequence walked from the
+    root always spells exactly one legal move in UCI.
+    """
+    def __init__(self, prompt_ids: list[int], continuations: dict[str, list[int]]):
+        self.prompt_ids: list[int] = prompt_ids
+        self.continuations: dict[str, list[int]] = continuations
+        self.root: dict = {}
+        self.depth: int = 0
+        for move, token_ids in continuations.items():
+            node = self.root
+            for token_id in token_ids:
+                node = node.setdefault(token_id, {})
+            node[_MOVE] = move
+            self.depth = max(self.depth, len(token_ids))
+
+    @classmethod
+    def from_texts(cls, tokenizer, texts: dict[str, str]) -> "MoveTrie":
+        """
+        Builds the trie from the full game text after each candidate move. The prompt is the
+        longest token prefix all candidates share, so tokenizers that merge across the move
+        boundary are handled too.
+        """
+        moves = list(texts)
+        encoded = tokenizer([texts[move] for move in moves])["input_ids"]
+        shared = min(len(ids) for ids in encoded) - 1
+        first = encoded[0]
+        for ids in encoded[1:]:
+            for i in range(shared):
+                if ids[i] != first[i]:
+                    shared = i
+                    break
+        return cls(first[:shared], {move: ids[shared:] for move, ids in zip(moves, encoded)})
+
+    def walk(self, token_ids) -> Optional[dict]:
+        """Returns the node reached by token_ids, or None if they leave the trie."""
+        node = self.root
+        for token_id in token_ids:
+            if _MOVE in node:
+                return node
+            node = node.get(int(token_id))
+            if node is None:
+                return None
+        return node
+
+    def move(self, token_ids) -> Optional[str]:
+        """The move spelled by token_ids, or None if they do not complete one."""
+        node = self.walk(token_ids)
+        return node.get(_MOVE) if node is not None else None
+
+class MoveEncoder:
+    """
+    Tokenizes games of the form "1-0 e2e4 e7e5 ..." move by move. When the tokenizer never
+    merges tokens across the spaces between moves (checked once, on a sample game), a game's
+    ids are the header ids followed by each move's own ids, which are memoized, so neither
+    the history nor the candidates are re-tokenized as a game grows. Otherwise every call
+    falls back to tokenizing the full texts.
+    """
+    header = "1-0"
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self._header_ids: list[int] = tokenizer(self.header)["input_ids"]
+        self._move_ids: dict[str, list[int]] = {}
+        self.composable: bool = True
+        sample = ["e2e4", "e7e5", "g1f3"]
+        self.composable = tokenizer(self.text(sample))["input_ids"] == self.game_ids(sample)
+
+    def text(self, moves_uci: list[str]) -> str:
+        return f"{self.header} " + " ".join(moves_uci)
+
+    def game_ids(self, moves_uci: list[str]) -> list[int]:
+        """The ids of the game text (through the last move)."""
+        if self.composable:
+            ids = list(self._header_ids)
+            for move in moves_uci:
+                move_ids = self.move_ids(move)
+                if move_ids is None:
+                    break
+                ids.extend(move_ids)
+            else:
+                return ids
+        return self.tokenizer(self.text(moves_uci))["input_ids"]
+
+    def move_ids(self, move: str) -> Optional[list[int]]:
+        """The ids a move adds after the game so far, space included, or None if that is not well defined."""
+        ids = self._move_ids.get(move)
+        if ids is None:
+            ids = self._encode_move(move)
+            if ids is None:
+                self.composable = False
+        return ids
+
+    def trie(self, moves_uci: list[str], legal_moves: list[str]) -> MoveTrie:
+        if self.composable:
+            continuations = {move: self.move_ids(move) for move in legal_moves}
+            if self.composable:
+                return MoveTrie(self.game_ids(moves_uci), continuations)
+        return MoveTrie.from_texts(self.tokenizer, {move: self.text(moves_uci + [move]) for move in legal_moves})
+
+    def _encode_move(self, move: str) -> Optional[list[int]]:
+        ids = self.tokenizer(f"{self.header} {move}")["input_ids"]
+        if ids[:len(self._header_ids)] != self._header_ids or len(ids) == len(self._header_ids):
+            return None
+        self._move_ids[move] = ids[len(self._header_ids):]
+        return self._move_ids[move]
+
+class LegalMoveLogitsProcessor(LogitsProcessor):
+    """
+    Masks every token that does not continue a legal move, one trie per batch row. Once a
+    row has spelled a whole move only stop_token_id is allowed, which ends that row. It
+    runs before temperature and top-k, so the difficulty settings sample among legal moves.
+    """
+    def __init__(self, tries: list[MoveTrie], prompt_length: int, stop_token_id: int):
+        self.tries: list[MoveTrie] = tries
+        self.prompt_length: int = prompt_length
+        self.stop_token_id: int = stop_token_id
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        mask = torch.full_like(scores, float("-inf"))
+        for row, trie in enumerate(self.tries):
+            node = trie.walk(input_ids[row, self.prompt_length:].tolist())
+            if node is None or _MOVE in node:
+                allowed = [self.stop_token_id]
+            else:
+                allowed = list(node)
+            mask[row, allowed] = 0.0
+        return scores + mask
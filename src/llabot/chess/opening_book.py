@@ -0,0 +1,138 @@
+import argparse
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+import torch
+from llabot import logger
+
+class OpeningBook:
+    """
+    LRU cache of the model's move distributions in the opening, keyed by the UCI move
+    sequence that leads to the position. A distribution maps every legal move to its log
+    probability under the model, so a move can be sampled from it at any difficulty.
+    Only the first max_plies plies are cached, where games actually repeat.
+    """
+    max_entries = 50_000    # Positions kept, least recently used dropped first
+    max_plies = 12          # Positions deeper than this are never cached
+
+    def __init__(self, max_entries: Optional[int] = None, max_plies: Optional[int] = None):
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_plies is not None:
+            self.max_plies = max_plies
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, dict[str, float]] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def key(moves_uci: list[str]) -> str:
+        return " ".join(moves_uci)
+
+    def covers(self, moves_uci: list[str]) -> bool:
+        return len(moves_uci) <= self.max_plies
+
+    def lookup(self, moves_uci: list[str]) -> Optional[dict[str, float]]:
+        key = self.key(moves_uci)
+        with self._lock:
+            distribution = self._entries.get(key)
+            if distribution is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return distribution
+
+    def store(self, moves_uci: list[str], distribution: dict[str, float]) -> None:
+        if not self.covers(moves_uci):
+            return
+        key = self.key(moves_uci)
+        with self._lock:
+            self._entries[key] = distribution
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def sample(distribution: dict[str, float], temperature: float, top_k: int) -> str:
+        """Samples a move, keeping the top_k most likely moves and sharpening them by temperature."""
+        moves = sorted(distribution, key=distribution.get, reverse=True)[:max(top_k, 1)]
+        logits = torch.tensor([distribution[move] for move in moves]) / max(temperature, 1e-5)
+        return moves[int(torch.multinomial(torch.softmax(logits, dim=0), 1))]
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            data = {"max_plies": self.max_plies, "positions": dict(self._entries)}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        """Adds the positions saved at path and returns how many there were."""
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        positions = data.get("positions", {})
+        with self._lock:
+            for key, distribution in positions.items():
+                self._entries[key] = distribution
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return len(positions)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "positions": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+def build_opening_book(engine, depth: int, width: int, book: Optional[OpeningBook] = None) -> OpeningBook:
+    """
+    Expands the opening tree from the start position with the engine's model: every
+    position reached is scored, and the `width` most likely moves of each are followed
+    until `depth` plies.
+    """
+    if book is None:
+        book = OpeningBook(max_plies=max(depth, OpeningBook.max_plies))
+    frontier: list[list[str]] = [[]]
+    for ply in range(depth):
+        next_frontier = []
+        for moves_uci in frontier:
+            distribution = book.lookup(moves_uci)
+            if distribution is None:
+                distribution = engine.move_distribution(moves_uci)
+                book.store(moves_uci, distribution)
+            best = sorted(distribution, key=distribution.get, reverse=True)[:width]
+            next_frontier.extend(moves_uci + [move] for move in best)
+        frontier = next_frontier
+        logger.info("Ply %s: %s positions in the book.", ply + 1, len(book))
+    return book
+
+if __name__ == "__main__":
+    from .engine import ChessEngine
+    parser = argparse.ArgumentParser(description="Build an opening book of the chess model's move distributions.")
+    parser.add_argument("output", help="Path of the book (.json).")
+    parser.add_argument("--model", default=ChessEngine.model_name, help="Chess model id or local path.")
+    parser.add_argument("--depth", type=int, default=6, help="Plies to expand.")
+    parser.add_argument("--width", type=int, default=3, help="Most likely moves followed from each position.")
+    parser.add_argument("--extend", action="store_true", help="Start from the positions already in the output book.")
+    args = parser.parse_args()
+    if args.width ** args.depth > 1_000_000:
+        parser.error("--width ** --depth is over a million positions.")
+
+    ChessEngine.model_name = args.model
+    book = OpeningBook(max_entries=math.inf, max_plies=max(args.depth, OpeningBook.max_plies))
+    if args.extend and os.path.exists(args.output):
+        book.load(args.output)
+    build_opening_book(ChessEngine(), args.depth, args.width, book)
+    book.save(args.output)
+    print(f"Saved {len(book)} positions to {args.output}.")
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+class ConfigStore:
+    """
+    Process-wide cache of parsed configuration files and rendered prompt fragments.
+    Each file is parsed once and parsed again only when its mtime or size changes, so
+    edits to presets, personas, scenes and config.json are picked up on the next chat.
+    Parsed data is shared between callers and must be treated as read-only.
+    """
+    _instance = None
+    max_fragments = 256     # Rendered fragments kept, least recently used dropped first
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ConfigStore, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.initialized = True
+            self._lock = threading.Lock()
+            self._files: dict[str, tuple[tuple[int, int], Any]] = {}
+            self._fragments: OrderedDict[Hashable, tuple[Hashable, str]] = OrderedDict()
+            self.parses: int = 0
+            self.hits: int = 0
+
+    @staticmethod
+    def version(path: str) -> tuple[int, int]:
+        """The (mtime, size) stamp a parse is tied to. Raises FileNotFoundError if the file is gone."""
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load_json(self, path: str) -> Any:
+        """Returns the parsed contents of a JSON file, parsing it only if it changed since the last call."""
+        path = os.path.abspath(path)
+        version = self.version(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+        with open(path, 'r') as file:
+            data = json.load(file)
+        with self._lock:
+            self._files[path] = (version, data)
+            self.parses += 1
+        return data
+
+    def fragment(self, key: Hashable, version: Hashable, render: Callable[[], str]) -> str:
+        """Returns the string rendered for key, calling render() only when version differs from the cached one."""
+        with self._lock:
+            cached = self._fragments.get(key)
+            if cached is not None and cached[0] == version:
+                self._fragments.move_to_end(key)
+                return cached[1]
+        text = render()
+        with self._lock:
+            self._fragments[key] = (version, text)
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_fragments:
+                self._fragments.popitem(last=False)
+        return text
+
+    def clear(self, path: Optional[str] = None) -> None:
+        """Forgets one file, or every file and fragment."""
+        with self._lock:
+            if path is not None:
+                self._files.pop(os.path.abspath(path), None)
+            else:
+                self._files.clear()
+                self._fragments.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "fragments": len(self._fragments),
+                "parses": self.parses,
+                "hits": self.hits,
+            }
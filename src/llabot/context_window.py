@@ -0,0 +1,92 @@
+from collections import deque
+from typing import Optional
+from .message_data import MessageData
+from .tokenizer_cache import count_message_tokens
+from . import logger
+
+class ContextWindow:
+    """
+    Picks which messages of a chat are sent to the model under a token budget. The system
+    message and the most recent turns are always kept. Once the prompt exceeds the budget,
+    the oldest turns are dropped until it is back under low_water of the budget, so the
+    window slides in steps rather than every turn (which keeps KV cache reuse high).
+    With overflow="fold", the most recent dropped turns are kept verbatim ("name: text") in
+    the system message, oldest first out once they pass the recap budget. The recap is not
+    a summary; the chat's summarizer condenses older messages in place, separately from this.
+    Token counts are memoized on each message, so a build only counts what is new. The budget
+    is measured in message content tokens, so the templated prompt is somewhat longer.
+    """
+    low_water = 0.75        # Fraction of the budget to trim down to once it is exceeded
+    recap_budget = 256      # Max tokens of dropped turns kept in the recap (and at most an eighth of the budget)
+    content_history = 256   # Turns whose content sizes are kept in content_tokens
+
+    def __init__(self, tokenizer_name: str, budget: int, keep_recent: int = 4, overflow: str = "fold"):
+        if overflow not in ("fold", "drop"):
+            raise ValueError(f"Unknown overflow strategy '{overflow}'.")
+        self.tokenizer_name: str = tokenizer_name
+        self.budget: int = budget
+        self.keep_recent: int = keep_recent
+        self.overflow: str = overflow
+        self.start: int = 1                 # First non-system message in the window
+        self._counts: list[int] = []        # Token count of every message counted so far
+        self._window_tokens: int = 0        # Tokens of messages[start:len(_counts)]
+        self._dirty_from: Optional[int] = None
+        self._recap: deque[tuple[str, int]] = deque()
+        self._recap_tokens: int = 0
+        # Message content tokens of the latest prompts, in order. An estimate of what is sent: the
+        # chat template's per-message tokens and the recap header are not counted.
+        self.last_content_tokens: int = 0
+        self.content_tokens: deque[int] = deque(maxlen=self.content_history)
+
+    def on_rewrite(self, first_index: int) -> None:
+        """Marks messages from first_index on as changed, so their counts are refreshed."""
+        self._dirty_from = first_index if self._dirty_from is None else min(self._dirty_from, first_index)
+
+    def build(self, messages: list[MessageData]) -> list[dict[str, str]]:
+        """Returns the role/content history to send, and records how many content tokens it holds."""
+        if not messages:
+            return []
+        self._refresh_counts(messages)
+        system_tokens = self._counts[0]
+        total = system_tokens + self._recap_tokens + self._window_tokens
+        if total > self.budget:
+            target = int(self.budget * self.low_water)
+            while total > target and len(messages) - self.start > self.keep_recent:
+                self._drop(messages[self.start], self._counts[self.start])
+                self._window_tokens -= self._counts[self.start]
+                self.start += 1
+                total = system_tokens + self._recap_tokens + self._window_tokens
+            logger.debug("Context window now starts at message %s (%s tokens).", self.start, total)
+        self.last_content_tokens = total
+        self.content_tokens.append(total)
+
+        system = messages[0]
+        history = [{"role": system.sender_role, "content": self._system_content(system.message)}]
+        history.extend(m.llm_view for m in messages[self.start:])
+        return history
+
+    def _refresh_counts(self, messages: list[MessageData]) -> None:
+        if self._dirty_from is not None:
+            for index in range(max(self._dirty_from, self.start), len(self._counts)):
+                self._window_tokens -= self._counts[index]
+            del self._counts[self._dirty_from:]
+            self._dirty_from = None
+        first_new = len(self._counts)
+        new_counts = count_message_tokens(self.tokenizer_name, messages[first_new:])
+        self._counts.extend(new_counts)
+        self._window_tokens += sum(new_counts[max(self.start - first_new, 0):])
+
+    def _drop(self, message: MessageData, tokens: int) -> None:
+        if self.overflow != "fold":
+            return
+        self._recap.append((f"{message.sender_name}: {message.message}", tokens))
+        self._recap_tokens += tokens
+        while self._recap_tokens > min(self.recap_budget, self.budget // 8) and self._recap:
+            _, dropped = self._recap.popleft()
+            self._recap_tokens -= dropped
+
+    def _system_content(self, content: str) -> str:
+        if not self._recap:
+            return content
+        recap = "\n".join(line for line, _ in self._recap)
+        return f"{content}\nEARLIER IN THE CONVERSATION:\n{recap}"
@@ -0,0 +1,82 @@
+import threading
+import time
+from typing import Optional, Sequence
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+from .metrics import Metrics
+
+class GenerationCancelled(RuntimeError):
+    """Raised when a turn's generation is cancelled before it finishes."""
+
+class CancelCriteria(StoppingCriteria):
+    """
+    Stops generation for every row whose cancel event is set. With several events, the batch is
+    split evenly between them, so beam search rows stop together with their turn.
+    """
+    def __init__(self, events: Sequence[threading.Event]):
+        self.events = list(events)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        rows_per_event = max(input_ids.shape[0] // len(self.events), 1)
+        flags = [event.is_set() for event in self.events for _ in range(rows_per_event)]
+        return torch.tensor(flags[:input_ids.shape[0]], dtype=torch.bool, device=input_ids.device)
+
+def cancel_criteria(*events: threading.Event) -> StoppingCriteriaList:
+    return StoppingCriteriaList([CancelCriteria(events)])
+
+class FirstTokenClock(StoppingCriteria):
+    """
+    Never stops generation; notes when the first new token is out, which splits a generate
+    call into prefill (up to the first token) and decode (the rest).
+    """
+    def __init__(self):
+        self.first_token: Optional[float] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+def timed_generation(generation_kwargs: dict) -> tuple[dict, FirstTokenClock]:
+    """Copies generation kwargs with a FirstTokenClock added to their stopping criteria."""
+    clock = FirstTokenClock()
+    criteria = StoppingCriteriaList(generation_kwargs.get("stopping_criteria") or [])
+    criteria.append(clock)
+    return dict(generation_kwargs, stopping_criteria=criteria), clock
+
+def record_generation_stages(start: float, clock: FirstTokenClock, labels: dict) -> None:
+    """Records the prefill and decode stages of a generate call that began at start."""
+    end = time.perf_counter()
+    first_token = clock.first_token or end
+    Metrics().observe("prefill", first_token - start, **labels)
+    Metrics().observe("decode", end - first_token, **labels)
+
+def generate_with_cache(model, tokenizer, chat_cache, history: list[dict[str, str]], metric_labels: Optional[dict] = None,
+                        message_count: Optional[int] = None, **generation_kwargs) -> str:
+    """
+    Generates a reply to a chat history, reusing and extending the chat's ChatKVCache so
+    only tokens that are not already cached get prefilled. Returns the decoded reply.
+    The prompt is checkpointed under message_count, the number of chat messages it was
+    built from (len(history) by default); pass it whenever a context window trims the
+    history, so the checkpoint lines up with the indices the chat invalidates.
+    Tokenize, prefill and decode times are recorded in Metrics under metric_labels.
+    """
+    labels = metric_labels or {}
+    start = time.perf_counter()
+    input_ids = tokenizer.apply_chat_template(history, add_generation_prompt=True, tokenize=True, return_dict=False)
+    Metrics().observe("tokenize", time.perf_counter() - start, **labels)
+    generation_kwargs, clock = timed_generation(generation_kwargs)
+    num_beams = generation_kwargs.get("num_beams") or 1
+    past_key_values = chat_cache.prepare(input_ids, num_beams)
+    inputs = torch.tensor([input_ids], device=model.device)
+    start = time.perf_counter()
+    output = model.generate(
+        input_ids=inputs,
+        attention_mask=torch.ones_like(inputs),
+        past_key_values=past_key_values,
+        pad_token_id=tokenizer.pad_token_id,
+        **generation_kwargs,
+    )
+    record_generation_stages(start, clock, labels)
+    chat_cache.update(input_ids, output[0].tolist(), len(history) if message_count is None else message_count, num_beams)
+    return tokenizer.decode(output[0, len(input_ids):], skip_special_tokens=True)
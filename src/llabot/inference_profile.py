@@ -0,0 +1,90 @@
+import os
+import sys
+from dataclasses import dataclass
+from typing import Optional
+import torch
+from . import logger
+
+@dataclass(frozen=True)
+class InferenceProfile:
+    """
+    How a model is loaded and run: dtype and device placement, plus CPU-only tuning
+    (dynamic int8 quantization of linear layers and torch.compile).
+    """
+    name: str
+    torch_dtype: str = "bfloat16"
+    device_map: Optional[str] = "auto"
+    quantize: Optional[str] = None              # "int8" for dynamic quantization of nn.Linear
+    compile: bool = False                       # Wrap the model's forward in torch.compile
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return getattr(torch, self.torch_dtype)
+
+    def prepare(self, model):
+        """Applies the profile's post-load optimizations and returns the model to use."""
+        if self.quantize == "int8":
+            from torch.ao.quantization import quantize_dynamic
+            model = quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        elif self.quantize is not None:
+            raise ValueError(f"Unknown quantization '{self.quantize}'.")
+        if self.compile:
+            try:
+                model.forward = torch.compile(model.forward, dynamic=True)
+            except Exception as e:
+                logger.warning("torch.compile is unavailable, running eagerly: %s", e)
+        return model
+
+def physical_cores() -> int:
+    return max((os.cpu_count() or 2) // 2, 1)
+
+def configure_threads(num_threads: Optional[int] = None, num_interop_threads: Optional[int] = None) -> None:
+    """
+    Sets torch's intra- and inter-op thread counts, e.g. configure_threads(physical_cores(), 1)
+    for CPU inference. They are process-wide, so nothing in llabot sets them on its own;
+    call this once at start-up, before any model is loaded. None leaves a count unchanged.
+    """
+    if num_threads is not None and torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads is not None and torch.get_num_interop_threads() != num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            logger.warning("Inter-op threads can only be set before torch starts parallel work; keeping %s.",
+                           torch.get_num_interop_threads())
+
+# Only "default" is used unless a preset, bot or ModelRegistry().profiles asks for another
+PROFILES: dict[str, InferenceProfile] = {
+    "default": InferenceProfile("default"),
+    "cpu": InferenceProfile("cpu", torch_dtype="float32", device_map="cpu", quantize="int8"),
+    "cpu-compiled": InferenceProfile("cpu-compiled", torch_dtype="float32", device_map="cpu", quantize="int8", compile=True),
+    "cpu-fp32": InferenceProfile("cpu-fp32", torch_dtype="float32", device_map="cpu"),
+}
+
+def default_profile() -> InferenceProfile:
+    """The unquantized bfloat16 load with automatic placement, on GPU and CPU alike."""
+    return PROFILES["default"]
+
+def get_profile(profile=None) -> InferenceProfile:
+    """Resolves a profile, a profile name or None (the default profile)."""
+    if profile is None:
+        return default_profile()
+    if isinstance(profile, InferenceProfile):
+        return profile
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown inference profile '{profile}'. Choose from: {', '.join(PROFILES)}.")
+    return PROFILES[profile]
+
+def resident_memory_bytes() -> int:
+    """Current resident set size of the process, or its peak where the current one is unavailable."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import torch
+from transformers import DynamicCache
+from . import logger
+
+class ChatKVCache:
+    """
+    The past key/values of one chat and the token ids they cover. Each turn reuses the
+    longest prefix shared with the new prompt, so only new tokens are prefilled.
+    """
+    def __init__(self, bytes_per_token: int = 0):
+        self.cache: Optional[DynamicCache] = None
+        self.token_ids: list[int] = []
+        self.checkpoints: dict[int, int] = {}    # Chat message count (windowed out ones included) -> prompt length in tokens
+        self.bytes_per_token: int = bytes_per_token
+        self.last_used: float = time.monotonic()
+        self.in_use: bool = False
+        self.reused_tokens: int = 0              # Tokens served from the cache on the last turn
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.token_ids) * self.bytes_per_token
+
+    def prepare(self, input_ids: list[int], num_beams: int = 1) -> DynamicCache:
+        """Crops the cache to the prefix it shares with input_ids and returns it for generate()."""
+        if self.cache is None:
+            self.cache = DynamicCache()
+            self.token_ids = []
+        shared = 0
+        for cached, new in zip(self.token_ids, input_ids):
+            if cached != new:
+                break
+            shared += 1
+        shared = min(shared, len(input_ids) - 1)  # generate() needs at least one uncached token
+        if shared < len(self.token_ids):
+            self._crop(shared)
+        self.reused_tokens = shared
+        if num_beams > 1 and shared:
+            self.cache.batch_repeat_interleave(num_beams)
+        return self.cache
+
+    def update(self, input_ids: list[int], sequence: list[int], message_count: int, num_beams: int = 1) -> None:
+        """Records what the cache covers after generate() has extended it."""
+        self.checkpoints[message_count] = len(input_ids)
+        if num_beams > 1:
+            # Beams diverge after the prompt; every row still holds the same prompt prefix.
+            crop_cache(self.cache, len(input_ids))
+            self.cache.batch_select_indices(torch.tensor([0], device=_cache_device(self.cache)))
+            self.token_ids = list(input_ids)
+        else:
+            self.token_ids = sequence[:self.cache.get_seq_length()]
+        self.last_used = time.monotonic()
+
+    def invalidate_from(self, message_index: int) -> None:
+        """Drops everything from the first token of message_index onward."""
+        keep = max((length for count, length in self.checkpoints.items() if count <= message_index), default=0)
+        self.checkpoints = {count: length for count, length in self.checkpoints.items() if count <= message_index}
+        if keep < len(self.token_ids):
+            self._crop(keep)
+
+    def clear(self) -> None:
+        self.cache = None
+        self.token_ids = []
+        self.checkpoints = {}
+
+    def _crop(self, length: int) -> None:
+        if length == 0:
+            self.cache = DynamicCache()
+        else:
+            crop_cache(self.cache, length)
+        self.token_ids = self.token_ids[:length]
+        # Checkpoints past the crop describe tokens that are gone, e.g. from before the context window slid
+        self.checkpoints = {count: end for count, end in self.checkpoints.items() if end <= length}
+
+def crop_cache(cache: DynamicCache, length: int) -> None:
+    """
+    Cuts a cache back to its first length tokens. Cropping to a positive length is deprecated
+    in transformers 5, so this passes the (negative) number of tokens to drop, which every
+    version with DynamicCache.crop understands.
+    """
+    excess = cache.get_seq_length() - length
+    if excess > 0:
+        cache.crop(-excess)
+
+def _cache_device(cache: DynamicCache):
+    layers = getattr(cache, "layers", None)
+    if layers:
+        return layers[0].keys.device
+    return cache.key_cache[0].device
+
+def bytes_per_token(model) -> int:
+    """Estimates the key/value bytes one token costs across every layer of a model."""
+    config = model.config
+    kv_heads = getattr(config, "num_key_value_heads", None) or config.num_attention_heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // config.num_attention_heads
+    element_size = torch.tensor([], dtype=model.dtype).element_size()
+    return 2 * config.num_hidden_layers * kv_heads * head_dim * element_size
+
+class KVCacheManager:
+    """
+    Process-wide owner of every chat's KV cache. When the caches together exceed
+    max_bytes, the least recently used idle caches are dropped.
+    """
+    _instance = None
+    max_bytes = 2 * 1024 ** 3
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(KVCacheManager, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.initialized = True
+            self._lock = threading.Lock()
+            self._caches: OrderedDict[str, ChatKVCache] = OrderedDict()
+            self.evictions: int = 0
+
+    @contextmanager
+    def checkout(self, chat_id: str, model) -> Iterator[ChatKVCache]:
+        """Lends a chat's cache for one turn, then enforces the memory cap."""
+        with self._lock:
+            chat_cache = self._caches.get(chat_id)
+            if chat_cache is None:
+                chat_cache = ChatKVCache(bytes_per_token(model))
+                self._caches[chat_id] = chat_cache
+            self._caches.move_to_end(chat_id)
+            chat_cache.in_use = True
+        try:
+            yield chat_cache
+        except BaseException:
+            chat_cache.clear()  # A failed generate may leave the cache half-extended
+            raise
+        finally:
+            with self._lock:
+                chat_cache.in_use = False
+                self._enforce_budget()
+
+    def invalidate(self, chat_id: str, message_index: int) -> None:
+        """Drops a chat's cached tokens from message_index onward, e.g. after older messages were rewritten."""
+        with self._lock:
+            chat_cache = self._caches.get(chat_id)
+            # While a turn is generating, the prefix check on the next turn catches the change instead.
+            if chat_cache is not None and not chat_cache.in_use:
+                chat_cache.invalidate_from(message_index)
+
+    def discard(self, chat_id: str) -> None:
+        with self._lock:
+            self._caches.pop(chat_id, None)
+
+    def _enforce_budget(self) -> None:
+        total = sum(c.size_bytes for c in self._caches.values())
+        for chat_id in list(self._caches):
+            if total <= self.max_bytes:
+                break
+            chat_cache = self._caches[chat_id]
+            if chat_cache.in_use:
+                continue
+            total -= chat_cache.size_bytes
+            del self._caches[chat_id]
+            self.evictions += 1
+            logger.debug("Dropped the KV cache of idle chat %s.", chat_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "chats": len(self._caches),
+                "cached_tokens": sum(len(c.token_ids) for c in self._caches.values()),
+                "memory_bytes": sum(c.size_bytes for c in self._caches.values()),
+                "evictions": self.evictions,
+            }
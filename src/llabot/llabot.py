@@ -2,10 +2,16 @@ from .llm_bot import LLMBot
 from .llm_model import LLMModel
 from . import UserData
 from .message_data import MessageData
-from . import logger
+from .model_registry import ModelRegistry
+from .scheduler import BatchScheduler
+from . import logger, Metrics
+from concurrent.futures import Future
+from typing import Iterator, Optional
 
 class LLaBot:
   _instance = None
+  batch_max_size = 8      # Most turns sharing one generate call
+  batch_max_wait = 0.01   # Seconds a turn may wait for others to batch with
   
   def __new__(cls, *args, **kwargs):
     if not cls._instance:
@@ -16,12 +22,16 @@ class LLaBot:
     if not hasattr(self, 'initialized'):
       self.initialized = True
       self.bot_pool: list[LLMBot] = []
+      self.scheduler = BatchScheduler(self.batch_max_size, self.batch_max_wait)
   
-  def add_bot(self, persona_name: str = "generic", model_type: LLMModel = LLMModel.SMALL):
-    self.bot_pool.append(LLMBot(persona_name, model_type))
+  def add_bot(self, persona_name: str = "generic", model_type: LLMModel = LLMModel.SMALL, prefetch: bool = False, inference_profile: Optional[str] = None, draft_model: Optional[LLMModel] = None):
+    bot = LLMBot(persona_name, model_type, inference_profile, draft_model)
+    if prefetch:
+      bot.prefetch_model()
+    self.bot_pool.append(bot)
     
-  def start_chat(self, bot_num: int, user_data: UserData, preset_name: str = "realism"):
-    self.bot_pool[bot_num].chat_start(preset_name, user_data)
+  def start_chat(self, bot_num: int, user_data: UserData, preset_name: str = "realism", blocking: bool = True) -> Future:
+    return self.bot_pool[bot_num].chat_start(preset_name, user_data, blocking=blocking)
     
   def end_chat(self, bot_num: int):
     self.bot_pool[bot_num].chat_end()
@@ -30,7 +40,42 @@ class LLaBot:
     bot = self.bot_pool.pop(bot_num)
     if bot.is_active:
       bot.chat_end()
+    bot.release_model()
     del bot
     
-  def generate_response(self, bot_num: int, prompt: str) -> str:
-    return self.bot_pool[bot_num].generate_response(prompt)
\ No newline at end of file
+  def generate_response(self, bot_num: int, prompt: str, wait: bool = True) -> str:
+    return self.bot_pool[bot_num].generate_response(prompt, wait=wait, scheduler=self.scheduler)
+
+  def configure_batching(self, max_batch_size: Optional[int] = None, max_wait: Optional[float] = None):
+    self.scheduler.configure(max_batch_size, max_wait)
+
+  def stream_response(self, bot_num: int, prompt: str, wait: bool = True) -> Iterator[str]:
+    return self.bot_pool[bot_num].stream_response(prompt, wait=wait)
+
+  def bot_status(self, bot_num: int) -> str:
+    return self.bot_pool[bot_num].status
+
+  def summarization_pending(self, bot_num: int) -> bool:
+    chat = self.bot_pool[bot_num].llm_chat
+    return bool(chat and chat.summarization_pending)
+
+  def model_stats(self) -> dict:
+    return ModelRegistry().stats()
+
+  def speculative_stats(self, bot_num: int) -> dict:
+    return self.bot_pool[bot_num].speculative_report()
+
+  def batch_stats(self) -> dict:
+    return self.scheduler.stats()
+
+  def metrics_snapshot(self) -> dict:
+    """Count, sum and p50/p90/p99 of every stage timing, labeled by model, persona and bot."""
+    return Metrics().snapshot()
+
+  def export_metrics(self, format: str = "prometheus") -> str:
+    """The metrics as Prometheus text or as JSON."""
+    if format == "prometheus":
+      return Metrics().to_prometheus()
+    if format == "json":
+      return Metrics().to_json()
+    raise ValueError(f"Unknown metrics format '{format}'. Choose 'prometheus' or 'json'.")
\ No newline at end of file
@@ -1,61 +1,213 @@
 from . import logger
 from .llm_model import LLMModel
-from typing import Optional
+from typing import Iterator, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
 from transformers.pipelines.base import Pipeline
-from transformers import pipeline
 from .llm_chat import LLMChat
+from .context_window import ContextWindow
 from .persona_data import PersonaData
 from .llm_preset import LLMPreset
 from . import UserData
-from . import Timer
-import torch
-from .weather import get_weather_info
+from . import Timer, Metrics
+from .weather import get_weather_info, WeatherClient
 from .message_data import MessageData
 import re
+import threading
+import time
+import uuid
 from . import SceneData
-from transformers import AutoTokenizer
+from .tokenizer_cache import count_tokens
+from transformers import TextIteratorStreamer
+from .model_registry import ModelRegistry, ModelHandle
+from .scheduler import BatchScheduler
+from .generation import GenerationCancelled, cancel_criteria, generate_with_cache, record_generation_stages, timed_generation
+from .kv_cache import KVCacheManager
+from .speculative import SpeculativeStats, count_forwards, tokenizers_compatible
+
+_SENTENCE_END = re.compile(r'[.?!](?=\s)')
+
+def _last_sentence_end(text: str) -> int:
+  """Index just past the last sentence-ending punctuation that is followed by whitespace, or 0."""
+  end = 0
+  for match in _SENTENCE_END.finditer(text):
+    end = match.end()
+  return end
+
+class BotWarmingError(RuntimeError):
+  """Raised when a response is requested before the chat has finished starting."""
 
 class LLMBot:
   api_key = "YOUR_API_KEY_HERE"
-  def __init__(self, persona_name: str, model_type: Optional[LLMModel]):
+  _executor = ThreadPoolExecutor(thread_name_prefix="llabot-chat-start")
+  kv_cache_enabled = True   # Keep each chat's past key/values between turns
+  def __init__(self, persona_name: str, model_type: Optional[LLMModel], inference_profile: Optional[str] = None, draft_model: Optional[LLMModel] = None):
     logger.debug("Attempting to instance a bot.")
     timer = Timer()
+    self.bot_id: str = uuid.uuid4().hex[:8]
     self.llm_model: Optional[LLMModel] = model_type
+    self.inference_profile: Optional[str] = inference_profile   # None for the registry's choice for the model
     self.persona_data: Optional[PersonaData] = PersonaData(persona_name)
     self.llm_chat: Optional[LLMChat] = None
     self.llm_preset: Optional[LLMPreset] = None
     self.pipe: Optional[Pipeline] = None
+    self.model_handle: Optional[ModelHandle] = None
+    self._model_future: Optional[Future] = None
+    self.draft_model: Optional[LLMModel] = draft_model   # Proposes tokens for the bot's model to verify, None to decode plainly
+    self.draft_handle: Optional[ModelHandle] = None
+    self._draft_future: Optional[Future] = None
+    self.speculative_stats: SpeculativeStats = SpeculativeStats()
+    self.last_turn_assisted: bool = False
+    self.last_turn_batched: bool = False   # Whether the last reply came from a batched generate call
+    self._ready: Optional[Future] = None
     self.user_data: Optional[UserData] = None
     self.is_active: bool = False
+    self.last_time_to_first_token: Optional[float] = None
+    self.last_tokens_per_second: Optional[float] = None
     elapsed = timer.stop()
-    logger.debug(f"A bot instance has been created in {elapsed}.")
+    logger.debug("A bot instance has been created in %s.", elapsed)
+
+  @property
+  def metric_labels(self) -> dict:
+    """Labels for this bot's stage timings in Metrics."""
+    return {"model": self.llm_model.name, "persona": self.persona_data.name, "bot": self.bot_id}
   
-  def chat_start(self, preset_name: str, user_data: UserData):
-    if not self.is_active:
-      logger.debug("Attempting to start a chat.")
-      self.is_active = True
-      timer = Timer()
+  def chat_start(self, preset_name: str, user_data: UserData, blocking: bool = True) -> Future:
+    """
+    Starts a chat. The model loads in the background while the system message is assembled.
+    With blocking=False this returns immediately; the returned future resolves once the bot is ready.
+    """
+    if self.is_active:
+      logger.warning("Attempted to restart chat instance, already active.")
+      return self._ready
+    logger.debug("Attempting to start a chat.")
+    self.is_active = True
+    # Load the model with the preset's profile from the start, rather than loading the bot's and then swapping
+    preset_profile = self._preset_profile(preset_name)
+    if preset_profile is not None:
+      self.inference_profile = preset_profile
+    self.prefetch_model()
+    if user_data.weather_enabled:
+      WeatherClient().prefetch(LLMBot.api_key, user_data.lat, user_data.lon)
+    self._ready = LLMBot._executor.submit(self._start_chat, preset_name, user_data)
+    if blocking:
+      self._ready.result()
+    return self._ready
+
+  def _start_chat(self, preset_name: str, user_data: UserData):
+    timer = Timer("chat_start", **self.metric_labels)
+    try:
       self.user_data = user_data
-      self.llm_preset = LLMPreset.load_from_json(preset_name)
+      if self.persona_data.reload_if_changed():
+        logger.debug("Persona file changed, reloaded persona data.")
+      with Timer("preset_load", **self.metric_labels):
+        self.llm_preset = LLMPreset.load_from_json(preset_name)
       logger.debug("Loaded LLM preset.")
+      self._apply_preset_profile()
+      self._prefetch_draft()
       self.llm_chat = LLMChat()
+      self.llm_chat.summarizer_name = self.llm_preset.summarizer
+      chat_id = self.llm_chat.chat_id
+      self.llm_chat.rewrite_listeners.append(lambda index: KVCacheManager().invalidate(chat_id, index))
+      prompt_budget = self.llm_model.context_budget - self.llm_preset.max_length
+      self.llm_chat.set_context_window(ContextWindow(self.llm_model.value, prompt_budget, keep_recent=LLMChat.recent_skip))
       logger.debug("Loaded chat instance.")
-      self.pipe = pipeline(
-          "text-generation",
-          model=self.llm_model.value,
-          torch_dtype=torch.bfloat16,
-          device_map="auto",
-      )
-      logger.debug("Loaded the LLM transformer pipeline.")
-      sys_msg = self._construct_system_message()
+      with Timer("system_message", **self.metric_labels):
+        sys_msg = self._construct_system_message()
       self.llm_chat.chat_start()
       self.llm_chat.add_message(MessageData("System", "system", sys_msg))
-      elapsed = timer.stop()
-      logger.debug(f"Presumably chat was started in {elapsed}.")
-    else:
-      logger.warning("Attempted to restart chat instance, already active.")
-      
+      with Timer("model_wait", **self.metric_labels):
+        self.model_handle = self._model_future.result()
+      self.pipe = self.model_handle.pipe
+      logger.debug("Acquired the LLM transformer pipeline.")
+      self._attach_draft()
+    except Exception:
+      logger.error("Chat failed to start.")
+      self.release_model()
+      self.is_active = False
+      raise
+    elapsed = timer.stop()
+    logger.debug("Presumably chat was started in %s.", elapsed)
+
+  def prefetch_model(self) -> Future:
+    """Begins loading this bot's model in the background, if it isn't already."""
+    if self._model_future is None:
+      self._model_future = ModelRegistry().acquire_async(self.llm_model, self.inference_profile)
+    return self._model_future
+
+  @staticmethod
+  def _preset_profile(preset_name: str) -> Optional[str]:
+    """The inference profile a preset names, or None. A preset that fails to load is reported by _start_chat."""
+    try:
+      return LLMPreset.load_from_json(preset_name).inference_profile
+    except (FileNotFoundError, ValueError, TypeError):
+      return None
+
+  def _apply_preset_profile(self):
+    """Switches to the preset's inference profile, if it names one other than the model being loaded."""
+    registry = ModelRegistry()
+    if self.llm_preset.inference_profile is None:
+      return
+    if registry.resolve_profile(self.llm_model, self.llm_preset.inference_profile) == registry.resolve_profile(self.llm_model, self.inference_profile):
+      return
+    logger.debug("Preset asks for the %s inference profile, reloading the model.", self.llm_preset.inference_profile)
+    self.release_model()
+    self.inference_profile = self.llm_preset.inference_profile
+    self.prefetch_model()
+
+  def _prefetch_draft(self):
+    """Begins loading the draft model named by the preset or the bot, from the shared registry."""
+    if self.llm_preset.draft_model is not None:
+      self.draft_model = LLMModel[self.llm_preset.draft_model]
+    if self.draft_model is None or self.draft_model == self.llm_model or self._draft_future is not None:
+      return
+    # The draft runs alongside the bot's model, so it is loaded with the same profile
+    registry = ModelRegistry()
+    self._draft_future = registry.acquire_async(self.draft_model, registry.resolve_profile(self.llm_model, self.inference_profile))
+
+  def _attach_draft(self):
+    """Enables speculative decoding once the draft is loaded, unless it can't propose tokens for the bot's model."""
+    if self._draft_future is None:
+      return
+    try:
+      self.draft_handle = self._draft_future.result()
+    except Exception as e:
+      logger.warning("Draft model %s failed to load, decoding without it: %s", self.draft_model.name, e)
+      self._release_draft()
+      return
+    if not tokenizers_compatible(self.model_handle.tokenizer, self.draft_handle.tokenizer):
+      logger.warning("Draft model %s does not share %s's tokenizer, decoding without it.", self.draft_model.name, self.llm_model.name)
+      self._release_draft()
+      return
+    logger.debug("Speculative decoding with %s as the draft model.", self.draft_model.name)
+
+  def _release_draft(self):
+    future, self._draft_future = self._draft_future, None
+    self.draft_handle = None
+    if future is not None and future.exception() is None:
+      future.result().release()
+
+  def release_model(self):
+    """Hands the model and its draft back to the registry, waiting out loads that are still in flight."""
+    future, self._model_future = self._model_future, None
+    self.pipe = None
+    self.model_handle = None
+    if future is not None and future.exception() is None:
+      future.result().release()
+    self._release_draft()
+
+  @property
+  def status(self) -> str:
+    """One of 'inactive', 'warming', 'ready' or 'failed'."""
+    if self._ready is None:
+      return "inactive"
+    if not self._ready.done():
+      return "warming"
+    if self._ready.exception() is not None:
+      return "failed"
+    return "ready"
+
   def _construct_system_message(self):
+    """Assembles the system message from prompt fragments memoized by the config store."""
     SYSTEM_MESSAGE = f"USE THE FOLLOWING INFORMATION FOR REFERENCE AND INSTRUCTION.\nNEVER BREAK CHARACTER UNDER ANY CIRCUMSTANCE.\nINFO ABOUT YOURSELF:\n{self.persona_data.to_llm_string()}"
     if self.user_data.weather_enabled:
       weather_info = get_weather_info(LLMBot.api_key, self.user_data.lat, self.user_data.lon)
@@ -69,24 +221,174 @@ class LLMBot:
   def chat_end(self):
     logger.debug("Attempting to end a chat.")
     timer = Timer()
+    if self._ready is not None:
+      self._ready.exception()  # Let a chat that is still warming finish starting before tearing it down
+      self._ready = None
+    if self.llm_chat:
+      self.llm_chat.chat_end()
+      KVCacheManager().discard(self.llm_chat.chat_id)
     del self.llm_chat
     self.llm_chat = None
     del self.llm_preset
     self.llm_preset = None
-    del self.pipe
-    self.pipe = None
+    self.release_model()
     del self.user_data
     self.user_data = None
     self.is_active = False
     elapsed = timer.stop()
-    logger.debug(f"Presumably chat was ended in {elapsed}.")
+    logger.debug("Presumably chat was ended in %s.", elapsed)
   
-  def generate_response(self, prompt: str):
+  def generate_response(self, prompt: str, wait: bool = True, timeout: Optional[float] = None, scheduler: Optional[BatchScheduler] = None, cancel_event: Optional[threading.Event] = None):
+    """
+    Generates a reply. If the chat is still warming, waits for it or raises BotWarmingError when wait=False.
+    With a scheduler, the turn is queued so it can share a batched generate call with other sessions.
+    A turn that is batched with others skips the chat's KV cache and the draft model; one that
+    runs alone (always the case when no other session is generating) keeps both.
+    Setting cancel_event stops generation early and raises GenerationCancelled; neither the
+    prompt nor the reply is kept in the chat.
+    """
+    self._wait_until_ready(wait, timeout)
     logger.debug("Attempting to generate a response.")
-    timer = Timer()
-    self.llm_chat.add_message(MessageData(self.user_data.name, "user", prompt))
-    outputs = self.pipe(
-      self.llm_chat.get_message_history(),
+    timer = Timer("turn", **self.metric_labels)
+    start = time.perf_counter()
+    message, history = self._begin_turn(prompt)
+    kwargs = self._generation_kwargs()
+    solo_kwargs = self._assisted(dict(kwargs))
+    self.last_turn_assisted = False
+    self.last_turn_batched = scheduler is not None  # Cleared by _generate_single if the turn runs alone
+    if cancel_event is not None:
+      solo_kwargs["stopping_criteria"] = cancel_criteria(cancel_event)
+    try:
+      if scheduler:
+        solo = lambda: self._generate_single(history, solo_kwargs)
+        response = scheduler.submit(self.model_handle.key, self.pipe, history, kwargs, cancel_event, solo).result()
+      else:
+        response = self._generate_single(history, solo_kwargs)
+      if cancel_event is not None and cancel_event.is_set():
+        raise GenerationCancelled("The response was cancelled.")
+    except GenerationCancelled:
+      self._cancel_turn(message)
+      raise
+    self._record_throughput(response, time.perf_counter() - start)
+    trimmed_response = self._finish_turn(response)
+    elapsed = timer.stop()
+    logger.debug("Presumably a response was generated in %s.", elapsed)
+    return trimmed_response
+
+  def stream_response(self, prompt: str, wait: bool = True, timeout: Optional[float] = None, cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+    """
+    Yields the reply in chunks as the model produces it. Chunks are released at sentence
+    boundaries, so the streamed text matches the trimmed reply stored in the chat.
+    Beam search cannot stream, so streaming always decodes with a single beam.
+    Closing the iterator early or setting cancel_event stops generation and takes the prompt back
+    out of the chat.
+    """
+    self._wait_until_ready(wait, timeout)
+    logger.debug("Attempting to stream a response.")
+    timer = Timer("turn", **self.metric_labels)
+    start = time.perf_counter()
+    streamer = TextIteratorStreamer(self.pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    kwargs = self._generation_kwargs()
+    kwargs["num_beams"] = 1
+    kwargs = self._assisted(kwargs)
+    self.last_turn_assisted = False
+    cancel_event = cancel_event or threading.Event()
+    kwargs["stopping_criteria"] = cancel_criteria(cancel_event)
+    result = {}
+
+    def run(history):
+      try:
+        result["response"] = self._generate_single(history, dict(kwargs, streamer=streamer))
+      except BaseException as e:
+        result["error"] = e
+        streamer.end()
+
+    message, history = self._begin_turn(prompt)
+    thread = threading.Thread(target=run, args=(history,), name="llabot-stream", daemon=True)
+    thread.start()
+    emitted = ""
+    pending = ""
+    finished = False
+    try:
+      for text in streamer:
+        if not emitted and not pending and text:
+          self.last_time_to_first_token = time.perf_counter() - start
+          Metrics().observe("first_text", self.last_time_to_first_token, **self.metric_labels)
+          logger.debug("First streamed text arrived after %.3fs.", self.last_time_to_first_token)
+        pending += text
+        boundary = _last_sentence_end(pending)
+        if boundary:
+          chunk, pending = pending[:boundary], pending[boundary:]
+          emitted += chunk
+          yield chunk
+      finished = True
+    finally:
+      if not finished:
+        cancel_event.set()
+      thread.join()
+      if cancel_event.is_set():
+        self._cancel_turn(message)
+    if "error" in result:
+      raise result["error"]
+    if cancel_event.is_set():
+      raise GenerationCancelled("The response was cancelled.")
+    self._record_throughput(result["response"], time.perf_counter() - start)
+    trimmed_response = self._finish_turn(result["response"])
+    if trimmed_response.startswith(emitted):
+      if len(trimmed_response) > len(emitted):
+        yield trimmed_response[len(emitted):]
+    else:
+      logger.warning("Streamed text diverged from the final response.")
+    elapsed = timer.stop()
+    logger.debug("Presumably a response was streamed in %s.", elapsed)
+
+  def _generate_single(self, history: list[dict[str, str]], kwargs: dict) -> str:
+    """
+    Generates one chat's reply on its own, reusing the chat's KV cache when enabled.
+    With a draft model attached, the reply is decoded speculatively and its forward passes counted.
+    """
+    self.last_turn_batched = False
+    if "assistant_model" not in kwargs:
+      return self._decode(history, kwargs)
+    with count_forwards(self.pipe.model, kwargs["assistant_model"]) as counts:
+      response = self._decode(history, kwargs)
+    self.speculative_stats.record(self.count_tokens(response), counts["target"], counts["draft"])
+    self.last_turn_assisted = True
+    return response
+
+  def _decode(self, history: list[dict[str, str]], kwargs: dict) -> str:
+    if not self.kv_cache_enabled:
+      # The pipeline tokenizes inside the call, so here prefill includes tokenization
+      kwargs, clock = timed_generation(kwargs)
+      start = time.perf_counter()
+      response = self.pipe(history, **kwargs)[0]["generated_text"][-1]["content"]
+      record_generation_stages(start, clock, self.metric_labels)
+      return response
+    with KVCacheManager().checkout(self.llm_chat.chat_id, self.pipe.model) as chat_cache:
+      # Checkpoints count every message of the chat, the way rewrites are reported, not just the windowed ones
+      return generate_with_cache(self.pipe.model, self.pipe.tokenizer, chat_cache, history, self.metric_labels, len(self.llm_chat.messages), **kwargs)
+
+  def _assisted(self, kwargs: dict) -> dict:
+    """Adds the draft model to single-turn generation kwargs; assisted generation only supports one beam."""
+    if self.draft_handle is not None and kwargs.get("num_beams", 1) == 1:
+      kwargs["assistant_model"] = self.draft_handle.model
+    return kwargs
+
+  def _begin_turn(self, prompt: str) -> tuple[MessageData, list[dict[str, str]]]:
+    """Records the user's message and returns it with the history to prompt the model with."""
+    message = MessageData(self.user_data.name, "user", prompt)
+    self.llm_chat.add_message(message)
+    history = self.llm_chat.build_prompt()
+    logger.debug("Sending about %s message content tokens to the model.", self.llm_chat.context_window.last_content_tokens)
+    return message, history
+
+  def _cancel_turn(self, message: MessageData):
+    """Takes back the user's message of a cancelled turn, so the chat matches what the user saw."""
+    if self.llm_chat is not None and self.llm_chat.retract_message(message):
+      logger.debug("Turn cancelled, took back the user's message.")
+
+  def _generation_kwargs(self) -> dict:
+    return dict(
       max_new_tokens=self.llm_preset.max_length,
       temperature=self.llm_preset.temperature,
       top_p=self.llm_preset.top_p,
@@ -95,14 +397,40 @@ class LLMBot:
       num_beams=self.llm_preset.num_beams,
       length_penalty=self.llm_preset.length_penalty,
     )
-    response = outputs[0]["generated_text"][-1]
-    trimmed_response = self._trim_after_last_punctuation(response['content'])
+
+  def _record_throughput(self, response: str, seconds: float):
+    """
+    Feeds the reply's length into this bot's tokens/sec figure, and into the model's unless the
+    turn was batched: the model's plain and assisted figures both come from lone turns, so the
+    speculative speedup compares one code path with and without the draft.
+    """
+    tokens = self.count_tokens(response)
+    self.last_tokens_per_second = tokens / seconds if seconds > 0 else None
+    if self.model_handle is not None and not self.last_turn_batched:
+      self.model_handle.record_generation(tokens, seconds, assisted=self.last_turn_assisted)
+
+  def speculative_report(self) -> dict:
+    """Approximate acceptance rate of the draft model's tokens and the speedup over plain decoding of the same model."""
+    report = self.speculative_stats.report()
+    report["draft_model"] = self.draft_model.name if self.draft_handle is not None else None
+    report["speedup"] = self.model_handle.speculative_speedup if self.model_handle is not None else None
+    return report
+
+  def _finish_turn(self, response: str) -> str:
+    """Trims the raw reply, records it and runs the summarization bookkeeping."""
+    with Timer("trim", **self.metric_labels):
+      trimmed_response = self._trim_after_last_punctuation(response)
     self.llm_chat.add_message(MessageData(self.persona_data.name, "assistant", trimmed_response))
-    elapsed = timer.stop()
-    logger.debug(f"Presumably a response was generated in {elapsed}.")
     self.llm_chat.check_and_summarize()
     return trimmed_response
-    
+
+  def _wait_until_ready(self, wait: bool, timeout: Optional[float]):
+    if self._ready is None:
+      raise RuntimeError("Chat has not started yet.")
+    if not self._ready.done() and not wait:
+      raise BotWarmingError("The bot is still warming up.")
+    self._ready.result(timeout)
+
   def _trim_after_last_punctuation(self, text: str) -> str:
     # Find all occurrences of sentence-ending punctuation (., ?, or !)
     matches = re.findall(r'[.?!](?=\s|$)', text)
@@ -117,9 +445,4 @@ class LLMBot:
     """
     Count the number of tokens in a given text for a Hugging Face model.
     """
-    # Load the tokenizer
-    tokenizer = AutoTokenizer.from_pretrained(self.llm_model.value)
-    
-    # Tokenize the text and count tokens
-    tokenized = tokenizer(text, return_tensors=None)
-    return len(tokenized["input_ids"])
\ No newline at end of file
+    return count_tokens(self.llm_model.value, [text])[0]
\ No newline at end of file
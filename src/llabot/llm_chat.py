@@ -1,19 +1,23 @@
-import json
 from datetime import datetime
-from typing import Dict
+from typing import Callable, Dict
 import uuid
 from .message_data import MessageData
 from typing import Optional
 import os
-from transformers import AutoTokenizer
-from datasets import Dataset
+import threading
+from concurrent.futures import Future
 from . import Timer, logger
-from .summarizer import Summarizer
+from .chat_log import ChatLogWriter
+from .context_window import ContextWindow
+from .summarizer import summarizer_type
+from .summarization_service import SummarizationService
 
 class LLMChat:
     summarize_interval = 8  # How many new messages trigger summarization
     recent_skip = 4         # How many latest messages to skip for summarization
     max_length = 130        # Max token length before summarization
+    log_fsync = False       # Force chat log writes onto disk on every flush
+    summarizer_name = "abstractive"  # Strategy from summarizer.SUMMARIZERS
     def __init__(self):
         timer = Timer()
         self.chat_id: str = str(uuid.uuid4())
@@ -21,20 +25,47 @@ class LLMChat:
         self.chat_start_time: Optional[datetime] = None
         self.chat_end_time: Optional[datetime] = None
         self.chat_log_file: Optional[str] = None
+        self.chat_log: Optional[ChatLogWriter] = None
         self.summarize_index: int = 1
-        self.summarizer = Summarizer()
+        self.rewrite_listeners: list[Callable[[int], None]] = []  # Told the first index whenever messages are rewritten or retracted
+        self.context_window: Optional[ContextWindow] = None
+        self._summary_job: Optional[Future] = None
+        self._lock = threading.RLock()  # Guards messages against summaries applied from the worker
         elapsed = timer.stop()
-        logger.debug(f"A ChatInstance has been created in {elapsed}.")
+        logger.debug("A ChatInstance has been created in %s.", elapsed)
 
     def chat_start(self):
         self.chat_start_time = datetime.now()
         self.create_chat_log()
 
+    def chat_end(self):
+        self.wait_for_summarization()
+        self.chat_end_time = datetime.now()
+        if self.chat_log:
+            self.chat_log.write("chat_ended", end_time=self.chat_end_time.isoformat())
+            self.chat_log.close()
+
     def add_message(self, message_data: MessageData) -> None:
         if not isinstance(message_data, MessageData):
             raise ValueError("message_data must be an instance of MessageData")
-        self.messages.append(message_data)
-        self.append_to_chat_log(message_data.to_dict(), len(self.messages) - 1)
+        with self._lock:
+            self.messages.append(message_data)
+            self.append_to_chat_log(message_data.to_dict(), len(self.messages) - 1)
+
+    def retract_message(self, message_data: MessageData) -> bool:
+        """
+        Takes back the latest message, e.g. the user's turn when its reply was cancelled, and
+        logs its removal. Returns False, changing nothing, if it is no longer the latest message.
+        """
+        with self._lock:
+            if not self.messages or self.messages[-1] is not message_data:
+                return False
+            self.messages.pop()
+            index = len(self.messages)
+            self.append_to_chat_log({"message_id": message_data.message_id}, index, event="message_removed")
+            for listener in self.rewrite_listeners:
+                listener(index)
+            return True
 
     def _format_llm_text(self, role: str, content: str, include_metadata: bool = False, message_data: MessageData = None):
         message_dict = {"role": role, "content": content}
@@ -43,81 +74,112 @@ class LLMChat:
         return message_dict
 
     def get_message_history(self) -> list[dict[str, str]]:
-        message_history = []
-        for message in self.messages:
-            message_history.append(self._format_llm_text(message.sender_role, message.message))
-        return message_history
+        """The role/content history of every message."""
+        return [message.llm_view for message in self.messages]
+
+    def set_context_window(self, context_window: ContextWindow) -> None:
+        """Bounds the prompts built by build_prompt with a token-budgeted window."""
+        self.context_window = context_window
+        self.rewrite_listeners.append(context_window.on_rewrite)
+
+    def build_prompt(self) -> list[dict[str, str]]:
+        """The history to send to the model: the context window if one is set, otherwise every message."""
+        with self._lock:
+            if self.context_window:
+                return self.context_window.build(self.messages)
+            return self.get_message_history()
 
     def create_chat_log(self):
-        """Creates a JSON file to store the chat log."""
+        """Creates an append-only JSON-lines file to store the chat log."""
         if not self.chat_start_time:
             raise RuntimeError("Chat has not started yet.")
         chat_log_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "chat_logs"))
 
-        filename = os.path.abspath(os.path.join(chat_log_dir, f"chat_{self.chat_start_time.strftime('%Y%m%d_%H%M%S')}.json"))
-        self.chat_log_file = filename
-
-        chat_log = {
-            "chat_id": self.chat_id,
-            "start_time": self.chat_start_time.isoformat(),
-            "messages": []
-        }
-
-        with open(filename, 'w') as file:
-            json.dump(chat_log, file, indent=4)
-        logger.debug(f"A chat log has been created at: {filename}.")
+        # The chat id suffix keeps chats started within the same second from sharing a file.
+        self.chat_log = ChatLogWriter.create(chat_log_dir, f"chat_{self.chat_start_time.strftime('%Y%m%d_%H%M%S')}", self.chat_id, fsync=self.log_fsync)
+        self.chat_log_file = self.chat_log.path
+        self.chat_log.write("chat_started", chat_id=self.chat_id, start_time=self.chat_start_time.isoformat())
+        logger.debug("A chat log has been created at: %s.", self.chat_log_file)
 
-    def append_to_chat_log(self, message_dict: Dict, message_number: int):
-        """Appends a message to the JSON chat log."""
-        if not self.chat_log_file:
+    def append_to_chat_log(self, message_dict: Dict, message_number: int, event: str = "message_added"):
+        """Queues a message event for the chat log: 'message_added', 'message_updated' or 'message_removed'."""
+        if not self.chat_log:
             raise RuntimeError("Chat log file does not exist. Call create_chat_log first.")
+        self.chat_log.write(event, message_number=message_number, **message_dict)
 
-        try:
-            with open(self.chat_log_file, 'r') as file:
-                chat_log = json.load(file)
-
-            chat_log["messages"].append({
-                "message_number": message_number,
-                **message_dict
-            })
-
-            with open(self.chat_log_file, 'w') as file:
-                json.dump(chat_log, file, indent=4)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            raise RuntimeError("Failed to append to chat log file.") from e
-        
     def _get_summarizable_data(self):
         """Extracts messages for summarization."""
         start_idx = self.summarize_index
         end_idx = len(self.messages) - self.recent_skip
-        logger.debug(f"Processing from {start_idx} to {end_idx}.")
+        logger.debug("Processing from %s to %s.", start_idx, end_idx)
 
         summarizable_data = []
-        tokenizer = AutoTokenizer.from_pretrained("facebook/bart-large-cnn")
-        for i in range(start_idx, end_idx):
-            tokenized_input = tokenizer(self.messages[i].message, return_tensors="pt")
-            token_length = tokenized_input['input_ids'].size(1)
+        # Measured the way the chat's strategy measures, so extractive chats never load a tokenizer
+        token_lengths = summarizer_type(self.summarizer_name).message_lengths(self.messages[start_idx:end_idx])
+        for i, token_length in enumerate(token_lengths, start=start_idx):
             if token_length > self.max_length:
-                summarizable_data.append({"content": self.messages[i].message, "index": i})
-
-        return Dataset.from_list(summarizable_data) if summarizable_data else None
-
-    def _update_message_history(self, summarized_data):
-        """Updates the message history with summarized content."""
-        for summary in summarized_data:
-            idx = summary["index"]
-            self.messages[idx].message = summary["summary_text"]
-            self.append_to_chat_log(self.messages[idx].to_dict(), idx)
+                summarizable_data.append({"content": self.messages[i].message, "index": i, "message_id": self.messages[i].message_id, "length": token_length})
+
+        return summarizable_data or None
+
+    def _update_message_history(self, summarized_data, originals: Optional[Dict[int, tuple]] = None):
+        """
+        Updates the message history with summarized content. With originals (index -> (message_id, text)),
+        a summary is skipped if its message changed after the job was queued.
+        """
+        with self._lock:
+            applied = []
+            for summary in summarized_data:
+                idx = summary["index"]
+                if originals is not None:
+                    message_id, text = originals[idx]
+                    if idx >= len(self.messages) or self.messages[idx].message_id != message_id or self.messages[idx].message != text:
+                        logger.debug("Message %s changed while it was being summarized; keeping it as is.", idx)
+                        continue
+                self.messages[idx].message = summary["summary_text"]
+                self.append_to_chat_log(self.messages[idx].to_dict(), idx, event="message_updated")
+                applied.append(idx)
+            if applied:
+                for listener in self.rewrite_listeners:
+                    listener(min(applied))
+
+    @property
+    def summarization_pending(self) -> bool:
+        """True while a background summarization job for this chat is queued or running."""
+        return self._summary_job is not None and not self._summary_job.done()
+
+    def wait_for_summarization(self, timeout: Optional[float] = None) -> None:
+        if self._summary_job is not None:
+            self._summary_job.exception(timeout)
 
     def check_and_summarize(self):
-        """Checks if summarization is needed and performs it."""
-        if (len(self.messages) - self.summarize_index) >= self.summarize_interval:
-            dataset = self._get_summarizable_data()
-            if dataset:
-                logger.debug(f"Batching data for summary: {len(dataset)} entries.")
-                timer = Timer()
-                summarized_data = self.summarizer.summarize_batch(dataset, len(dataset))
-                elapsed = timer.stop()
-                logger.debug(f"Summarizer itself took {elapsed} to finish.")
-                self._update_message_history(summarized_data)
-            self.summarize_index = len(self.messages) - self.recent_skip
\ No newline at end of file
+        """
+        Checks if summarization is needed and, if so, hands it to the shared SummarizationService.
+        Finished summaries are applied under the chat lock; only one job per chat runs at a time.
+        """
+        if self.summarization_pending:
+            return
+        with self._lock:
+            if (len(self.messages) - self.summarize_index) < self.summarize_interval:
+                return
+            rows = self._get_summarizable_data()
+            self.summarize_index = len(self.messages) - self.recent_skip
+        if rows:
+            logger.debug("Queueing data for summary: %s entries.", len(rows))
+            job = Future()
+            self._summary_job = job
+            timer = Timer("summary_latency", strategy=self.summarizer_name)
+            service_job = SummarizationService().submit([row["content"] for row in rows], [row["length"] for row in rows], self.summarizer_name)
+            service_job.add_done_callback(lambda done: self._apply_summaries(done, rows, job, timer))
+
+    def _apply_summaries(self, done: Future, rows: list[dict], job: Future, timer: Timer):
+        try:
+            summaries = done.result()
+            logger.debug("Summaries arrived %s after queueing.", timer.stop())
+            originals = {row["index"]: (row["message_id"], row["content"]) for row in rows}
+            summarized_data = [{"index": row["index"], "summary_text": summary} for row, summary in zip(rows, summaries)]
+            self._update_message_history(summarized_data, originals)
+            job.set_result(None)
+        except Exception as e:
+            logger.error("Background summarization failed: %s", e)
+            job.set_exception(e)
@@ -4,4 +4,16 @@ class LLMModel(Enum):
     SMALL = "chuanli11/Llama-3.2-3B-Instruct-uncensored"
     LARGE = "Orenguteng/Llama-3.1-8B-Lexi-Uncensored-V2"
     ROLEPLAY = "aifeifei798/DarkIdol-Llama-3.1-8B-Instruct-1.2-Uncensored"
-    EROTICA = "hungng/Llama-3.2-uncensored-erotica"
\ No newline at end of file
+    EROTICA = "hungng/Llama-3.2-uncensored-erotica"
+
+    @property
+    def context_budget(self) -> int:
+        """Prompt plus reply tokens allowed per turn, kept well under the model's context length for latency."""
+        return _CONTEXT_BUDGETS[self]
+
+_CONTEXT_BUDGETS = {
+    LLMModel.SMALL: 4096,
+    LLMModel.LARGE: 6144,
+    LLMModel.ROLEPLAY: 6144,
+    LLMModel.EROTICA: 4096,
+}
@@ -1,6 +1,7 @@
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from . import logger
+from .config_store import ConfigStore
 import json
 import os
 
@@ -16,6 +17,15 @@ class LLMPreset:
     length_penalty: float = 1.0
     num_beams: int = 1
     
+    # Summarization strategy, see summarizer.SUMMARIZERS
+    summarizer: str = "abstractive"
+
+    # Inference profile, see inference_profile.PROFILES (None keeps the bot's)
+    inference_profile: Optional[str] = None
+
+    # Draft model for speculative decoding, an LLMModel name such as "SMALL" (None keeps the bot's)
+    draft_model: Optional[str] = None
+
     # Base system message
     system_message: str = "You are a helpful assistant."
     
@@ -39,8 +49,7 @@ class LLMPreset:
         else:
             filepath = os.path.abspath(os.path.join(config_dir, "presets.json"))
         try:
-            with open(filepath, 'r') as file:
-                presets = json.load(file)
+            presets = ConfigStore().load_json(filepath)
             if preset_name not in presets:
                 raise ValueError(f"Preset '{preset_name}' not found in {filepath}.")
             return cls(**presets[preset_name])
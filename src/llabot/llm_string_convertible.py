@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 
 class LLMStringConvertible(ABC):
+  __slots__ = ()  # Lets slotted subclasses like MessageData go without a __dict__
+
   @abstractmethod
   def to_llm_string(self) -> str:
     pass
\ No newline at end of file
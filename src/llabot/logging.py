@@ -1,11 +1,18 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import sys
 from datetime import datetime
 from colorama import Fore, Style
 
-# Create 'log' directory if it doesn't exist
-LOG_DIR = "log"
-os.makedirs(LOG_DIR, exist_ok=True)
+# Directory of the JSON-lines log, created on the first record written to it
+LOG_DIR = os.environ.get("LLABOT_LOG_DIR", "log")
+LOG_FILE = "llabot.jsonl"
+LOG_MAX_BYTES = 10 * 1024 * 1024   # Size at which the log rotates
+LOG_BACKUPS = 5                    # Rotated logs kept
 
 # Define log level colors
 LOG_LEVEL_COLORS = {
@@ -21,57 +28,134 @@ class ColoredFormatter(logging.Formatter):
         # Get color for the log level
         levelname = record.levelname
         color = LOG_LEVEL_COLORS.get(levelname, Fore.WHITE)
-        
+
         # Format module and function name dynamically
         module_name = record.module
         func_name = record.funcName
-        
+
         # Apply custom format
         message = f"[{Style.RESET_ALL}{color}{levelname}{Style.RESET_ALL}][{module_name}][{func_name}] {record.getMessage()}"
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
         return message
 
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers and jq."""
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "function": record.funcName,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class RotatingJsonLinesHandler(logging.handlers.RotatingFileHandler):
+    """Rotating file handler that opens (and creates the directory of) its file on the first record."""
+    def __init__(self, path: str):
+        super().__init__(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8", delay=True)
+        self.setFormatter(JsonLinesFormatter())
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """Queues records untouched: the listener runs in this process, so formatting can wait until it handles them."""
+    def prepare(self, record):
+        return record
+
 class CustomLogger:
+    """
+    Logs through a queue to a background listener thread, which formats records and writes
+    them to the console and a rotating JSON-lines file, so callers never wait on I/O.
+    Messages take %-style arguments and are only formatted if the record is emitted.
+    Each module logs under its own name (e.g. 'llabot.chess.engine'), so levels can be set
+    per subsystem with set_level(), or LLABOT_LOG_LEVEL and LLABOT_LOG_LEVELS
+    ('chess=DEBUG,weather=WARNING') in the environment.
+    """
     def __init__(self, name, console=True, file=True):
+        self.name = name
         self.logger = logging.getLogger(name)
-        self.logger.setLevel(logging.DEBUG)
-        
+        self._loggers: dict[str, logging.Logger] = {}
+        self.listener = None
+
         # Prevent duplicate log entries
         if not self.logger.handlers:
+            self.logger.setLevel(os.environ.get("LLABOT_LOG_LEVEL", "INFO").upper())
+            for setting in filter(None, os.environ.get("LLABOT_LOG_LEVELS", "").split(",")):
+                subsystem, _, level = setting.partition("=")
+                self.set_level(level.strip(), subsystem.strip())
+            handlers = []
             # Console handler
             if console:
                 console_handler = logging.StreamHandler()
-                console_handler.setLevel(logging.DEBUG)
                 console_handler.setFormatter(ColoredFormatter())
-                self.logger.addHandler(console_handler)
+                handlers.append(console_handler)
 
             # File handler
             if file:
-                log_file = os.path.join(LOG_DIR, f"log_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log")
-                file_handler = logging.FileHandler(log_file)
-                file_handler.setLevel(logging.DEBUG)
-                file_handler.setFormatter(logging.Formatter("[%(levelname)s][%(module)s][%(funcName)s] %(message)s"))
-                self.logger.addHandler(file_handler)
+                handlers.append(RotatingJsonLinesHandler(os.path.abspath(os.path.join(LOG_DIR, LOG_FILE))))
+            records = queue.SimpleQueue()
+            self.logger.addHandler(_InProcessQueueHandler(records))
+            self.logger.propagate = False
+            self.listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.stop)
+
+    def set_level(self, level, subsystem=None):
+        """Sets the level of every logger, or of one subsystem such as 'chess' or 'model_registry'."""
+        target = logging.getLogger(f"{self.name}.{subsystem}" if subsystem else self.name)
+        target.setLevel(level.upper() if isinstance(level, str) else level)
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self._caller_logger(2).isEnabledFor(level)
+
+    def stop(self):
+        """Writes out everything still queued and stops the listener thread."""
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def _caller_logger(self, depth: int) -> logging.Logger:
+        """The logger named after the module `depth` frames up, when it is inside this package."""
+        module = sys._getframe(depth).f_globals.get("__name__", self.name)
+        logger = self._loggers.get(module)
+        if logger is None:
+            logger = logging.getLogger(module) if module.startswith(self.name + ".") else self.logger
+            self._loggers[module] = logger
+        return logger
+
+    def _log(self, level, message, args, kwargs):
+        logger = self._caller_logger(3)
+        if logger.isEnabledFor(level):
+            logger._log(level, message, args, stacklevel=3, **kwargs)
 
-    def debug(self, message):
-        self.logger.debug(message)
+    def debug(self, message, *args, **kwargs):
+        self._log(logging.DEBUG, message, args, kwargs)
 
-    def info(self, message):
-        self.logger.info(message)
+    def info(self, message, *args, **kwargs):
+        self._log(logging.INFO, message, args, kwargs)
 
-    def warning(self, message):
-        self.logger.warning(message)
+    def warning(self, message, *args, **kwargs):
+        self._log(logging.WARNING, message, args, kwargs)
 
-    def error(self, message):
-        self.logger.error(message)
+    def error(self, message, *args, **kwargs):
+        self._log(logging.ERROR, message, args, kwargs)
 
-    def critical(self, message):
-        self.logger.critical(message)
+    def critical(self, message, *args, **kwargs):
+        self._log(logging.CRITICAL, message, args, kwargs)
 
 # Usage example
 if __name__ == "__main__":
     logger = CustomLogger("MyLogger", console=True, file=True)
+    logger.set_level("DEBUG")
     logger.debug("This is a debug message.")
-    logger.info("This is an info message.")
+    logger.info("This is an info message with %s.", "an argument")
     logger.warning("This is a warning message.")
     logger.error("This is an error message.")
-    logger.critical("This is a critical message.")
\ No newline at end of file
+    logger.critical("This is a critical message.")
@@ -1,19 +1,118 @@
+import sys
+import time
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
 import uuid
 from .llm_string_convertible import LLMStringConvertible
-from . import logger
+
+def _intern(value: Optional[str]) -> Optional[str]:
+  return sys.intern(value) if isinstance(value, str) else value
 
 class MessageData(LLMStringConvertible):
+  """
+  One chat message, kept compact for long histories: slots instead of a __dict__, interned
+  sender names and roles, the creation time as a float and the id as a 128-bit int. The
+  id and metadata dict are only created when first used. The token count is kept for
+  one tokenizer at a time, the one the chat's model uses.
+  """
+  __slots__ = ("_timestamp", "_sender_name", "_sender_role", "_message", "_message_id", "_metadata", "_token_tokenizer", "_token_count")
+
   def __init__(self, sender_name: Optional[str] = None, sender_role: Optional[str] = None, message: Optional[str] = None):
-    self.timestamp: datetime = datetime.now()
-    self.sender_name: str = sender_name
-    self.sender_role: str = sender_role
-    self.message: str = message
-    self.message_id: str = str(uuid.uuid4())
-    self.metadata: Dict[str, Any] = {}
-    logger.debug(f"A message has been instanced: {self.message_id}.")
-    
+    self._timestamp: Union[float, datetime] = time.time()
+    self._sender_name: Optional[str] = _intern(sender_name)
+    self._sender_role: Optional[str] = _intern(sender_role)
+    self._message: Optional[str] = message
+    self._message_id: Union[None, int, str] = None
+    self._metadata: Optional[Dict[str, Any]] = None
+    self._token_tokenizer: Optional[str] = None   # Tokenizer _token_count was counted with
+    self._token_count: Optional[int] = None
+
+  @property
+  def timestamp(self) -> datetime:
+    if isinstance(self._timestamp, datetime):
+      return self._timestamp
+    return datetime.fromtimestamp(self._timestamp)
+
+  @timestamp.setter
+  def timestamp(self, value: datetime) -> None:
+    self._timestamp = value
+
+  @property
+  def sender_name(self) -> Optional[str]:
+    return self._sender_name
+
+  @sender_name.setter
+  def sender_name(self, value: Optional[str]) -> None:
+    self._sender_name = _intern(value)
+
+  @property
+  def sender_role(self) -> Optional[str]:
+    return self._sender_role
+
+  @sender_role.setter
+  def sender_role(self, value: Optional[str]) -> None:
+    self._sender_role = _intern(value)
+
+  @property
+  def message(self) -> str:
+    return self._message
+
+  @message.setter
+  def message(self, value: str) -> None:
+    if value != self._message:
+      self._message = value
+      self._token_count = None
+
+  @property
+  def message_id(self) -> str:
+    if self._message_id is None:
+      self._message_id = uuid.uuid4().int
+    if isinstance(self._message_id, int):
+      return str(uuid.UUID(int=self._message_id))
+    return self._message_id
+
+  @message_id.setter
+  def message_id(self, value: str) -> None:
+    """Canonical UUID strings are stored as ints; anything else is kept as given."""
+    try:
+      parsed = uuid.UUID(value)
+      self._message_id = parsed.int if str(parsed) == value else value
+    except (ValueError, TypeError, AttributeError):
+      self._message_id = value
+
+  @property
+  def metadata(self) -> Dict[str, Any]:
+    if self._metadata is None:
+      self._metadata = {}
+    return self._metadata
+
+  @metadata.setter
+  def metadata(self, value: Optional[Dict[str, Any]]) -> None:
+    self._metadata = value
+
+  @property
+  def llm_view(self) -> Dict[str, str]:
+    """The role/content dict sent to the model, built on each call."""
+    return {"role": self._sender_role, "content": self._message}
+
+  def cached_token_count(self, tokenizer_name: str) -> Optional[int]:
+    """The memoized token count of the message for a tokenizer, or None if not counted with it."""
+    return self._token_count if self._token_tokenizer == tokenizer_name else None
+
+  def set_token_count(self, tokenizer_name: str, count: int) -> None:
+    """Memoizes the token count for a tokenizer, replacing a count made with any other."""
+    self._token_tokenizer = _intern(tokenizer_name)
+    self._token_count = count
+
+  def token_count(self, tokenizer_name: str) -> int:
+    """Counts the message's tokens for a tokenizer, computing it at most once per message text."""
+    count = self.cached_token_count(tokenizer_name)
+    if count is None:
+      from .tokenizer_cache import count_tokens
+      count = count_tokens(tokenizer_name, [self._message or ""])[0]
+      self.set_token_count(tokenizer_name, count)
+    return count
+
   def is_valid(self) -> bool:
     return bool(self.message and self.sender_name and self.sender_role)
   
@@ -33,7 +132,7 @@ class MessageData(LLMStringConvertible):
       "sender_role": self.sender_role,
       "message": self.message,
       "message_id": self.message_id,
-      "metadata": self.metadata,
+      "metadata": self._metadata if self._metadata is not None else {},
     }
 
   @staticmethod
@@ -44,7 +143,8 @@ class MessageData(LLMStringConvertible):
       message=data.get("message"),
     )
     instance.timestamp = datetime.fromisoformat(data["timestamp"])
-    instance.message_id = data.get("message_id", str(uuid.uuid4()))
+    if "message_id" in data:
+      instance.message_id = data["message_id"]
     instance.metadata = data.get("metadata", None)
     return instance
   
@@ -54,5 +154,5 @@ class MessageData(LLMStringConvertible):
       f"Timestamp: {self.timestamp.isoformat()}\n"
       f"Sender: {self.sender_name} ({self.sender_role})\n"
       f"Message: {self.message}\n"
-      f"Metadata: {self.metadata if self.metadata else 'N/A'}"
-    )
\ No newline at end of file
+      f"Metadata: {self._metadata if self._metadata else 'N/A'}"
+    )
@@ -0,0 +1,195 @@
+import bisect
+import json
+import math
+import threading
+import time
+from typing import Optional
+
+LabelKey = tuple[tuple[str, str], ...]
+
+def _bucket_bounds(low: float, high: float, factor: float) -> list[float]:
+    bounds = []
+    bound = low
+    while bound < high:
+        bounds.append(bound)
+        bound *= factor
+    bounds.append(high)
+    return bounds
+
+class Histogram:
+    """
+    Counts of observations in exponentially growing buckets, from a microsecond to an hour
+    in steps of 10%. Recording is a bisect and a few additions; quantiles are interpolated
+    within their bucket, so they are accurate to within a few percent.
+    """
+    bounds: list[float] = _bucket_bounds(1e-6, 3600.0, 1.1)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: list[int] = [0] * (len(self.bounds) + 1)   # Last bucket holds anything over the top bound
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.min: float = math.inf
+        self.max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for index, count in enumerate(self.counts):
+                if count and seen + count >= rank:
+                    low = self.bounds[index - 1] if index > 0 else 0.0
+                    high = self.bounds[index] if index < len(self.bounds) else self.max
+                    value = low + (high - low) * (rank - seen) / count
+                    return min(max(value, self.min), self.max)
+                seen += count
+            return self.max
+
+    def snapshot(self) -> dict:
+        p50, p90, p99 = self.quantile(0.5), self.quantile(0.9), self.quantile(0.99)
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "mean": self.sum / self.count if self.count else 0.0,
+                "min": self.min if self.count else 0.0,
+                "max": self.max,
+                "p50": p50,
+                "p90": p90,
+                "p99": p99,
+            }
+
+class Metrics:
+    """
+    Process-wide stage timings and counters. Stage durations go into one histogram per
+    stage and label set (model, persona, bot, ...); snapshot() reports count, sum and
+    p50/p90/p99 for each, and to_prometheus()/to_json() export them.
+    """
+    _instance = None
+    enabled = True          # Set to False to make recording a no-op
+    quantiles = (0.5, 0.9, 0.99)
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(Metrics, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.initialized = True
+            self._lock = threading.Lock()
+            self._stages: dict[tuple[str, LabelKey], Histogram] = {}
+            self._counters: dict[tuple[str, LabelKey], float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple[str, LabelKey]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        """Records one duration of a stage."""
+        if not self.enabled:
+            return
+        key = self._key(stage, labels)
+        histogram = self._stages.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(key, Histogram())
+        histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def timer(self, stage: str, **labels) -> "Timer":
+        """A Timer that records into `stage` when stopped; also usable as a context manager."""
+        return Timer(stage, **labels)
+
+    def stage(self, stage: str, **labels) -> Optional[dict]:
+        """The snapshot of one stage's histogram, or None if it was never recorded."""
+        histogram = self._stages.get(self._key(stage, labels))
+        return histogram.snapshot() if histogram is not None else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = list(self._stages.items())
+            counters = list(self._counters.items())
+        return {
+            "stages": [{"stage": name, "labels": dict(labels), **histogram.snapshot()} for (name, labels), histogram in stages],
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in counters],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, prefix: str = "llabot") -> str:
+        """Prometheus text exposition: stage durations as a summary, counters as counters."""
+        lines = [f"# HELP {prefix}_stage_seconds Time spent in each stage of a turn.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        with self._lock:
+            stages = list(self._stages.items())
+            counters = list(self._counters.items())
+        for (name, labels), histogram in stages:
+            base = [("stage", name), *labels]
+            for q in self.quantiles:
+                lines.append(f"{prefix}_stage_seconds{_labels(base + [('quantile', str(q))])} {histogram.quantile(q):.9g}")
+            lines.append(f"{prefix}_stage_seconds_sum{_labels(base)} {histogram.sum:.9g}")
+            lines.append(f"{prefix}_stage_seconds_count{_labels(base)} {histogram.count}")
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for (counter, labels), value in counters:
+                if counter == name:
+                    lines.append(f"{prefix}_{name}_total{_labels(list(labels))} {value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+
+def _labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Timer:
+    """
+    Monotonic high-resolution stopwatch. stop() returns the elapsed time formatted as
+    'XmY.YYYs' for log messages and keeps the seconds in `elapsed`; a timer given a stage
+    also records the duration in Metrics under that stage and its labels.
+    """
+    def __init__(self, stage: Optional[str] = None, **labels):
+        self.stage: Optional[str] = stage
+        self.labels: dict = labels
+        self.elapsed: Optional[float] = None
+        self.start_time: float = time.perf_counter()
+
+    def stop(self) -> str:
+        """Stops the timer and returns the elapsed time in the format 'XmY.YYYs', e.g. '1m2.345s'."""
+        self.elapsed = time.perf_counter() - self.start_time
+        if self.stage is not None:
+            Metrics().observe(self.stage, self.elapsed, **self.labels)
+        minutes, seconds = divmod(self.elapsed, 60)
+        return f"{int(minutes)}m{seconds:.3f}s"
+
+    def __enter__(self) -> "Timer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
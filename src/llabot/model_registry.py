@@ -0,0 +1,278 @@
+import gc
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Tuple
+import torch
+from transformers import pipeline
+from transformers.pipelines.base import Pipeline
+from .llm_model import LLMModel
+from .inference_profile import InferenceProfile, get_profile, resident_memory_bytes
+from .tokenizer_cache import register_tokenizer
+from . import Timer, logger
+
+ModelKey = Tuple[LLMModel, str]
+
+class _ModelEntry:
+    """A loaded pipeline and the bookkeeping needed to share it."""
+    def __init__(self, key: ModelKey, pipe: Pipeline, load_seconds: float = 0.0, rss_bytes: int = 0):
+        self.key: ModelKey = key
+        self.pipe: Pipeline = pipe
+        self.ref_count: int = 0
+        self.size_bytes: int = _estimate_size(pipe.model)
+        self.load_seconds: float = load_seconds
+        self.rss_bytes: int = rss_bytes              # Growth of resident memory while loading
+        self.generated_tokens: int = 0
+        self.generation_seconds: float = 0.0
+        self.assisted_tokens: int = 0                # Tokens generated with a draft model's help
+        self.assisted_seconds: float = 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.generated_tokens / self.generation_seconds if self.generation_seconds else 0.0
+
+    @property
+    def assisted_tokens_per_second(self) -> float:
+        return self.assisted_tokens / self.assisted_seconds if self.assisted_seconds else 0.0
+
+    @property
+    def speculative_speedup(self) -> Optional[float]:
+        """Assisted over plain tokens/sec of turns generated alone, once the model has generated both ways."""
+        if not self.tokens_per_second or not self.assisted_tokens_per_second:
+            return None
+        return self.assisted_tokens_per_second / self.tokens_per_second
+
+    def report(self) -> dict:
+        return {
+            "model": self.key[0].name,
+            "profile": self.key[1],
+            "load_seconds": round(self.load_seconds, 3),
+            "size_bytes": self.size_bytes,
+            "rss_bytes": self.rss_bytes,
+            "tokens_per_second": round(self.tokens_per_second, 2),
+            "assisted_tokens_per_second": round(self.assisted_tokens_per_second, 2),
+            "speculative_speedup": None if self.speculative_speedup is None else round(self.speculative_speedup, 2),
+        }
+
+class ModelHandle:
+    """A reference-counted handle to a shared pipeline. Call release() when done."""
+    def __init__(self, registry: "ModelRegistry", entry: _ModelEntry):
+        self._registry = registry
+        self._entry: Optional[_ModelEntry] = entry
+
+    @property
+    def key(self) -> ModelKey:
+        return self._entry.key
+
+    @property
+    def pipe(self) -> Pipeline:
+        if self._entry is None:
+            raise RuntimeError("Model handle has already been released.")
+        return self._entry.pipe
+
+    @property
+    def model(self):
+        return self.pipe.model
+
+    @property
+    def tokenizer(self):
+        return self.pipe.tokenizer
+
+    @property
+    def released(self) -> bool:
+        return self._entry is None
+
+    @property
+    def speculative_speedup(self) -> Optional[float]:
+        return self._entry.speculative_speedup if self._entry is not None else None
+
+    def record_generation(self, tokens: int, seconds: float, assisted: bool = False) -> None:
+        """Adds a finished generation to the model's plain or assisted tokens/sec figure."""
+        entry = self._entry
+        if entry is not None:
+            with self._registry._lock:
+                if assisted:
+                    entry.assisted_tokens += tokens
+                    entry.assisted_seconds += seconds
+                else:
+                    entry.generated_tokens += tokens
+                    entry.generation_seconds += seconds
+
+    def release(self) -> None:
+        if self._entry is not None:
+            entry, self._entry = self._entry, None
+            self._registry._release(entry)
+
+    def __enter__(self) -> "ModelHandle":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+class ModelRegistry:
+    """
+    Process-wide store of text-generation pipelines keyed by model and inference profile.
+    Bots acquire handles instead of loading their own copy of the weights. Models that
+    are no longer referenced stay warm in an LRU until the warm limit or memory budget
+    forces them out.
+    """
+    _instance = None
+    max_warm_models = 1                          # Released models kept loaded for reuse
+    memory_budget_bytes: Optional[int] = None    # Cap on total weights held, None for no cap
+    loader_threads = 2                           # Background threads available for acquire_async
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ModelRegistry, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.initialized = True
+            self._lock = threading.RLock()
+            self._active: dict[ModelKey, _ModelEntry] = {}
+            self._warm: OrderedDict[ModelKey, _ModelEntry] = OrderedDict()
+            self._loading: dict[ModelKey, Future] = {}
+            self._loader = ThreadPoolExecutor(max_workers=self.loader_threads, thread_name_prefix="llabot-model-loader")
+            self.sources: dict[LLMModel, str] = {}   # Local paths or mirrors overriding the hub id
+            self.profiles: dict[LLMModel, str] = {}  # Inference profiles overriding the default per model
+            self.hits: int = 0
+            self.misses: int = 0
+
+    def resolve_profile(self, llm_model: LLMModel, profile=None) -> InferenceProfile:
+        """The given profile (or profile name), else the model's configured one, else the default."""
+        return get_profile(profile if profile is not None else self.profiles.get(llm_model))
+
+    def make_key(self, llm_model: LLMModel, profile=None) -> ModelKey:
+        return (llm_model, self.resolve_profile(llm_model, profile).name)
+
+    def configure(self, max_warm_models: Optional[int] = None, memory_budget_bytes: Optional[int] = None) -> None:
+        """Adjusts the warm-cache limits and evicts anything now over them."""
+        with self._lock:
+            if max_warm_models is not None:
+                self.max_warm_models = max_warm_models
+            if memory_budget_bytes is not None:
+                self.memory_budget_bytes = memory_budget_bytes
+            self._evict()
+
+    def acquire(self, llm_model: LLMModel, profile=None) -> ModelHandle:
+        """Returns a handle to the shared pipeline, loading it only if nobody holds it yet."""
+        profile = self.resolve_profile(llm_model, profile)
+        key = self.make_key(llm_model, profile)
+        while True:
+            with self._lock:
+                entry = self._active.get(key) or self._warm.pop(key, None)
+                if entry is not None:
+                    self.hits += 1
+                    return self._checkout(entry)
+                pending = self._loading.get(key)
+                if pending is None:
+                    self.misses += 1
+                    pending = Future()
+                    self._loading[key] = pending
+                    break
+            # Another thread is loading the same model; wait for it and retry.
+            pending.exception()
+
+        try:
+            timer = Timer("pipeline_load", model=llm_model.name, profile=profile.name)
+            start, rss_before = time.perf_counter(), resident_memory_bytes()
+            pipe = pipeline(
+                "text-generation",
+                model=self.sources.get(llm_model, llm_model.value),
+                dtype=profile.dtype,
+                device_map=profile.device_map,
+            )
+            pipe.model = profile.prepare(pipe.model)
+            # Decoder-only models need a pad token and left padding to generate in batches.
+            if pipe.tokenizer.pad_token is None:
+                pipe.tokenizer.pad_token = pipe.tokenizer.eos_token
+            pipe.tokenizer.padding_side = "left"
+            entry = _ModelEntry(key, pipe, time.perf_counter() - start, resident_memory_bytes() - rss_before)
+            register_tokenizer(llm_model.value, pipe.tokenizer)
+            logger.debug("Loaded %s with the %s profile into the model registry in %s.", llm_model.name, profile.name, timer.stop())
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(key, None)
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            self._loading.pop(key, None)
+            handle = self._checkout(entry)
+            self._evict()
+        pending.set_result(None)
+        return handle
+
+    def acquire_async(self, llm_model: LLMModel, profile=None) -> Future:
+        """Acquires on a background thread. The future resolves to a ModelHandle the caller must release."""
+        return self._loader.submit(self.acquire, llm_model, profile)
+
+    def _checkout(self, entry: _ModelEntry) -> ModelHandle:
+        entry.ref_count += 1
+        self._active[entry.key] = entry
+        return ModelHandle(self, entry)
+
+    def _release(self, entry: _ModelEntry) -> None:
+        with self._lock:
+            entry.ref_count -= 1
+            if entry.ref_count > 0:
+                return
+            self._active.pop(entry.key, None)
+            self._warm[entry.key] = entry
+            self._warm.move_to_end(entry.key)
+            self._evict()
+
+    def _memory_in_use(self) -> int:
+        return sum(e.size_bytes for e in self._active.values()) + sum(e.size_bytes for e in self._warm.values())
+
+    def _evict(self) -> None:
+        evicted = False
+        while self._warm and (
+            len(self._warm) > self.max_warm_models
+            or (self.memory_budget_bytes is not None and self._memory_in_use() > self.memory_budget_bytes)
+        ):
+            key, entry = self._warm.popitem(last=False)
+            logger.debug("Evicting %s (%s) from the model registry.", key[0].name, key[1])
+            del entry.pipe
+            evicted = True
+        if evicted:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def clear(self) -> None:
+        """Drops every warm model. Models still held by handles are left alone."""
+        with self._lock:
+            self._warm, warm = OrderedDict(), self._warm
+            warm.clear()
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def stats(self) -> dict:
+        """Reports how many models are loaded and how well the cache is doing."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "loaded_models": len(self._active) + len(self._warm),
+                "active_models": len(self._active),
+                "warm_models": len(self._warm),
+                "handles": sum(e.ref_count for e in self._active.values()),
+                "memory_bytes": self._memory_in_use(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "models": [e.report() for e in list(self._active.values()) + list(self._warm.values())],
+            }
+
+def _estimate_size(model) -> int:
+    """Approximates the bytes held by a model's weights, including quantized ones."""
+    try:
+        tensors = []
+        for value in model.state_dict().values():
+            # Dynamically quantized layers keep their packed (weight, bias) as a tuple
+            tensors.extend(value if isinstance(value, tuple) else [value])
+        return sum(t.numel() * t.element_size() for t in tensors if isinstance(t, torch.Tensor))
+    except (AttributeError, RuntimeError):
+        return 0
@@ -1,12 +1,26 @@
-import json
 import os
+from typing import Optional
+from .config_store import ConfigStore
 from .base_entity import BaseEntity
 from .llm_string_convertible import LLMStringConvertible
 from . import logger
 
 class PersonaData(BaseEntity, LLMStringConvertible):
-    def __init__(self, persona_name: str):
-      self.load_persona_data(persona_name)
+    # Fields that make up the LLM string; assigning one marks the persona as edited
+    _RENDERED_FIELDS = frozenset(("name", "birthday", "sex", "race", "lat", "lon", "physical_form", "mind",
+                                  "social_connections", "communication", "knowledge", "hobbies_and_passions", "skills"))
+
+    def __init__(self, persona_name: Optional[str] = None):
+      self.file_path: Optional[str] = None
+      self.version: Optional[tuple[int, int]] = None   # Stamp of the file the data was loaded from
+      self.edited: bool = False                         # Fields changed in memory since the load
+      if persona_name is not None:
+        self.load_persona_data(persona_name)
+
+    def __setattr__(self, name, value):
+      super().__setattr__(name, value)
+      if name in PersonaData._RENDERED_FIELDS:
+        super().__setattr__("edited", True)
     
     def load_persona_data(self, persona_name: str):
       """Loads persona data from a JSON file."""
@@ -24,8 +38,9 @@ class PersonaData(BaseEntity, LLMStringConvertible):
       if not os.path.exists(file_path):
         raise FileNotFoundError(f"Persona data file '{file_path}' not found.")
       
-      with open(file_path, 'r') as file:
-        data = json.load(file)
+      data = ConfigStore().load_json(file_path)
+      self.file_path = file_path
+      self.version = ConfigStore.version(file_path)
 
       core_identity = data["core_identity"]
       self.name = core_identity["name"]
@@ -48,8 +63,16 @@ class PersonaData(BaseEntity, LLMStringConvertible):
       self.hobbies_and_passions = data.get("hobbies_and_passions", {})
 
       self.skills = data.get("skills", {})
+      self.edited = False
       logger.debug("Presumably persona data was loaded.")
 
+    def reload_if_changed(self) -> bool:
+      """Reloads the persona if its file was edited since it was loaded. Returns whether it did."""
+      if self.file_path is None or ConfigStore.version(self.file_path) == self.version:
+        return False
+      self.load_persona_data(os.path.basename(os.path.dirname(self.file_path)))
+      return True
+
     def to_dict(self) -> dict:
       """Convert the PersonaData object to a dictionary."""
       return {
@@ -71,8 +94,7 @@ class PersonaData(BaseEntity, LLMStringConvertible):
     @staticmethod
     def from_dict(data: dict) -> "PersonaData":
       """Create a PersonaData object from a dictionary."""
-      persona_name = data["name"]
-      persona = PersonaData(persona_name)
+      persona = PersonaData()
       persona.name = data["name"]
       persona.birthday = data["birthday"]
       persona.sex = data["sex"]
@@ -89,7 +111,17 @@ class PersonaData(BaseEntity, LLMStringConvertible):
       return persona
     
     def to_llm_string(self) -> str:
-      """Converts the PersonaData object to a human-readable string for LLMs."""
+      """
+      Converts the PersonaData object to a human-readable string for LLMs. The string of a
+      persona as loaded from its file is shared through the ConfigStore; once a field is
+      reassigned it is rendered afresh. Nested data comes from the shared parse and is
+      read-only, so change it by assigning a new dict rather than editing it in place.
+      """
+      if self.version is None or self.edited:
+        return self._render_llm_string()
+      return ConfigStore().fragment(("persona", self.file_path), self.version, self._render_llm_string)
+
+    def _render_llm_string(self) -> str:
       lines = [
         f"Name: {self.name}",
         f"Birthday: {self.birthday}",
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from typing import Dict
-import json
 import os
+from .config_store import ConfigStore
 
 @dataclass
 class SceneData:
@@ -30,9 +30,7 @@ class SceneData:
     @classmethod
     def load_from_file(self, filename: str = 'config/scene.json') -> 'SceneData':
         file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), filename))
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-        return SceneData.from_dict(data)
+        return SceneData.from_dict(ConfigStore().load_json(file_path))
 
     def to_llm_string(self) -> str:
         return f"Setting: {self.setting}\nCharacters: {self.characters}\nRelationship: {self.relationship}\nTone: {self.tone}"
\ No newline at end of file
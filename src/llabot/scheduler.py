@@ -0,0 +1,158 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from transformers.pipelines.base import Pipeline
+from .generation import GenerationCancelled, cancel_criteria
+from .metrics import Timer
+from .model_registry import ModelKey
+from . import logger
+
+@dataclass
+class _Turn:
+    history: list[dict[str, str]]
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    solo: Optional[Callable[[], str]] = None
+    future: Future = field(default_factory=Future)
+    enqueued: float = field(default_factory=time.monotonic)
+
+class BatchScheduler:
+    """
+    Queues turns from every session and runs those that share a model and identical
+    generation settings as one padded batch. A turn that finds its model idle with nothing
+    else queued runs at once through its solo callable, so a lone session never waits.
+    Each model runs one batch at a time; turns that arrive meanwhile pile up into the next
+    batch, which starts as soon as the model is free. Turns arriving together at an idle
+    model are dispatched once the batch is full or its oldest turn has waited max_wait seconds. Batched turns go through the plain pipeline, so they use neither the
+    sessions' KV caches nor their draft models.
+    """
+    def __init__(self, max_batch_size: int = 8, max_wait: float = 0.01, workers: int = 4):
+        self.max_batch_size: int = max_batch_size
+        self.max_wait: float = max_wait
+        self._pipes: dict[tuple, Pipeline] = {}
+        self._pending: dict[tuple, list[_Turn]] = {}
+        self._busy: set[ModelKey] = set()  # Models with a batch running
+        self._freed: dict[ModelKey, float] = {}  # When each model last finished a batch
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llabot-batch")
+        self._shutdown = False
+        self.batches: int = 0
+        self.turns: int = 0
+        self._thread = threading.Thread(target=self._run, name="llabot-scheduler", daemon=True)
+        self._thread.start()
+
+    def configure(self, max_batch_size: Optional[int] = None, max_wait: Optional[float] = None) -> None:
+        with self._condition:
+            if max_batch_size is not None:
+                self.max_batch_size = max_batch_size
+            if max_wait is not None:
+                self.max_wait = max_wait
+            self._condition.notify()
+
+    def submit(self, model_key: ModelKey, pipe: Pipeline, history: list[dict[str, str]], generation_kwargs: dict, cancel_event: Optional[threading.Event] = None, solo: Optional[Callable[[], str]] = None) -> Future:
+        """
+        Queues a turn for the registry model model_key, loaded as pipe. The future resolves
+        to the raw text of the model's reply. Setting cancel_event drops the turn if it is
+        still queued, or stops its row of the batch. If the turn ends up in a batch of its
+        own, solo (when given) generates it instead, which lets a session use its own KV
+        cache and draft model.
+        """
+        key = (model_key, tuple(sorted(generation_kwargs.items())))
+        turn = _Turn(history, cancel_event or threading.Event(), solo)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Scheduler has been shut down.")
+            self._pipes[key] = pipe
+            self._pending.setdefault(key, []).append(turn)
+            self._dispatch_ready()  # A lone turn on an idle model starts here, without waking the scheduler first
+            self._condition.notify()
+        return turn.future
+
+    def shutdown(self) -> None:
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "batches": self.batches,
+                "turns": self.turns,
+                "mean_batch_size": self.turns / self.batches if self.batches else 0.0,
+                "queued": sum(len(turns) for turns in self._pending.values()),
+            }
+
+    def _run(self) -> None:
+        with self._condition:
+            while not self._shutdown:
+                timeout = self._dispatch_ready()
+                self._condition.wait(timeout)
+            for turns in self._pending.values():
+                for turn in turns:
+                    turn.future.set_exception(RuntimeError("Scheduler has been shut down."))
+            self._pending.clear()
+
+    def _dispatch_ready(self) -> Optional[float]:
+        """Dispatches every batch that is ready and returns how long until the next one could be."""
+        now = time.monotonic()
+        next_deadline = None
+        for key in list(self._pending):
+            turns = self._pending[key]
+            for turn in [t for t in turns if t.cancel_event.is_set()]:
+                turns.remove(turn)
+                turn.future.set_exception(GenerationCancelled("The turn was cancelled while queued."))
+            if not turns:
+                del self._pending[key]
+                self._pipes.pop(key)
+                continue
+            if key[0] in self._busy:
+                continue
+            deadline = turns[0].enqueued + self.max_wait
+            lone = len(turns) == 1 and turns[0].solo is not None and not self._queued_for(key[0], key)
+            waited = turns[0].enqueued <= self._freed.get(key[0], float("-inf"))  # Queued behind the last batch
+            if not lone and not waited and len(turns) < self.max_batch_size and now < deadline:
+                next_deadline = deadline if next_deadline is None else min(next_deadline, deadline)
+                continue
+            batch, rest = turns[:self.max_batch_size], turns[self.max_batch_size:]
+            if rest:
+                self._pending[key] = rest
+            else:
+                del self._pending[key]
+            pipe = self._pipes[key] if rest else self._pipes.pop(key)
+            self._busy.add(key[0])
+            self._executor.submit(self._generate, key, pipe, batch)
+        return None if next_deadline is None else max(next_deadline - now, 0.0)
+
+    def _queued_for(self, model_key: ModelKey, exclude: tuple) -> bool:
+        """Whether turns with other generation settings are waiting for the same model."""
+        return any(other[0] == model_key for other in self._pending if other != exclude)
+
+    def _generate(self, key: tuple, pipe: Pipeline, batch: list[_Turn]) -> None:
+        try:
+            if len(batch) == 1 and batch[0].solo:
+                batch[0].future.set_result(batch[0].solo())
+                return
+            logger.debug("Generating a batch of %s turns.", len(batch))
+            with Timer("batch_generate"):
+                outputs = pipe(
+                    [turn.history for turn in batch],
+                    batch_size=len(batch),
+                    stopping_criteria=cancel_criteria(*(turn.cancel_event for turn in batch)),
+                    **dict(key[1]),
+                )
+            for turn, output in zip(batch, outputs):
+                turn.future.set_result(output[0]["generated_text"][-1]["content"])
+        except BaseException as e:
+            for turn in batch:
+                if not turn.future.done():
+                    turn.future.set_exception(e)
+        finally:
+            with self._condition:
+                self.batches += 1
+                self.turns += len(batch)
+                self._busy.discard(key[0])
+                self._freed[key[0]] = time.monotonic()
+                self._condition.notify()
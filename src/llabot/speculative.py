@@ -0,0 +1,95 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+from . import logger
+
+_local = threading.local()
+_compatible: dict[tuple[str, str], bool] = {}
+
+def tokenizers_compatible(target_tokenizer, draft_tokenizer) -> bool:
+    """
+    Whether a draft model can propose tokens for a target model: both tokenizers must map
+    the same strings to the same ids and agree on the special tokens. Memoized per pair of
+    names the tokenizers were loaded from; unnamed tokenizers are compared every time.
+    """
+    if target_tokenizer is draft_tokenizer:
+        return True
+    key = (target_tokenizer.name_or_path, draft_tokenizer.name_or_path)
+    if key in _compatible:
+        return _compatible[key]
+    compatible = (
+        target_tokenizer.get_vocab() == draft_tokenizer.get_vocab()
+        and target_tokenizer.eos_token_id == draft_tokenizer.eos_token_id
+        and target_tokenizer.bos_token_id == draft_tokenizer.bos_token_id
+    )
+    if all(key):
+        _compatible[key] = compatible
+    return compatible
+
+class SpeculativeStats:
+    """
+    Running totals of assisted generation for one bot. Every forward pass of the target
+    model verifies the draft's proposals and adds one token of its own, so the accepted
+    draft tokens are the generated tokens minus the target's forward passes. The generated
+    tokens are counted by re-tokenizing the decoded reply, which can differ slightly from
+    the ids actually generated, so the acceptance rate is an approximation.
+    """
+    def __init__(self):
+        self.turns: int = 0
+        self.tokens: int = 0
+        self.proposed: int = 0
+        self.target_steps: int = 0
+
+    def record(self, tokens: int, target_steps: int, draft_steps: int) -> None:
+        self.turns += 1
+        self.tokens += tokens
+        self.target_steps += target_steps
+        self.proposed += draft_steps
+
+    @property
+    def accepted(self) -> int:
+        return max(self.tokens - self.target_steps, 0)
+
+    @property
+    def acceptance_rate(self) -> float:
+        return min(self.accepted / self.proposed, 1.0) if self.proposed else 0.0
+
+    @property
+    def tokens_per_target_step(self) -> float:
+        """Tokens produced per forward pass of the big model; 1.0 is plain decoding."""
+        return self.tokens / self.target_steps if self.target_steps else 0.0
+
+    def report(self) -> dict:
+        return {
+            "turns": self.turns,
+            "tokens": self.tokens,
+            "proposed": self.proposed,
+            "accepted": self.accepted,
+            "acceptance_rate_approx": round(self.acceptance_rate, 3),
+            "tokens_per_target_step": round(self.tokens_per_target_step, 3),
+        }
+
+@contextmanager
+def count_forwards(target_model, draft_model) -> Iterator[dict[str, int]]:
+    """
+    Counts the forward passes the current thread makes through each model. Models are
+    shared, so passes made by other threads at the same time are not counted.
+    """
+    counts = {"target": 0, "draft": 0}
+
+    def counter(role):
+        def hook(module, args):
+            if getattr(_local, "counts", None) is counts:
+                counts[role] += 1
+        return hook
+
+    handles = [target_model.register_forward_pre_hook(counter("target")),
+               draft_model.register_forward_pre_hook(counter("draft"))]
+    _local.counts = counts
+    try:
+        yield counts
+    finally:
+        _local.counts = None
+        for handle in handles:
+            handle.remove()
+        logger.debug("Assisted generation took %s target and %s draft forward passes.", counts['target'], counts['draft'])
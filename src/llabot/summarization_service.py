@@ -0,0 +1,143 @@
+import gc
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Optional
+from .summarizer import BaseSummarizer, make_summarizer, summarizer_type
+from . import Timer, logger
+
+@dataclass
+class _Item:
+    text: str
+    length: int
+    strategy: str
+    job: "_Job"
+    slot: int
+
+class _Job:
+    def __init__(self, size: int):
+        self.future: Future = Future()
+        self.results: list[Optional[str]] = [None] * size
+        self.remaining: int = size
+
+class SummarizationService:
+    """
+    One summarizer per strategy per process, shared by every chat. Pending texts from all
+    chats are grouped by strategy, sorted by token length and cut into batches of at most
+    max_batch_size, so texts of similar length are padded together. Each strategy loads on
+    first use, and all are unloaded after idle_unload seconds without work.
+    """
+    _instance = None
+    max_batch_size = 16
+    idle_unload = 300.0
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(SummarizationService, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.initialized = True
+            self._condition = threading.Condition()
+            self._pending: list[_Item] = []
+            self._summarizers: dict[str, BaseSummarizer] = {}
+            self._last_used: float = time.monotonic()
+            self.batches: int = 0
+            self.texts: int = 0
+            self._thread = threading.Thread(target=self._run, name="llabot-summarization", daemon=True)
+            self._thread.start()
+
+    def configure(self, max_batch_size: Optional[int] = None, idle_unload: Optional[float] = None) -> None:
+        with self._condition:
+            if max_batch_size is not None:
+                self.max_batch_size = max_batch_size
+            if idle_unload is not None:
+                self.idle_unload = idle_unload
+            self._condition.notify()
+
+    def submit(self, texts: list[str], lengths: Optional[list[int]] = None, strategy: str = "abstractive") -> Future:
+        """Queues texts for summarization with a strategy. The future resolves to their summaries, in order."""
+        if lengths is None:
+            lengths = summarizer_type(strategy).text_lengths(texts)
+        job = _Job(len(texts))
+        if not texts:
+            job.future.set_result([])
+            return job.future
+        with self._condition:
+            self._pending.extend(_Item(text, length, strategy, job, slot) for slot, (text, length) in enumerate(zip(texts, lengths)))
+            self._condition.notify()
+        return job.future
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._summarizers)
+
+    def unload(self) -> None:
+        with self._condition:
+            self._unload()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "loaded": self.loaded,
+                "queued": len(self._pending),
+                "batches": self.batches,
+                "texts": self.texts,
+                "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+            }
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending:
+                    idle = time.monotonic() - self._last_used
+                    if self._summarizers and idle >= self.idle_unload:
+                        self._unload()
+                    self._condition.wait(max(self.idle_unload - idle, 0.1) if self._summarizers else None)
+                items, self._pending = self._pending, []
+            items.sort(key=lambda item: (item.strategy, item.length))
+            start = 0
+            while start < len(items):
+                strategy = items[start].strategy
+                end = start
+                while end < len(items) and end - start < self.max_batch_size and items[end].strategy == strategy:
+                    end += 1
+                self._summarize(strategy, items[start:end])
+                start = end
+            self._last_used = time.monotonic()
+
+    def _summarize(self, strategy: str, batch: list[_Item]) -> None:
+        try:
+            summarizer = self._summarizers.get(strategy)
+            if summarizer is None:
+                timer = Timer("summarizer_load", strategy=strategy)
+                summarizer = make_summarizer(strategy)
+                self._summarizers[strategy] = summarizer
+                logger.debug("The %s summarizer loaded in %s.", strategy, timer.stop())
+            with Timer("summarization", strategy=strategy):
+                summaries = summarizer.summarize_texts([item.text for item in batch], len(batch))
+        except Exception as e:
+            logger.error("Summarization batch failed: %s", e)
+            for item in batch:
+                if not item.job.future.done():
+                    item.job.future.set_exception(e)
+            return
+        with self._condition:
+            self.batches += 1
+            self.texts += len(batch)
+        for item, summary in zip(batch, summaries):
+            job = item.job
+            if job.future.done():
+                continue
+            job.results[item.slot] = summary
+            job.remaining -= 1
+            if job.remaining == 0:
+                job.future.set_result(job.results)
+
+    def _unload(self) -> None:
+        if self._summarizers:
+            logger.debug("Unloading the idle summarizers.")
+            self._summarizers = {}
+            gc.collect()
@@ -1,15 +1,120 @@
-import torch
-from transformers import pipeline, AutoTokenizer
+import re
+from abc import ABC, abstractmethod
+from .tokenizer_cache import count_message_tokens, count_tokens, get_tokenizer
 
-class Summarizer:
+SUMMARIZER_MODEL = "facebook/bart-large-cnn"
+
+def approximate_tokens(text: str) -> int:
+    """Token count estimated from words (about 4 tokens per 3 English words), without a tokenizer."""
+    return (len(text.split()) * 4 + 2) // 3
+
+class BaseSummarizer(ABC):
+    """
+    A summarization strategy. Strategies are interchangeable behind summarize_texts, and each
+    says how it measures text length (in tokens, or an estimate of them) for choosing what to
+    summarize and for batching texts of similar length.
+    """
+    @classmethod
+    def text_lengths(cls, texts: list[str]) -> list[int]:
+        return count_tokens(SUMMARIZER_MODEL, texts)
+
+    @classmethod
+    def message_lengths(cls, messages: list) -> list[int]:
+        """text_lengths of MessageData, memoized on the messages where the measure is costly."""
+        return count_message_tokens(SUMMARIZER_MODEL, messages)
+
+    @abstractmethod
+    def summarize_texts(self, texts: list[str], batch_size: int) -> list[str]:
+        """Summarize a list of texts, returning the summaries in the same order."""
+        pass
+
+    def summarize_batch(self, dataset, batch_size):
+        """Summarize a batch of text data."""
+        summaries = self.summarize_texts(list(dataset["content"]), batch_size)
+        return [{"index": data["index"], "summary_text": summary}
+                for data, summary in zip(dataset, summaries)]
+
+class Summarizer(BaseSummarizer):
     """Handles summarization tasks using BART model."""
     def __init__(self):
+        import torch
+        from transformers import pipeline
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.tokenizer = AutoTokenizer.from_pretrained("facebook/bart-large-cnn")
-        self.summarizer = pipeline("summarization", model="facebook/bart-large-cnn", device=self.device)
+        self.tokenizer = get_tokenizer(SUMMARIZER_MODEL)
+        self.summarizer = pipeline("summarization", model=SUMMARIZER_MODEL, tokenizer=self.tokenizer, device=self.device)
 
-    def summarize_batch(self, dataset, batch_size):
-        """Summarize a batch of text data."""
-        summaries = self.summarizer(dataset["content"], batch_size=batch_size, min_length=60, max_length=130)
-        return [{"index": data["index"], "summary_text": summary["summary_text"]}
-                for data, summary in zip(dataset, summaries)]
\ No newline at end of file
+    def summarize_texts(self, texts: list[str], batch_size: int) -> list[str]:
+        summaries = self.summarizer(texts, batch_size=batch_size, min_length=60, max_length=130)
+        return [summary["summary_text"] for summary in summaries]
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.?!])\s+')
+_WORD = re.compile(r"[a-z0-9']+")
+
+class ExtractiveSummarizer(BaseSummarizer):
+    """
+    Picks the most central sentences of each text, TextRank style, on TF-IDF vectors
+    computed with NumPy. No model is loaded, and the kept sentences are verbatim, so
+    who said what is never rewritten.
+    """
+    def __init__(self, max_words: int = 90, ratio: float = 0.5):
+        self.max_words: int = max_words  # Hard cap on summary length, roughly BART's 130 tokens
+        self.ratio: float = ratio        # Share of the original words to aim for
+
+    # Lengths are estimated from word counts, so this strategy never loads a tokenizer
+    @classmethod
+    def text_lengths(cls, texts: list[str]) -> list[int]:
+        return [approximate_tokens(text) for text in texts]
+
+    @classmethod
+    def message_lengths(cls, messages: list) -> list[int]:
+        return [approximate_tokens(message.message or "") for message in messages]
+
+    def summarize_texts(self, texts: list[str], batch_size: int) -> list[str]:
+        return [self._summarize(text) for text in texts]
+
+    def _summarize(self, text: str) -> str:
+        import numpy as np
+        sentences = [s for s in _SENTENCE_SPLIT.split(text.strip()) if s]
+        if len(sentences) < 2:
+            return text
+        words = [_WORD.findall(s.lower()) for s in sentences]
+        vocab = {word: i for i, word in enumerate({w for ws in words for w in ws})}
+        if not vocab:
+            return text
+
+        # Term frequencies per sentence, weighted by inverse sentence frequency.
+        rows = np.repeat(np.arange(len(words)), [len(ws) for ws in words])
+        cols = np.fromiter((vocab[w] for ws in words for w in ws), dtype=np.int64, count=len(rows))
+        tf = np.zeros((len(sentences), len(vocab)))
+        np.add.at(tf, (rows, cols), 1.0)
+        idf = np.log((1 + len(sentences)) / (1 + np.count_nonzero(tf, axis=0))) + 1.0
+        tfidf = tf * idf
+        norms = np.linalg.norm(tfidf, axis=1, keepdims=True)
+        tfidf = np.divide(tfidf, norms, out=np.zeros_like(tfidf), where=norms > 0)
+
+        # Centrality: how similar each sentence is to the rest of the text.
+        similarity = tfidf @ tfidf.T
+        np.fill_diagonal(similarity, 0.0)
+        scores = similarity.sum(axis=1)
+
+        lengths = np.array([len(s.split()) for s in sentences])
+        budget = min(self.max_words, max(int(lengths.sum() * self.ratio), int(lengths.min())))
+        chosen, used = [], 0
+        for i in np.argsort(-scores, kind="stable"):
+            if used + lengths[i] <= budget or not chosen:
+                chosen.append(i)
+                used += lengths[i]
+        return " ".join(sentences[i] for i in sorted(chosen))
+
+SUMMARIZERS = {
+    "abstractive": Summarizer,
+    "extractive": ExtractiveSummarizer,
+}
+
+def summarizer_type(name: str) -> type[BaseSummarizer]:
+    if name not in SUMMARIZERS:
+        raise ValueError(f"Unknown summarizer '{name}'. Choose from: {', '.join(SUMMARIZERS)}.")
+    return SUMMARIZERS[name]
+
+def make_summarizer(name: str) -> BaseSummarizer:
+    return summarizer_type(name)()
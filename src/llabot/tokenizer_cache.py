@@ -0,0 +1,43 @@
+import threading
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from transformers.tokenization_utils_base import PreTrainedTokenizerBase
+
+_lock = threading.Lock()
+_tokenizers: dict[str, "PreTrainedTokenizerBase"] = {}
+
+def get_tokenizer(name: str) -> "PreTrainedTokenizerBase":
+    """Returns the tokenizer for a model, loading it once per process."""
+    tokenizer = _tokenizers.get(name)
+    if tokenizer is None:
+        with _lock:
+            tokenizer = _tokenizers.get(name)
+            if tokenizer is None:
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(name)
+                _tokenizers[name] = tokenizer
+    return tokenizer
+
+def register_tokenizer(name: str, tokenizer: "PreTrainedTokenizerBase") -> None:
+    """Shares an already loaded tokenizer (e.g. one owned by a pipeline) under a model name."""
+    with _lock:
+        _tokenizers.setdefault(name, tokenizer)
+
+def count_tokens(name: str, texts: list[str]) -> list[int]:
+    """Counts tokens for many texts in a single tokenizer call, without building tensors."""
+    if not texts:
+        return []
+    encoded = get_tokenizer(name)(list(texts), return_attention_mask=False, return_token_type_ids=False)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+def count_message_tokens(name: str, messages: Iterable) -> list[int]:
+    """
+    Returns the token count of each MessageData, tokenizing only the messages that
+    have no cached count for this tokenizer, and caching the new counts on them.
+    """
+    messages = list(messages)
+    missing = [m for m in messages if m.cached_token_count(name) is None]
+    for message, count in zip(missing, count_tokens(name, [m.message or "" for m in missing])):
+        message.set_token_count(name, count)
+    return [m.cached_token_count(name) for m in messages]
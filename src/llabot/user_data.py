@@ -1,4 +1,5 @@
 import json
+from .config_store import ConfigStore
 from .base_entity import BaseEntity
 from .llm_string_convertible import LLMStringConvertible
 import os
@@ -59,9 +60,8 @@ class UserData(BaseEntity, LLMStringConvertible):
       raise FileNotFoundError(f"Configuration file '{filepath}' not found.")
     
     try:
-      with open(filepath, 'r') as file:
-        data = json.load(file)
-        return cls.from_dict(data)
+      data = ConfigStore().load_json(filepath)
+      return cls.from_dict(data)
     except json.JSONDecodeError:
       raise ValueError(f"Failed to decode JSON from the file '{filepath}'. Please check the file format.")
     except Exception as e:
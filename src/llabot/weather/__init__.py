@@ -1 +1,2 @@
-from .weather import get_weather_info
\ No newline at end of file
+from .weather import get_weather_info
+from .client import WeatherClient
\ No newline at end of file
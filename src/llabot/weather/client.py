@@ -0,0 +1,159 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+from .. import logger
+
+class _Entry:
+  def __init__(self, data: dict):
+    self.data: dict = data
+    self.fetched_at: float = time.monotonic()
+
+  @property
+  def age(self) -> float:
+    return time.monotonic() - self.fetched_at
+
+class WeatherClient:
+  """
+  Shared OpenWeatherMap client. Lookups go through one pooled session with strict timeouts,
+  and results are cached per location, rounded to `precision` decimal places. Concurrent
+  lookups for the same location share a single request. Once an entry is older than
+  `refresh_after` it is refreshed in the background, and past `ttl` the last known value
+  is still served while a refresh runs, so a slow upstream never holds up a prompt.
+  """
+  _instance = None
+  base_url = "https://api.openweathermap.org/data/2.5/weather"
+  ttl = 600.0             # Seconds an entry counts as fresh
+  refresh_after = 480.0   # Age at which a fresh entry is refreshed ahead of time
+  max_stale = 6 * 3600.0  # Oldest entry still served while the upstream is slow or down
+  timeout = (3.05, 5.0)   # Connect and read timeouts of one request
+  wait_timeout = 2.0      # Longest a lookup with nothing cached waits for the upstream
+  precision = 2           # Decimal places lat/lon are rounded to (about 1 km)
+  pool_size = 8
+
+  def __new__(cls, *args, **kwargs):
+    if not cls._instance:
+      cls._instance = super(WeatherClient, cls).__new__(cls, *args, **kwargs)
+    return cls._instance
+
+  def __init__(self):
+    if not hasattr(self, 'initialized'):
+      # requests is only imported once weather is actually used
+      import requests
+      from requests.adapters import HTTPAdapter
+      self._lock = threading.Lock()
+      self._entries: dict[tuple[float, float], _Entry] = {}
+      self._inflight: dict[tuple[float, float], Future] = {}
+      self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="llabot-weather")
+      self.session = requests.Session()
+      adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+      self.session.mount("https://", adapter)
+      self.session.mount("http://", adapter)
+      self.hits: int = 0
+      self.stale_hits: int = 0
+      self.misses: int = 0
+      self.coalesced: int = 0
+      self.fetches: int = 0
+      self.errors: int = 0
+      # Set last, so a failed import or setup is retried by the next WeatherClient()
+      self.initialized = True
+
+  def configure(self, **settings) -> None:
+    """Overrides any of the class-level settings (base_url, ttl, timeout, ...) on this client."""
+    for name, value in settings.items():
+      if not hasattr(WeatherClient, name) or callable(getattr(WeatherClient, name)):
+        raise ValueError(f"Unknown weather client setting '{name}'.")
+      setattr(self, name, value)
+
+  def key(self, lat: float, lon: float) -> tuple[float, float]:
+    return round(float(lat), self.precision), round(float(lon), self.precision)
+
+  def get(self, api_key: str, lat: float, lon: float) -> Optional[dict]:
+    """
+    Returns the weather data for a location, or None if nothing is cached and the upstream
+    does not answer within wait_timeout (the request still completes into the cache).
+    """
+    key = self.key(lat, lon)
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry.age < self.ttl:
+        self.hits += 1
+        if entry.age >= self.refresh_after:
+          self._refresh(api_key, key)
+        return entry.data
+      if entry is not None and entry.age < self.max_stale:
+        self.stale_hits += 1
+        self._refresh(api_key, key)
+        return entry.data
+      self.misses += 1
+      future = self._refresh(api_key, key)
+    try:
+      return future.result(timeout=self.wait_timeout)
+    except FutureTimeoutError:
+      logger.warning("Weather lookup for %s is slow, continuing without it.", key)
+    except Exception:
+      pass  # Already logged by the fetch
+    return None
+
+  def prefetch(self, api_key: str, lat: float, lon: float) -> Future:
+    """Starts fetching a location in the background, unless a fresh entry is cached."""
+    key = self.key(lat, lon)
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry.age < self.refresh_after:
+        future = Future()
+        future.set_result(entry.data)
+        return future
+      return self._refresh(api_key, key)
+
+  def _refresh(self, api_key: str, key: tuple[float, float]) -> Future:
+    """Returns the in-flight request for key, starting one if there is none. Call with the lock held."""
+    future = self._inflight.get(key)
+    if future is not None:
+      self.coalesced += 1
+      return future
+    future = self._executor.submit(self._fetch, api_key, key)
+    self._inflight[key] = future
+    return future
+
+  def _fetch(self, api_key: str, key: tuple[float, float]) -> dict:
+    from requests import RequestException
+    params = {
+      "lat": key[0],
+      "lon": key[1],
+      "appid": api_key,
+      "units": "imperial"  # Get temperature in Fahrenheit
+    }
+    try:
+      response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+      response.raise_for_status()
+      data = response.json()
+      with self._lock:
+        self.fetches += 1
+        self._entries[key] = _Entry(data)
+      return data
+    except (RequestException, ValueError) as e:
+      with self._lock:
+        self.errors += 1
+      logger.warning("Weather request for %s failed: %s", key, e)
+      raise
+    finally:
+      with self._lock:
+        self._inflight.pop(key, None)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self) -> dict:
+    with self._lock:
+      return {
+        "entries": len(self._entries),
+        "in_flight": len(self._inflight),
+        "hits": self.hits,
+        "stale_hits": self.stale_hits,
+        "misses": self.misses,
+        "coalesced": self.coalesced,
+        "fetches": self.fetches,
+        "errors": self.errors,
+      }
@@ -1,43 +1,33 @@
-import requests
 import datetime
 import time
+from .client import WeatherClient
 
 @staticmethod
 def get_weather_info(api_key, lat, lon):
   """
   Fetch weather information for a given latitude and longitude.
   Extract specific details: weather main and description, temperature, wind speed, city name, and country.
+  Lookups go through the shared WeatherClient, so they are cached and never block for long.
   """
-  base_url = "https://api.openweathermap.org/data/2.5/weather"
-  params = {
-    "lat": lat,
-    "lon": lon,
-    "appid": api_key,
-    "units": "imperial"  # Get temperature in Fahrenheit
-  }
+  data = WeatherClient().get(api_key, lat, lon)
+  if data is None:
+    return "Weather: unavailable"
 
-  try:
-    response = requests.get(base_url, params=params)
-    response.raise_for_status()  # Raise exception for HTTP errors
-    data = response.json()
-
-    # Extract the required details
-    weather = data.get("weather", [{}])[0]
-    main = data.get("main", {})
-    wind = data.get("wind", {})
-    timezone = data.get("timezone", "N/A")
-    time = calculate_local_time(timezone)
-    # Format the result as a string
-    result = (
-      f"Weather: {weather.get('main', 'N/A').lower()} - {weather.get('description', 'N/A').lower()}\n"
-      f"Temperature: {main.get('temp', 'N/A')}°F, Feels like: {main.get('feels_like', 'N/A')}°F\n"
-      f"Wind Speed: {wind.get('speed', 'N/A')} mph\n"
-      f"City: {data.get('name', 'N/A')}, {data.get('sys', {}).get('country', 'N/A')}\n"
-      f"Current Time: {time}"
-    )
-    return result
-  except requests.RequestException as e:
-    return f"Request failed: {e}"
+  # Extract the required details
+  weather = data.get("weather", [{}])[0]
+  main = data.get("main", {})
+  wind = data.get("wind", {})
+  timezone = data.get("timezone", "N/A")
+  time = calculate_local_time(timezone) if isinstance(timezone, int) else "N/A"
+  # Format the result as a string
+  result = (
+    f"Weather: {weather.get('main', 'N/A').lower()} - {weather.get('description', 'N/A').lower()}\n"
+    f"Temperature: {main.get('temp', 'N/A')}°F, Feels like: {main.get('feels_like', 'N/A')}°F\n"
+    f"Wind Speed: {wind.get('speed', 'N/A')} mph\n"
+    f"City: {data.get('name', 'N/A')}, {data.get('sys', {}).get('country', 'N/A')}\n"
+    f"Current Time: {time}"
+  )
+  return result
 
 @staticmethod
 def calculate_local_time(target_timezone_offset: int) -> str:
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The tests import llabot and the benchmarks from the source tree
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+# Keep the JSON-lines log out of the working directory
+os.environ.setdefault("LLABOT_LOG_DIR", os.path.join(tempfile.gettempdir(), "llabot-test-log"))
+
+@pytest.fixture(scope="session")
+def tiny_models(tmp_path_factory):
+    """Tiny random chat and chess models that every LLMModel and the chess engine load instead of the real ones."""
+    from benchmarks.tiny_models import install_tiny_models
+    return install_tiny_models(str(tmp_path_factory.mktemp("models")))
+
+@pytest.fixture
+def user_data():
+    from llabot import UserData
+    return UserData("Tester", "2000-01-01", "unspecified", "unspecified", 0, 0, weather_enabled=False)
+
+@pytest.fixture
+def llabot(tiny_models):
+    """The LLaBot singleton on the tiny models. Bots added by the test are removed afterwards."""
+    from llabot import LLaBot
+    bot = LLaBot()
+    existing = len(bot.bot_pool)
+    yield bot
+    while len(bot.bot_pool) > existing:
+        bot.remove_bot(len(bot.bot_pool) - 1)
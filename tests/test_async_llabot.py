@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from llabot.async_llabot import AsyncLLaBot
+from llabot.chat_log import compact_chat_log
+from llabot.llm_model import LLMModel
+
+def roles(llabot, bot_num: int) -> list[str]:
+    return [message.sender_role for message in llabot.bot_pool[bot_num].llm_chat.messages]
+
+async def start(async_bot: AsyncLLaBot, user_data) -> int:
+    bot_num = await async_bot.add_bot(model_type=LLMModel.SMALL)
+    await async_bot.start_chat(bot_num, user_data)
+    return bot_num
+
+def test_generate_records_the_reply(llabot, user_data):
+    async def run():
+        async_bot = AsyncLLaBot(llabot)
+        bot_num = await start(async_bot, user_data)
+        reply = await async_bot.generate_response(bot_num, "hello there")
+        return bot_num, reply
+
+    bot_num, reply = asyncio.run(run())
+    assert isinstance(reply, str)
+    assert roles(llabot, bot_num)[-2:] == ["user", "assistant"]
+
+def test_cancelled_generation_leaves_the_history_as_it_was(llabot, user_data):
+    async def run():
+        async_bot = AsyncLLaBot(llabot)
+        bot_num = await start(async_bot, user_data)
+        before = roles(llabot, bot_num)
+        task = asyncio.create_task(async_bot.generate_response(bot_num, "tell me about your day"))
+        await asyncio.sleep(0.2)
+        assert not task.done()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return bot_num, before
+
+    # asyncio.run waits for the worker thread, which stops at the next token once cancelled
+    bot_num, before = asyncio.run(run())
+    assert roles(llabot, bot_num) == before == ["system"]
+    # The next turn is answered as if the cancelled one never happened
+    llabot.generate_response(bot_num, "hello")
+    assert roles(llabot, bot_num) == ["system", "user", "assistant"]
+    chat = llabot.bot_pool[bot_num].llm_chat
+    chat.chat_log.flush()
+    logged = compact_chat_log(chat.chat_log_file)["messages"]
+    assert [message["sender_role"] for message in logged] == ["system", "user", "assistant"]
+    assert logged[1]["message"] == "hello"
+
+def test_cancelled_stream_leaves_the_history_as_it_was(llabot, user_data):
+    async def run():
+        async_bot = AsyncLLaBot(llabot)
+        bot_num = await start(async_bot, user_data)
+        stream = async_bot.stream_response(bot_num, "how are you")
+        # The random model rarely ends a sentence, so cancel while waiting for the first chunk
+        task = asyncio.create_task(anext(stream))
+        await asyncio.sleep(0.2)
+        assert not task.done()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return bot_num
+
+    bot_num = asyncio.run(run())
+    assert roles(llabot, bot_num) == ["system"]
+
+def test_concurrency_is_limited_per_model(llabot, user_data):
+    async def run():
+        async_bot = AsyncLLaBot(llabot, max_concurrency_per_model=1)
+        first, second = await start(async_bot, user_data), await start(async_bot, user_data)
+        limit = async_bot._limit(first)
+        assert limit is async_bot._limit(second)
+        async with limit:
+            task = asyncio.create_task(async_bot.generate_response(second, "hi"))
+            await asyncio.sleep(0.2)
+            assert roles(llabot, second)[-1] != "user"  # Still waiting for the model's slot
+        await task
+        return second
+
+    second = asyncio.run(run())
+    assert roles(llabot, second)[-2:] == ["user", "assistant"]
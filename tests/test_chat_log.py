@@ -0,0 +1,28 @@
+import gc
+from llabot.chat_log import ChatLogWriter, compact_chat_log, read_chat_log
+
+def test_buffered_lines_reach_disk_on_flush_and_close(tmp_path):
+    writer = ChatLogWriter.create(str(tmp_path), "chat", "0123456789abcdef")
+    writer.write("chat_started", chat_id="abc", start_time="now")
+    writer.write("message_added", index=0, message="hello")
+    writer.flush()
+    assert [r["event"] for r in read_chat_log(writer.path)] == ["chat_started", "message_added"]
+    writer.write("message_added", index=1, message="again")
+    writer.close()
+    assert writer.closed
+    assert [m["message"] for m in compact_chat_log(writer.path)["messages"]] == ["hello", "again"]
+
+def test_collected_writer_writes_out_its_buffer(tmp_path):
+    writer = ChatLogWriter(str(tmp_path / "dropped.jsonl"))
+    path = writer.path
+    writer.write("message_added", index=0, message="not flushed yet")
+    del writer
+    gc.collect()
+    assert read_chat_log(path) == [{"event": "message_added", "index": 0, "message": "not flushed yet"}]
+
+def test_unique_names_do_not_clobber(tmp_path):
+    first = ChatLogWriter.create(str(tmp_path), "chat", "0123456789abcdef")
+    second = ChatLogWriter.create(str(tmp_path), "chat", "0123456789abcdef")
+    assert first.path != second.path
+    first.close()
+    second.close()
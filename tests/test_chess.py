@@ -0,0 +1,102 @@
+import chess
+import pytest
+from llabot.chess.chess import ChessLLM
+
+@pytest.fixture
+def game(tiny_models):
+    game = ChessLLM("hard")
+    yield game
+    game.close()
+
+def test_ai_moves_are_legal_and_take_one_generate_call(game):
+    game.engine.book_enabled = False
+    try:
+        for _ in range(6):
+            board = game.board.copy()
+            move = game.play_llama()
+            assert chess.Move.from_uci(move) in board.legal_moves
+            assert game.get_move_history()[-1] == move
+        assert game.generate_calls == 6
+    finally:
+        game.engine.book_enabled = True
+
+def test_illegal_player_moves_are_refused(game):
+    assert not game.submit_player_move("e2e5")
+    assert not game.submit_player_move("nonsense")
+    assert game.submit_player_move("e2e4")
+    assert game.get_move_history() == ["e2e4"]
+
+def test_log_file_is_deprecated(tiny_models):
+    with pytest.warns(DeprecationWarning):
+        game = ChessLLM(log_file="chess.log")
+    game.close()
+
+@pytest.fixture
+def engine(tiny_models):
+    from llabot.chess.engine import ChessEngine
+    from llabot.chess.opening_book import OpeningBook
+    engine = ChessEngine()
+    book_enabled, max_wait, book = engine.book_enabled, engine.max_wait, engine.opening_book
+    engine.book_enabled, engine.max_wait, engine.opening_book = False, 0.2, OpeningBook()
+    games = []
+    yield engine, games
+    engine.book_enabled, engine.max_wait, engine.opening_book = book_enabled, max_wait, book
+    for game in games:
+        engine.end_game(game.game_id)
+
+def test_moves_of_concurrent_games_are_generated_in_one_batch(engine):
+    engine, games = engine
+    games.extend(engine.new_game("hard") for _ in range(4))
+    for game in games:
+        game.submit_player_move("e2e4")
+    before = engine.stats()
+    futures = [engine.request_move(game.game_id) for game in games]
+    moves = [future.result(30) for future in futures]
+    after = engine.stats()
+    assert after["moves"] - before["moves"] == 4
+    assert after["batches"] - before["batches"] == 1
+    for game, move in zip(games, moves):
+        assert game.moves_uci == ["e2e4", move]
+        assert game.board.is_valid() and game.pending is None
+
+def test_games_with_a_move_in_progress_refuse_more_requests(engine):
+    engine, games = engine
+    games.append(engine.new_game())
+    future = engine.request_move(games[0].game_id)
+    with pytest.raises(RuntimeError):
+        engine.request_move(games[0].game_id)
+    with pytest.raises(RuntimeError):
+        engine.undo_move(games[0].game_id)
+    assert not games[0].submit_player_move("e7e5")
+    future.result(30)
+
+def test_undo_and_reset_restore_the_board(engine):
+    engine, games = engine
+    game = engine.new_game()
+    games.append(game)
+    game.submit_player_move("d2d4")
+    move = engine.play_move(game.game_id)
+    assert engine.undo_move(game.game_id) == move
+    assert game.moves_uci == ["d2d4"]
+    engine.play_move(game.game_id)  # Generated again from the cropped cache
+    assert len(game.moves_uci) == 2
+    engine.reset_game(game.game_id)
+    assert game.moves_uci == [] and game.board == chess.Board()
+    with pytest.raises(ValueError):
+        engine.game("no-such-game")
+
+def test_book_positions_are_sampled_and_misses_generated(engine):
+    engine, games = engine
+    game = engine.new_game("hard")
+    games.append(game)
+    engine.book_enabled = True
+    engine.opening_book.store([], {"g1f3": 0.0, "e2e4": -20.0})
+    engine.opening_book.store(["g1f3", "d7d5"], {"b1c3": 0.0})
+    calls = game.generate_calls
+    assert engine.play_move(game.game_id) == "g1f3"
+    game.submit_player_move("d7d5")
+    assert engine.play_move(game.game_id) == "b1c3"
+    assert game.generate_calls == calls
+    game.submit_player_move("g8f6")
+    engine.play_move(game.game_id)  # Not in the book, so generated
+    assert game.generate_calls == calls + 1
@@ -0,0 +1,77 @@
+import json
+import os
+import pytest
+from llabot.config_store import ConfigStore
+from llabot.persona_data import PersonaData
+from llabot.scene_data import SceneData
+from llabot.user_data import UserData
+
+@pytest.fixture
+def store():
+    store = ConfigStore()
+    store.clear()
+    yield store
+    store.clear()
+
+def write_json(path, data) -> None:
+    with open(path, "w") as file:
+        json.dump(data, file)
+
+def test_files_are_parsed_again_only_when_they_change(store, tmp_path):
+    path = tmp_path / "preset.json"
+    write_json(path, {"temperature": 0.7})
+    parses = store.parses
+    first = store.load_json(str(path))
+    assert store.load_json(str(path)) is first
+    assert store.parses == parses + 1
+
+    write_json(path, {"temperature": 0.85})
+    stamp = ConfigStore.version(str(path))
+    os.utime(path, ns=(stamp[0] + 1_000_000, stamp[0] + 1_000_000))
+    assert store.load_json(str(path)) == {"temperature": 0.85}
+    assert store.parses == parses + 2
+
+    store.clear(str(path))
+    store.load_json(str(path))
+    assert store.parses == parses + 3
+
+def test_fragments_render_once_per_version_and_stay_bounded(store, monkeypatch):
+    renders = []
+    render = lambda: renders.append(1) or f"text {len(renders)}"
+    assert store.fragment("key", 1, render) == "text 1"
+    assert store.fragment("key", 1, render) == "text 1"
+    assert store.fragment("key", 2, render) == "text 2"
+    monkeypatch.setattr(store, "max_fragments", 3)
+    for i in range(5):
+        store.fragment(("other", i), None, lambda: "x")
+    assert store.stats()["fragments"] == 3
+
+def test_persona_string_is_shared_until_a_field_is_edited(store):
+    persona = PersonaData("generic")
+    assert not persona.edited
+    text = persona.to_llm_string()
+    assert PersonaData("generic").to_llm_string() is text  # Served from the shared fragment
+    persona.name = "Somebody Else"
+    assert persona.edited
+    assert "Name: Somebody Else" in persona.to_llm_string()
+    persona.skills = {"juggling": "expert"}
+    assert "Juggling: expert" in persona.to_llm_string()
+    assert PersonaData("generic").to_llm_string() == text
+    assert not persona.reload_if_changed()  # The file itself is unchanged
+
+def test_persona_from_dict_round_trips(store):
+    persona = PersonaData("generic")
+    copy = PersonaData.from_dict(persona.to_dict())
+    assert copy.to_llm_string() == persona.to_llm_string()
+
+def test_user_and_scene_strings_follow_their_fields(store):
+    user = UserData("Ann", "2000-01-01", "female", "unspecified", 1, 2)
+    assert "Details: N/A" in user.to_llm_string()
+    user.details = "Likes tea."
+    assert "Details: Likes tea." in user.to_llm_string()
+    scene = SceneData("a cafe", ["Ann"], "friends", "light")
+    text = scene.to_llm_string()
+    scene.tone = "tense"
+    assert scene.to_llm_string() != text and "Tone: tense" in scene.to_llm_string()
+    assert "Characters: None" in SceneData("a cafe", None, "friends", "light").to_llm_string()
+    assert "Characters: []" in SceneData("a cafe", [], "friends", "light").to_llm_string()
@@ -0,0 +1,79 @@
+import pytest
+from llabot.context_window import ContextWindow
+from llabot.llm_model import LLMModel
+from llabot.message_data import MessageData
+from llabot.tokenizer_cache import count_message_tokens
+
+TOKENIZER = LLMModel.SMALL.value
+
+@pytest.fixture(autouse=True)
+def tokenizers(tiny_models):
+    return tiny_models
+
+def chat(turns: int) -> list[MessageData]:
+    messages = [MessageData("System", "system", "You are a friend.")]
+    for i in range(turns):
+        messages.append(MessageData("Ann", "user", f"hello there number {i}, how are you today?"))
+        messages.append(MessageData("Bot", "assistant", f"I am fine, thanks for asking {i} times."))
+    return messages
+
+def test_short_chat_is_sent_whole():
+    messages = chat(2)
+    window = ContextWindow(TOKENIZER, budget=10_000)
+    history = window.build(messages)
+    assert history == [m.llm_view for m in messages]
+    assert window.last_content_tokens == sum(count_message_tokens(TOKENIZER, messages))
+
+def test_overflow_drops_oldest_turns_down_to_low_water_and_folds_them():
+    messages = chat(20)
+    per_message = max(count_message_tokens(TOKENIZER, messages[1:]))
+    budget = 10 * per_message
+    window = ContextWindow(TOKENIZER, budget=budget, keep_recent=4)
+    history = window.build(messages)
+    assert window.start > 1
+    assert history[1:] == [m.llm_view for m in messages[window.start:]]
+    assert window.last_content_tokens <= budget * window.low_water
+    dropped = messages[window.start - 1]
+    assert f"{dropped.sender_name}: {dropped.message}" in history[0]["content"]
+    assert window._recap_tokens <= min(window.recap_budget, budget // 8)
+
+def test_window_slides_in_steps_and_keeps_recent_turns():
+    messages = chat(20)
+    window = ContextWindow(TOKENIZER, budget=10 * max(count_message_tokens(TOKENIZER, messages[1:])), keep_recent=4)
+    window.build(messages)
+    start = window.start
+    messages.append(MessageData("Ann", "user", "one more"))
+    window.build(messages)
+    assert window.start == start  # Back under low water, so one short message does not move the window
+    tiny = ContextWindow(TOKENIZER, budget=1, keep_recent=4)
+    assert len(tiny.build(messages)) == 1 + 4
+
+def test_drop_overflow_keeps_no_recap():
+    messages = chat(20)
+    window = ContextWindow(TOKENIZER, budget=200, overflow="drop")
+    history = window.build(messages)
+    assert window.start > 1
+    assert history[0]["content"] == messages[0].message
+
+def test_rewritten_messages_are_recounted():
+    messages = chat(3)
+    window = ContextWindow(TOKENIZER, budget=10_000)
+    window.build(messages)
+    before = window.last_content_tokens
+    messages[1].message = "short"
+    window.on_rewrite(1)
+    window.build(messages)
+    assert window.last_content_tokens == sum(count_message_tokens(TOKENIZER, messages))
+    assert window.last_content_tokens < before
+
+def test_content_sizes_are_kept_for_a_bounded_number_of_turns(monkeypatch):
+    monkeypatch.setattr(ContextWindow, "content_history", 3)
+    messages = chat(1)
+    window = ContextWindow(TOKENIZER, budget=10_000)
+    for _ in range(10):
+        window.build(messages)
+    assert len(window.content_tokens) == 3
+
+def test_unknown_overflow_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        ContextWindow(TOKENIZER, budget=100, overflow="summarize")
@@ -0,0 +1,19 @@
+import os
+import pytest
+from benchmarks.import_time import BUDGET, STATEMENTS, measure
+
+@pytest.fixture(autouse=True)
+def source_path(monkeypatch):
+    # measure() runs each statement in a fresh interpreter, which must find llabot too
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [src, os.environ.get("PYTHONPATH")])))
+
+@pytest.mark.parametrize("statement", STATEMENTS)
+def test_entry_points_import_no_heavy_dependencies(statement):
+    result = measure(statement, repeat=1)
+    assert result["heavy_modules"] == []
+
+def test_import_llabot_is_within_budget():
+    result = measure("import llabot", repeat=3)
+    assert result["heavy_modules"] == []
+    assert result["seconds"] <= BUDGET
@@ -0,0 +1,125 @@
+import logging
+import pytest
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
+from llabot.generation import generate_with_cache
+from llabot.kv_cache import ChatKVCache, KVCacheManager, crop_cache
+
+@pytest.fixture(scope="module")
+def chat_model(tiny_models):
+    model = AutoModelForCausalLM.from_pretrained(tiny_models["chat"], dtype=torch.float32)
+    return model.eval(), AutoTokenizer.from_pretrained(tiny_models["chat"])
+
+@pytest.fixture
+def transformers_warnings():
+    """Collects the warnings transformers logs, which do not propagate to the root logger."""
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger("transformers")
+    logger.addHandler(handler)
+    yield records
+    logger.removeHandler(handler)
+
+def prefilled(model, length: int) -> tuple[DynamicCache, torch.Tensor]:
+    input_ids = torch.arange(3, 3 + length).unsqueeze(0)
+    cache = DynamicCache()
+    with torch.no_grad():
+        model(input_ids=input_ids, past_key_values=cache)
+    return cache, input_ids
+
+def test_crop_keeps_the_prefix_without_deprecation_warnings(chat_model, transformers_warnings):
+    model, _ = chat_model
+    cache, _ = prefilled(model, 10)
+    keys = cache.layers[0].keys.clone()
+    crop_cache(cache, 6)
+    assert cache.get_seq_length() == 6
+    assert torch.equal(cache.layers[0].keys, keys[..., :6, :])
+    crop_cache(cache, 8)  # Longer than the cache: nothing to do
+    assert cache.get_seq_length() == 6
+    assert not [r for r in transformers_warnings if "crop" in r.getMessage()]
+
+def test_cropped_cache_continues_like_a_fresh_prefill(chat_model):
+    model, _ = chat_model
+    cache, input_ids = prefilled(model, 10)
+    crop_cache(cache, 6)
+    fresh, _ = prefilled(model, 6)
+    with torch.no_grad():
+        reused = model(input_ids=input_ids[:, 6:7], past_key_values=cache).logits
+        expected = model(input_ids=input_ids[:, 6:7], past_key_values=fresh).logits
+    assert torch.allclose(reused, expected, atol=1e-5)
+
+@pytest.mark.parametrize("num_beams", [1, 2])
+def test_second_turn_reuses_the_first_and_matches_uncached_output(chat_model, num_beams):
+    model, tokenizer = chat_model
+    kwargs = dict(max_new_tokens=8, do_sample=False, num_beams=num_beams)
+    chat_cache = ChatKVCache()
+    history = [{"role": "system", "content": "hello there."}, {"role": "user", "content": "how are you today?"}]
+    first = generate_with_cache(model, tokenizer, chat_cache, history, **kwargs)
+    assert chat_cache.reused_tokens == 0
+    history += [{"role": "assistant", "content": first}, {"role": "user", "content": "tell me about your day"}]
+    second = generate_with_cache(model, tokenizer, chat_cache, history, **kwargs)
+    assert chat_cache.reused_tokens >= chat_cache.checkpoints[2]
+    assert second == generate_with_cache(model, tokenizer, ChatKVCache(), history, **kwargs)
+
+def test_invalidate_drops_tokens_from_the_rewritten_message(chat_model):
+    model, tokenizer = chat_model
+    chat_cache = ChatKVCache()
+    history = [{"role": "system", "content": "hello there."}, {"role": "user", "content": "how are you today?"}]
+    generate_with_cache(model, tokenizer, chat_cache, history, max_new_tokens=4, do_sample=False)
+    history += [{"role": "assistant", "content": "fine."}, {"role": "user", "content": "good"}]
+    generate_with_cache(model, tokenizer, chat_cache, history, max_new_tokens=4, do_sample=False)
+    chat_cache.invalidate_from(2)
+    assert len(chat_cache.token_ids) == chat_cache.checkpoints[2]
+    assert chat_cache.cache.get_seq_length() == chat_cache.checkpoints[2]
+    chat_cache.invalidate_from(0)
+    assert chat_cache.token_ids == [] and chat_cache.cache.get_seq_length() == 0
+
+def test_manager_evicts_idle_caches_over_budget(chat_model, monkeypatch):
+    model, _ = chat_model
+    manager = KVCacheManager()
+    monkeypatch.setattr(manager, "max_bytes", 0)
+    evictions = manager.evictions
+    with manager.checkout("test-busy", model) as busy:
+        busy.token_ids = [1, 2, 3]
+        with manager.checkout("test-idle", model) as idle:
+            idle.token_ids = [1, 2, 3]
+        # Only the idle cache can go; the one still generating is kept
+        assert manager.evictions == evictions + 1
+    assert manager.evictions == evictions + 2
+    assert "test-busy" not in manager._caches and "test-idle" not in manager._caches
+
+def test_edits_after_the_window_slides_invalidate_by_chat_index(chat_model, tiny_models):
+    from llabot.context_window import ContextWindow
+    from llabot.llm_chat import LLMChat
+    from llabot.llm_model import LLMModel
+    from llabot.message_data import MessageData
+    model, tokenizer = chat_model
+    chat = LLMChat()
+    chat.chat_start()
+    chat.set_context_window(ContextWindow(LLMModel.SMALL.value, budget=60, keep_recent=2))
+    chat_cache = ChatKVCache()
+    chat.rewrite_listeners.append(chat_cache.invalidate_from)
+    chat.add_message(MessageData("System", "system", "You are a friend."))
+    try:
+        for i in range(8):
+            chat.add_message(MessageData("Ann", "user", f"hello there number {i}, how are you today?"))
+            generate_with_cache(model, tokenizer, chat_cache, chat.build_prompt(), max_new_tokens=2, do_sample=False,
+                                message_count=len(chat.messages))
+            chat.add_message(MessageData("Bot", "assistant", f"I am fine, thanks {i}."))
+        window = chat.context_window
+        assert window.start > 1  # Older turns were windowed out
+        count = len(chat.messages) - 1  # The last prompt covered every message but the final reply
+        assert max(chat_cache.checkpoints) == count
+        # Rewrite the last user message: its checkpoint index is its index in chat.messages
+        chat._update_message_history([{"index": count - 1, "summary_text": "changed"}])
+        assert all(kept <= count - 1 for kept in chat_cache.checkpoints)
+        assert len(chat_cache.token_ids) <= chat_cache.checkpoints.get(count - 1, len(chat_cache.token_ids))
+        history = chat.build_prompt()
+        expected = tokenizer.apply_chat_template(history, add_generation_prompt=True, tokenize=True, return_dict=False)
+        assert chat_cache.token_ids == expected[:len(chat_cache.token_ids)]
+        reply = generate_with_cache(model, tokenizer, chat_cache, history, max_new_tokens=4, do_sample=False,
+                                    message_count=len(chat.messages))
+        assert reply == generate_with_cache(model, tokenizer, ChatKVCache(), history, max_new_tokens=4, do_sample=False)
+    finally:
+        chat.chat_end()
@@ -0,0 +1,86 @@
+import threading
+import pytest
+from llabot.chat_log import read_chat_log
+from llabot.llm_chat import LLMChat
+from llabot.message_data import MessageData
+from llabot.summarization_service import SummarizationService
+from llabot.summarizer import SUMMARIZERS, BaseSummarizer
+
+LONG = " ".join(f"Sentence number {i} goes on about the weather." for i in range(40))
+
+class GatedSummarizer(BaseSummarizer):
+    """Summarizes only once the test opens the gate, so a job can be caught while it runs."""
+    gate = threading.Event()
+
+    @classmethod
+    def text_lengths(cls, texts):
+        return [len(text.split()) for text in texts]
+
+    @classmethod
+    def message_lengths(cls, messages):
+        return cls.text_lengths([message.message for message in messages])
+
+    def summarize_texts(self, texts, batch_size):
+        GatedSummarizer.gate.wait(5)
+        return [f"summary of {len(text.split())} words" for text in texts]
+
+@pytest.fixture
+def chat(monkeypatch):
+    monkeypatch.setitem(SUMMARIZERS, "gated", GatedSummarizer)
+    GatedSummarizer.gate.clear()
+    chat = LLMChat()
+    chat.summarizer_name = "gated"
+    chat.chat_start()
+    chat.add_message(MessageData("System", "system", "You are a friend."))
+    yield chat
+    GatedSummarizer.gate.set()
+    chat.chat_end()
+    SummarizationService().unload()
+
+def fill(chat: LLMChat, count: int, text: str = LONG) -> None:
+    for i in range(count):
+        chat.add_message(MessageData("Ann" if i % 2 else "Bot", "user" if i % 2 else "assistant", text))
+
+def test_summarization_runs_in_the_background(chat):
+    fill(chat, chat.summarize_interval + chat.recent_skip)
+    chat.check_and_summarize()
+    assert chat.summarization_pending  # Returned without waiting for the summarizer
+    chat.check_and_summarize()         # A second call while one is pending queues nothing
+    GatedSummarizer.gate.set()
+    chat.wait_for_summarization(5)
+    assert not chat.summarization_pending
+    summarized = [m.message for m in chat.messages[1:-chat.recent_skip]]
+    assert summarized and all(text.startswith("summary of") for text in summarized)
+    assert all(m.message == LONG for m in chat.messages[-chat.recent_skip:])
+
+def test_messages_changed_while_summarizing_are_kept(chat):
+    fill(chat, chat.summarize_interval + chat.recent_skip)
+    chat.check_and_summarize()
+    chat.messages[1].message = "Edited while the job ran."
+    GatedSummarizer.gate.set()
+    chat.wait_for_summarization(5)
+    assert chat.messages[1].message == "Edited while the job ran."
+    assert chat.messages[2].message.startswith("summary of")
+
+def test_short_messages_and_too_few_new_ones_are_left_alone(chat):
+    fill(chat, chat.summarize_interval - 1)
+    chat.check_and_summarize()
+    assert not chat.summarization_pending
+    assert chat.summarize_index == 1
+    chat.messages[1:] = []
+    fill(chat, chat.summarize_interval + chat.recent_skip, "short one.")
+    chat.check_and_summarize()
+    assert not chat.summarization_pending
+    assert chat.summarize_index == len(chat.messages) - chat.recent_skip
+
+def test_summaries_are_logged_and_rewrite_listeners_told(chat):
+    rewritten = []
+    chat.rewrite_listeners.append(rewritten.append)
+    fill(chat, chat.summarize_interval + chat.recent_skip)
+    chat.check_and_summarize()
+    GatedSummarizer.gate.set()
+    chat.wait_for_summarization(5)
+    assert rewritten == [1]
+    chat.chat_log.flush()
+    updates = [r for r in read_chat_log(chat.chat_log_file) if r["event"] == "message_updated"]
+    assert [r["message_number"] for r in updates] == list(range(1, len(chat.messages) - chat.recent_skip))
@@ -0,0 +1,25 @@
+from llabot.message_data import MessageData
+
+def test_token_count_is_kept_for_the_last_tokenizer_and_reset_by_edits():
+    message = MessageData("Ann", "user", "hello there")
+    assert message.cached_token_count("model") is None
+    message.set_token_count("model", 3)
+    assert message.cached_token_count("model") == 3
+    message.set_token_count("summarizer", 4)
+    assert message.cached_token_count("model") is None and message.cached_token_count("summarizer") == 4
+    message.message = "something else entirely"
+    assert message.cached_token_count("summarizer") is None
+
+def test_llm_view_follows_edits():
+    message = MessageData("Ann", "user", "hello")
+    assert message.llm_view == {"role": "user", "content": "hello"}
+    message.message, message.sender_role = "bye", "assistant"
+    assert message.llm_view == {"role": "assistant", "content": "bye"}
+
+def test_dict_round_trip_keeps_id_and_metadata():
+    message = MessageData("Ann", "user", "hello")
+    message.add_metadata("mood", "cheerful")
+    copy = MessageData.from_dict(message.to_dict())
+    assert copy == message
+    assert copy.to_dict() == message.to_dict()
+    assert not hasattr(message, "__dict__")
@@ -0,0 +1,98 @@
+import threading
+import pytest
+from llabot.llm_model import LLMModel
+from llabot.model_registry import ModelRegistry
+
+@pytest.fixture
+def registry(tiny_models):
+    registry = ModelRegistry()
+    max_warm_models = registry.max_warm_models
+    registry.clear()
+    yield registry
+    registry.configure(max_warm_models=max_warm_models)
+    registry.clear()
+
+def test_handles_share_one_pipeline_and_count_references(registry):
+    misses = registry.misses
+    first = registry.acquire(LLMModel.LARGE)
+    second = registry.acquire(LLMModel.LARGE)
+    assert first.pipe is second.pipe
+    assert registry.misses == misses + 1
+    assert registry.stats()["handles"] == 2
+
+    first.release()
+    first.release()  # Releasing twice must not drop the other handle's reference
+    assert registry.stats()["handles"] == 1
+    assert registry.stats()["active_models"] == 1
+    second.release()
+    assert registry.stats()["active_models"] == 0
+    assert registry.stats()["warm_models"] == 1
+    with pytest.raises(RuntimeError):
+        first.pipe
+
+def test_released_model_stays_warm_until_evicted(registry):
+    registry.configure(max_warm_models=1)
+    handle = registry.acquire(LLMModel.LARGE)
+    pipe = handle.pipe
+    handle.release()
+    hits = registry.hits
+    with registry.acquire(LLMModel.LARGE) as again:
+        assert again.pipe is pipe
+    assert registry.hits == hits + 1
+
+    registry.configure(max_warm_models=0)
+    assert registry.stats()["loaded_models"] == 0
+    misses = registry.misses
+    registry.acquire(LLMModel.LARGE).release()
+    assert registry.misses == misses + 1
+
+def test_concurrent_acquires_load_once(registry):
+    misses = registry.misses
+    handles, barrier = [], threading.Barrier(4)
+
+    def acquire():
+        barrier.wait()
+        handles.append(registry.acquire(LLMModel.ROLEPLAY))
+
+    threads = [threading.Thread(target=acquire) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert registry.misses == misses + 1
+    assert len({id(handle.pipe) for handle in handles}) == 1
+    assert registry.stats()["handles"] == 4
+    for handle in handles:
+        handle.release()
+
+def test_profiles_are_loaded_separately(registry):
+    with registry.acquire(LLMModel.LARGE) as default, registry.acquire(LLMModel.LARGE, "cpu-fp32") as fp32:
+        assert default.key == (LLMModel.LARGE, "default")
+        assert fp32.key == (LLMModel.LARGE, "cpu-fp32")
+        assert default.pipe is not fp32.pipe
+
+def test_chat_start_loads_only_the_presets_profile(registry, llabot, user_data, monkeypatch):
+    from llabot.llm_preset import LLMPreset
+    monkeypatch.setattr(LLMPreset, "load_from_json", classmethod(lambda cls, name: cls(inference_profile="cpu-fp32")))
+    misses = registry.misses
+    llabot.add_bot(model_type=LLMModel.SMALL)
+    bot_num = len(llabot.bot_pool) - 1
+    llabot.start_chat(bot_num, user_data)
+    assert llabot.bot_pool[bot_num].model_handle.key == (LLMModel.SMALL, "cpu-fp32")
+    assert registry.misses == misses + 1
+    assert [model["profile"] for model in registry.stats()["models"]] == ["cpu-fp32"]
+
+def test_only_lone_turns_feed_the_models_tokens_per_second(registry, llabot, user_data):
+    llabot.add_bot(model_type=LLMModel.SMALL)
+    bot_num = len(llabot.bot_pool) - 1
+    llabot.start_chat(bot_num, user_data)
+    bot = llabot.bot_pool[bot_num]
+    llabot.generate_response(bot_num, "hello")  # Alone, so it runs through the solo path
+    assert not bot.last_turn_batched
+    entry = bot.model_handle._entry
+    tokens, seconds = entry.generated_tokens, entry.generation_seconds
+    assert tokens > 0
+    bot.last_turn_batched = True
+    bot._record_throughput("a batched reply", 0.5)
+    assert (entry.generated_tokens, entry.generation_seconds) == (tokens, seconds)
+    assert bot.last_tokens_per_second is not None
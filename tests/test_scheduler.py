@@ -0,0 +1,85 @@
+import threading
+import time
+import pytest
+from llabot.generation import GenerationCancelled
+from llabot.scheduler import BatchScheduler
+
+MODEL = ("model", "default")
+
+class FakePipe:
+    """Stands in for a text-generation pipeline, recording the batches it is called with."""
+    def __init__(self):
+        self.batches: list[list] = []
+
+    def __call__(self, histories, batch_size, stopping_criteria, **kwargs):
+        self.batches.append(histories)
+        return [[{"generated_text": history + [{"role": "assistant", "content": f"batched {history[-1]['content']}"}]}]
+                for history in histories]
+
+def history(text: str) -> list[dict[str, str]]:
+    return [{"role": "user", "content": text}]
+
+@pytest.fixture
+def scheduler():
+    scheduler = BatchScheduler(max_batch_size=8, max_wait=5.0)
+    yield scheduler
+    scheduler.shutdown()
+
+def test_lone_turn_runs_solo_without_waiting(scheduler):
+    pipe = FakePipe()
+    start = time.monotonic()
+    reply = scheduler.submit(MODEL, pipe, history("hi"), {"max_new_tokens": 4}, solo=lambda: "solo").result(timeout=1)
+    assert reply == "solo"
+    assert time.monotonic() - start < 1
+    assert pipe.batches == []
+
+def test_turns_queued_behind_a_busy_model_run_as_one_batch(scheduler):
+    pipe, release = FakePipe(), threading.Event()
+
+    def blocking_solo():
+        release.wait()
+        return "first"
+
+    first = scheduler.submit(MODEL, pipe, history("a"), {}, solo=blocking_solo)
+    queued = [scheduler.submit(MODEL, pipe, history(text), {}, solo=lambda: "solo") for text in "bcd"]
+    release.set()
+    assert first.result(timeout=5) == "first"
+    assert [future.result(timeout=5) for future in queued] == ["batched b", "batched c", "batched d"]
+    assert pipe.batches == [[history("b"), history("c"), history("d")]]
+    assert scheduler.stats()["batches"] == 2
+
+def test_models_do_not_wait_for_each_other(scheduler):
+    pipe, release = FakePipe(), threading.Event()
+    blocked = scheduler.submit(MODEL, pipe, history("a"), {}, solo=lambda: release.wait() and "first")
+    other = scheduler.submit(("other", "default"), pipe, history("b"), {}, solo=lambda: "other")
+    assert other.result(timeout=1) == "other"
+    release.set()
+    assert blocked.result(timeout=5) == "first"
+
+def test_cancelled_queued_turn_is_dropped(scheduler):
+    pipe, release = FakePipe(), threading.Event()
+    first = scheduler.submit(MODEL, pipe, history("a"), {}, solo=lambda: release.wait() and "first")
+    cancel = threading.Event()
+    queued = scheduler.submit(MODEL, pipe, history("b"), {}, cancel_event=cancel, solo=lambda: "solo")
+    cancel.set()
+    scheduler.configure(max_wait=0.0)  # Wakes the scheduler so it notices the cancellation
+    with pytest.raises(GenerationCancelled):
+        queued.result(timeout=5)
+    release.set()
+    assert first.result(timeout=5) == "first"
+    assert pipe.batches == []
+
+def test_shutdown_fails_queued_turns():
+    scheduler = BatchScheduler(max_wait=5.0)
+    pipe, release = FakePipe(), threading.Event()
+    first = scheduler.submit(MODEL, pipe, history("a"), {}, solo=lambda: release.wait() and "first")
+    queued = scheduler.submit(MODEL, pipe, history("b"), {}, solo=lambda: "solo")
+    stopper = threading.Thread(target=scheduler.shutdown)
+    stopper.start()
+    with pytest.raises(RuntimeError):
+        queued.result(timeout=5)
+    release.set()
+    stopper.join(timeout=5)
+    assert first.result(timeout=5) == "first"
+    with pytest.raises(RuntimeError):
+        scheduler.submit(MODEL, pipe, history("c"), {})
@@ -0,0 +1,29 @@
+import pytest
+from transformers import AutoTokenizer
+import llabot.speculative as speculative
+from llabot.speculative import SpeculativeStats, tokenizers_compatible
+
+@pytest.fixture
+def memo(monkeypatch):
+    memo = {}
+    monkeypatch.setattr(speculative, "_compatible", memo)
+    return memo
+
+def test_compatibility_is_memoized_by_tokenizer_name(tiny_models, memo):
+    chat, again = AutoTokenizer.from_pretrained(tiny_models["chat"]), AutoTokenizer.from_pretrained(tiny_models["chat"])
+    chess = AutoTokenizer.from_pretrained(tiny_models["chess"])
+    assert tokenizers_compatible(chat, again)
+    assert not tokenizers_compatible(chat, chess)
+    assert memo == {(tiny_models["chat"], tiny_models["chat"]): True, (tiny_models["chat"], tiny_models["chess"]): False}
+    # A reloaded tokenizer hits the same entry
+    assert not tokenizers_compatible(AutoTokenizer.from_pretrained(tiny_models["chat"]), chess)
+    assert len(memo) == 2
+
+def test_acceptance_rate_counts_tokens_beyond_the_target_passes():
+    stats = SpeculativeStats()
+    stats.record(tokens=30, target_steps=10, draft_steps=25)
+    stats.record(tokens=10, target_steps=10, draft_steps=5)
+    report = stats.report()
+    assert report["accepted"] == 20 and report["proposed"] == 30
+    assert report["acceptance_rate_approx"] == round(20 / 30, 3)
+    assert report["tokens_per_target_step"] == 2.0
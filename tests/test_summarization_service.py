@@ -0,0 +1,76 @@
+import threading
+import time
+import pytest
+from llabot.summarization_service import SummarizationService
+from llabot.summarizer import SUMMARIZERS, BaseSummarizer
+
+class RecordingSummarizer(BaseSummarizer):
+    """Records every batch it is given; the first batch waits for the gate so others can queue behind it."""
+    batches: list[list[str]] = []
+    gate = threading.Event()
+    loads = 0
+
+    def __init__(self):
+        RecordingSummarizer.loads += 1
+
+    @classmethod
+    def text_lengths(cls, texts):
+        return [len(text) for text in texts]
+
+    def summarize_texts(self, texts, batch_size):
+        RecordingSummarizer.gate.wait(5)
+        RecordingSummarizer.batches.append(list(texts))
+        if "fail" in texts:
+            raise RuntimeError("summarizer broke")
+        return [text.upper() for text in texts]
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setitem(SUMMARIZERS, "recording", RecordingSummarizer)
+    RecordingSummarizer.batches, RecordingSummarizer.loads = [], 0
+    RecordingSummarizer.gate.clear()
+    service = SummarizationService()
+    service.unload()
+    max_batch_size, idle_unload = service.max_batch_size, service.idle_unload
+    yield service
+    RecordingSummarizer.gate.set()
+    service.configure(max_batch_size=max_batch_size, idle_unload=idle_unload)
+    service.unload()
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_jobs_from_many_chats_share_length_sorted_batches(service):
+    service.configure(max_batch_size=3)
+    blocker = service.submit(["first"], strategy="recording")
+    wait_until(lambda: service.stats()["queued"] == 0)  # The worker is now held in the first batch
+    jobs = [service.submit(texts, strategy="recording") for texts in (["cccc", "a"], ["bbb", "dddddd"], ["ee"])]
+    RecordingSummarizer.gate.set()
+    assert blocker.result(5) == ["FIRST"]
+    assert [job.result(5) for job in jobs] == [["CCCC", "A"], ["BBB", "DDDDDD"], ["EE"]]
+    assert RecordingSummarizer.batches[1:] == [["a", "ee", "bbb"], ["cccc", "dddddd"]]
+    assert RecordingSummarizer.loads == 1
+
+def test_failed_batch_fails_only_its_jobs(service):
+    service.configure(max_batch_size=1)
+    RecordingSummarizer.gate.set()
+    failing = service.submit(["fail"], strategy="recording")
+    fine = service.submit(["fine"], strategy="recording")
+    with pytest.raises(RuntimeError):
+        failing.result(5)
+    assert fine.result(5) == ["FINE"]
+
+def test_empty_job_resolves_at_once(service):
+    assert service.submit([], strategy="recording").result(0) == []
+
+def test_idle_summarizers_are_unloaded_and_reloaded(service):
+    RecordingSummarizer.gate.set()
+    service.submit(["x"], strategy="recording").result(5)
+    assert service.loaded
+    service.configure(idle_unload=0.05)
+    wait_until(lambda: not service.loaded)
+    service.submit(["y"], strategy="recording").result(5)
+    assert RecordingSummarizer.loads == 2
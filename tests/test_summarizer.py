@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import pytest
+import llabot.summarizer as summarizer
+from llabot.summarizer import ExtractiveSummarizer, approximate_tokens, make_summarizer, summarizer_type
+
+TEXT = ("Alice likes tea. Bob likes coffee. Alice and Bob drink tea and coffee every morning at the cafe. "
+        "The cafe is near the park. It rains.")
+
+def test_extractive_summary_keeps_central_sentences_verbatim():
+    summary = ExtractiveSummarizer().summarize_texts([TEXT], 1)[0]
+    sentences = summary.split(". ")
+    assert summary
+    assert all(sentence.rstrip(".") in TEXT for sentence in sentences)
+    assert "Alice and Bob drink tea and coffee every morning at the cafe." in summary
+    assert len(summary.split()) <= len(TEXT.split()) * 0.5 + 1
+
+def test_extractive_summary_respects_max_words_and_short_texts():
+    long_text = " ".join(f"Point {i} is about tea and coffee." for i in range(100))
+    assert len(ExtractiveSummarizer(max_words=20).summarize_texts([long_text], 1)[0].split()) <= 20
+    assert ExtractiveSummarizer().summarize_texts(["Just one sentence."], 1) == ["Just one sentence."]
+
+def test_extractive_lengths_never_touch_a_tokenizer(monkeypatch):
+    def no_tokenizer(*args, **kwargs):
+        raise AssertionError("The extractive strategy must not tokenize.")
+    monkeypatch.setattr(summarizer, "count_tokens", no_tokenizer)
+    monkeypatch.setattr(summarizer, "count_message_tokens", no_tokenizer)
+    assert ExtractiveSummarizer.text_lengths(["one two three", ""]) == [approximate_tokens("one two three"), 0]
+    with pytest.raises(AssertionError):
+        summarizer_type("abstractive").text_lengths(["one two three"])
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        make_summarizer("nonexistent")
+
+def test_extractive_chat_summarizes_without_transformers():
+    # A fresh interpreter, since other tests import transformers into this one
+    script = f"""
+import sys
+from llabot.llm_chat import LLMChat
+from llabot.message_data import MessageData
+chat = LLMChat()
+chat.summarizer_name = "extractive"
+chat.chat_start()
+chat.add_message(MessageData("System", "system", "You are a friend."))
+for i in range(chat.summarize_interval + chat.recent_skip):
+    chat.add_message(MessageData("Ann", "user", {TEXT!r} * 10))
+chat.check_and_summarize()
+chat.wait_for_summarization(30)
+chat.chat_end()
+assert chat.messages[1].message != {TEXT!r} * 10, "nothing was summarized"
+print(sorted(name for name in ("torch", "transformers") if name in sys.modules))
+"""
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env={**os.environ, "PYTHONPATH": src})
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "[]"
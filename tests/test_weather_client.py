@@ -0,0 +1,163 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from llabot.weather import WeatherClient
+
+class StubWeather:
+    """A local stand-in for OpenWeatherMap that counts requests and can be made slow or broken."""
+    def __init__(self):
+        self.requests: list[dict] = []
+        self.delay: float = 0.0
+        self.status: int = 200
+        self.temperature: float = 70.0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append({k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()})
+                time.sleep(stub.delay)
+                body = json.dumps({"main": {"temp": stub.temperature}, "name": "Stubville"}).encode()
+                try:
+                    self.send_response(stub.status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError:
+                    pass  # The client gave up waiting, as the timeout tests intend
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/data/2.5/weather"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub():
+    stub = StubWeather()
+    yield stub
+    stub.close()
+
+@pytest.fixture
+def client(stub):
+    client = WeatherClient()
+    settings = dict(base_url=stub.url, ttl=60.0, refresh_after=50.0, max_stale=600.0, timeout=(1.0, 1.0), wait_timeout=2.0)
+    client.configure(**settings)
+    client.clear()
+    yield client
+    client.clear()
+    for name in settings:
+        vars(client).pop(name, None)  # Back to the class defaults
+
+def delta(before: dict, after: dict) -> dict:
+    return {key: after[key] - before[key] for key in ("hits", "stale_hits", "misses", "coalesced", "fetches", "errors")}
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_fresh_entries_are_served_from_the_cache(client, stub):
+    before = client.stats()
+    first = client.get("key", 40.7128, -74.0060)
+    again = client.get("key", 40.7131, -74.0058)  # Rounds to the same location
+    assert first == again == {"main": {"temp": 70.0}, "name": "Stubville"}
+    assert len(stub.requests) == 1
+    assert stub.requests[0] == {"lat": "40.71", "lon": "-74.01", "appid": "key", "units": "imperial"}
+    assert delta(before, client.stats()) == {"hits": 1, "stale_hits": 0, "misses": 1, "coalesced": 0, "fetches": 1, "errors": 0}
+
+def test_entries_due_for_refresh_are_refreshed_in_the_background(client, stub):
+    client.configure(refresh_after=0.05)
+    client.get("key", 1, 2)
+    time.sleep(0.1)
+    stub.temperature = 50.0
+    assert client.get("key", 1, 2)["main"]["temp"] == 70.0  # Still fresh, served at once
+    wait_until(lambda: len(stub.requests) == 2)
+    wait_until(lambda: client.get("key", 1, 2)["main"]["temp"] == 50.0)
+
+def test_stale_entries_are_served_while_the_upstream_fails(client, stub):
+    client.configure(ttl=0.05, refresh_after=0.05)
+    client.get("key", 1, 2)
+    time.sleep(0.1)
+    stub.status = 500
+    before = client.stats()
+    assert client.get("key", 1, 2)["main"]["temp"] == 70.0
+    wait_until(lambda: client.stats()["errors"] > before["errors"])
+    assert client.get("key", 1, 2)["main"]["temp"] == 70.0
+    changes = delta(before, client.stats())
+    assert changes["stale_hits"] == 2 and changes["errors"] >= 1 and changes["misses"] == 0
+
+def test_entries_past_max_stale_are_not_served(client, stub):
+    client.configure(ttl=0.01, refresh_after=0.01, max_stale=0.05)
+    client.get("key", 1, 2)
+    time.sleep(0.1)
+    stub.status = 500
+    before = client.stats()
+    assert client.get("key", 1, 2) is None
+    assert delta(before, client.stats())["misses"] == 1
+
+def test_concurrent_lookups_share_one_upstream_request(client, stub):
+    stub.delay = 0.3
+    before, results, barrier = client.stats(), [], threading.Barrier(5)
+
+    def lookup():
+        barrier.wait()
+        results.append(client.get("key", 10, 20))
+
+    threads = [threading.Thread(target=lookup) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(stub.requests) == 1
+    assert len(results) == 5 and all(result == results[0] for result in results)
+    changes = delta(before, client.stats())
+    assert changes["misses"] == 5 and changes["coalesced"] == 4 and changes["fetches"] == 1
+
+def test_slow_upstream_does_not_hold_up_the_caller(client, stub):
+    stub.delay = 0.5
+    client.configure(wait_timeout=0.1)
+    start = time.monotonic()
+    assert client.get("key", 3, 4) is None
+    assert time.monotonic() - start < 0.4
+    # The request still completes into the cache
+    wait_until(lambda: client.stats()["fetches"] >= 1 and client.stats()["entries"] == 1)
+    assert client.get("key", 3, 4) is not None
+
+def test_requests_past_the_read_timeout_count_as_errors(client, stub):
+    stub.delay = 0.5
+    client.configure(timeout=(1.0, 0.1), wait_timeout=2.0)
+    before = client.stats()
+    assert client.get("key", 5, 6) is None
+    changes = delta(before, client.stats())
+    assert changes["errors"] == 1 and changes["fetches"] == 0
+    assert client.stats()["in_flight"] == 0
+
+def test_unknown_settings_are_rejected(client):
+    with pytest.raises(ValueError):
+        client.configure(retries=3)
+
+def test_client_that_failed_to_import_requests_is_set_up_again(monkeypatch):
+    monkeypatch.setattr(WeatherClient, "_instance", None)
+    requests = sys.modules["requests"]
+    sys.modules["requests"] = None
+    try:
+        with pytest.raises(ImportError):
+            WeatherClient()
+    finally:
+        sys.modules["requests"] = requests
+    failed = WeatherClient._instance
+    client = WeatherClient()  # The same half-built singleton, set up now that the import works
+    assert client is failed
+    assert client.stats()["hits"] == 0 and client.stats()["misses"] == 0